@@ -7,11 +7,11 @@ Flask Web服务，提供可视化界面配置和管理微信读书阅读机器
 
 import os
 import json
-import threading
 import logging
+import time
 from pathlib import Path
 from datetime import datetime
-from flask import Flask, render_template, jsonify, request
+from flask import Flask, Response, g, render_template, jsonify, request, stream_with_context
 from flask_cors import CORS
 
 # 创建Flask应用
@@ -26,19 +26,30 @@ app.config['JSON_AS_ASCII'] = False
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# 全局变量存储应用状态
+# 全局变量存储应用状态（任务状态由 TaskManager 的任务注册表维护）
 app_state = {
-    'is_running': False,
-    'current_task': None,
     'config': None,
     'logs': [],
     'session_data': {}
 }
 
 # 导入业务逻辑（我们会创建这些模块）
-from services.config_manager import ConfigManager
+from services.config_manager import ConfigManager, load_yaml
+from services.config_schema import ConfigValidationError
 from services.task_manager import TaskManager
+from services.daemon import DaemonSupervisor
+from services.task_registry import TaskAdmissionError
 from services.log_manager import LogManager
+from services.http_client import HttpTransport
+from services.curl_parser import CurlParseError, CurlParserCache
+from services.notification import NotificationDispatcher
+from services.event_bus import EventBus
+from services.log_reader import parse_range_header
+from services.log_index import parse_time_arg
+from services.metrics import API_REQUEST_SECONDS, REGISTRY
+from services.profiler import Profiler, ProfilerBusyError
+from services.stats_export import FORMATS, iter_export
+from services.stats_store import EXPORT_COLUMNS
 
 
 class WebConfigManager:
@@ -47,8 +58,53 @@ class WebConfigManager:
     def __init__(self):
         self.config_file = "config.yaml"
         self.config_manager = ConfigManager(self.config_file)
-        self.log_manager = LogManager()
-        self.task_manager = TaskManager(self.config_manager, self.log_manager)
+        self.event_bus = EventBus()
+        self.log_manager = LogManager(
+            log_file=self.config_manager.get_config_value('logging.file', 'logs/weread.log'),
+            capacity=self.config_manager.get_config_value('logging.buffer_size', 1000),
+            event_bus=self.event_bus,
+            options=self.config_manager.get_config_value('logging', {}) or {}
+        )
+        self.transport = HttpTransport.from_config(
+            self.config_manager.get_config_value('network', {}) or {}
+        )
+        self.curl_cache = CurlParserCache()
+        self.notifier = NotificationDispatcher(self.transport, log_manager=self.log_manager)
+        self.task_manager = TaskManager(
+            self.config_manager, self.log_manager, self.transport, self.curl_cache,
+            self.notifier
+        )
+        self.daemon = DaemonSupervisor(self.task_manager, self.config_manager, self.log_manager)
+        # 守护进程的任务回调就绪后再恢复检查点中的任务，守护进程启动时接管其中的用户
+        if self.config_manager.get_config_value('app.resume_on_restart', True):
+            self.task_manager.resume_from_checkpoints()
+        self.daemon.start()
+        self.profiler = Profiler(self.task_manager.engine.call_soon)
+        self._register_metrics()
+    
+    def _register_metrics(self):
+        """注册采集时计算的瞬时指标"""
+        registry = self.task_manager.registry
+        
+        def active_sessions():
+            counts = {}
+            for handle in registry.active():
+                for session in handle.snapshot['sessions']:
+                    key = (session['status'],)
+                    counts[key] = counts.get(key, 0) + 1
+            return counts
+        
+        REGISTRY.gauge('weread_active_tasks', '运行中（含暂停）的任务数', lambda: len(registry.active()))
+        REGISTRY.gauge('weread_active_sessions', '运行中任务的会话数（按状态）', active_sessions, ('status',))
+        REGISTRY.gauge(
+            'weread_log_queue_depth', '日志写入队列深度',
+            lambda: self.log_manager.get_queue_stats()['queue_depth']
+        )
+        REGISTRY.gauge(
+            'weread_stats_queue_depth', '统计写入队列深度',
+            lambda: self.task_manager.stats.get_stats()['queue_depth']
+        )
+        REGISTRY.gauge('weread_config_version', '当前配置版本号', lambda: self.config_manager.version)
     
     def get_config(self):
         """获取当前配置"""
@@ -58,9 +114,13 @@ class WebConfigManager:
         """保存配置到文件"""
         return self.config_manager.save_config(config_dict)
     
-    def get_logs(self, limit=100):
+    def patch_config(self, partial_config):
+        """部分更新配置"""
+        return self.config_manager.merge_config(partial_config)
+    
+    def get_logs(self, limit=100, since=None):
         """获取日志"""
-        return self.log_manager.get_logs(limit)
+        return self.log_manager.get_logs(limit, since)
     
     def clear_logs(self):
         """清空日志"""
@@ -71,6 +131,31 @@ class WebConfigManager:
 web_config = WebConfigManager()
 
 
+@app.before_request
+def _start_timer():
+    g.request_started = time.perf_counter()
+    # 请求采样关闭时只有一次属性判断
+    if web_config.profiler.request_sample_rate and web_config.profiler.should_sample():
+        g.profile_started = Profiler.request_started()
+
+
+@app.after_request
+def _record_latency(response):
+    """按路由模板记录 API 耗时（不按实际路径，避免标签基数随参数增长）"""
+    started = g.pop('request_started', None)
+    if started is not None:
+        rule = request.url_rule.rule if request.url_rule is not None else '<unmatched>'
+        API_REQUEST_SECONDS.observe(
+            time.perf_counter() - started, (request.method, rule, str(response.status_code))
+        )
+        profile_started = g.pop('profile_started', None)
+        if profile_started is not None:
+            web_config.profiler.request_finished(
+                profile_started, request.method, rule, response.status_code
+            )
+    return response
+
+
 # ==================== 前端路由 ====================
 
 @app.route('/')
@@ -116,6 +201,12 @@ def save_config():
     try:
         config_data = request.get_json()
         result = web_config.save_config(config_data)
+        if not result.get('success'):
+            return jsonify({
+                'success': False,
+                'error': result.get('error'),
+                'errors': result.get('errors', [])
+            }), 400 if 'errors' in result else 500
         return jsonify({
             'success': True,
             'message': '配置保存成功',
@@ -129,12 +220,63 @@ def save_config():
         }), 500
 
 
+@app.route('/api/config', methods=['PATCH'])
+def patch_config():
+    """部分更新配置（JSON Merge Patch：只提交变化的键，值为 null 表示删除）"""
+    try:
+        partial_config = request.get_json()
+        if not isinstance(partial_config, dict):
+            return jsonify({
+                'success': False,
+                'error': '请求体必须是JSON对象'
+            }), 400
+        
+        try:
+            if not web_config.patch_config(partial_config):
+                return jsonify({
+                    'success': False,
+                    'error': '配置更新失败'
+                }), 500
+        except ConfigValidationError as e:
+            return jsonify({
+                'success': False,
+                'error': str(e),
+                'errors': e.errors
+            }), 400
+        
+        # flush=true 时立即写盘，否则在合并窗口结束后写盘
+        if request.args.get('flush', 'false').lower() in ('1', 'true', 'yes'):
+            if not web_config.config_manager.flush():
+                return jsonify({
+                    'success': False,
+                    'error': '配置写入失败'
+                }), 500
+        
+        return jsonify({
+            'success': True,
+            'message': '配置已更新',
+            'version': web_config.config_manager.version
+        })
+    except Exception as e:
+        logger.error(f"更新配置失败: {e}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+
 @app.route('/api/config/validate', methods=['POST'])
 def validate_config():
-    """验证配置"""
+    """验证配置（不写盘），返回全部错误及其路径"""
     try:
         config_data = request.get_json()
-        # 这里可以添加配置验证逻辑
+        errors = web_config.config_manager.validate(config_data)
+        if errors:
+            return jsonify({
+                'success': False,
+                'error': str(ConfigValidationError(errors)),
+                'errors': errors
+            })
         return jsonify({
             'success': True,
             'message': '配置验证通过'
@@ -151,30 +293,24 @@ def validate_config():
 def start_task():
     """启动阅读任务"""
     try:
-        if app_state['is_running']:
-            return jsonify({
-                'success': False,
-                'error': '任务已在运行中'
-            }), 400
+        config_data = request.get_json(silent=True) or {}
+        users = config_data.pop('users', None)
         
-        config_data = request.get_json() or {}
-        
-        # 在后台线程中启动任务
-        app_state['is_running'] = True
-        task_thread = threading.Thread(
-            target=web_config.task_manager.run_task,
-            args=(config_data,),
-            daemon=True
-        )
-        task_thread.start()
+        # 任务在阅读引擎上异步执行，请求线程立即返回
+        handle = web_config.task_manager.start_task(config_data, users=users)
         
         return jsonify({
             'success': True,
             'message': '任务已启动',
-            'task_id': 'task_' + datetime.now().isoformat()
+            'task_id': handle.task_id,
+            'users': handle.users
         })
+    except TaskAdmissionError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), e.status_code
     except Exception as e:
-        app_state['is_running'] = False
         logger.error(f"启动任务失败: {e}")
         return jsonify({
             'success': False,
@@ -184,14 +320,16 @@ def start_task():
 
 @app.route('/api/task/stop', methods=['POST'])
 def stop_task():
-    """停止阅读任务"""
+    """停止阅读任务（可通过 task_id 指定任务，默认停止全部）"""
     try:
-        app_state['is_running'] = False
-        web_config.task_manager.stop_task()
+        data = request.get_json(silent=True) or {}
+        task_id = data.get('task_id') or request.args.get('task_id')
+        stopped = web_config.task_manager.stop_task(task_id)
         
         return jsonify({
             'success': True,
-            'message': '任务已停止'
+            'message': '任务已停止',
+            'tasks': stopped
         })
     except Exception as e:
         logger.error(f"停止任务失败: {e}")
@@ -201,15 +339,71 @@ def stop_task():
         }), 500
 
 
+@app.route('/api/task/pause', methods=['POST'])
+def pause_task():
+    """暂停阅读任务（可通过 task_id 指定任务，默认暂停全部）"""
+    try:
+        data = request.get_json(silent=True) or {}
+        task_id = data.get('task_id') or request.args.get('task_id')
+        paused = web_config.task_manager.pause_task(task_id)
+        if not paused:
+            return jsonify({
+                'success': False,
+                'error': '没有可暂停的运行中任务'
+            }), 404
+        
+        return jsonify({
+            'success': True,
+            'message': '任务已暂停',
+            'tasks': paused
+        })
+    except Exception as e:
+        logger.error(f"暂停任务失败: {e}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+
+@app.route('/api/task/resume', methods=['POST'])
+def resume_task():
+    """恢复已暂停的阅读任务（可通过 task_id 指定任务，默认恢复全部）"""
+    try:
+        data = request.get_json(silent=True) or {}
+        task_id = data.get('task_id') or request.args.get('task_id')
+        resumed = web_config.task_manager.resume_task(task_id)
+        if not resumed:
+            return jsonify({
+                'success': False,
+                'error': '没有已暂停的任务'
+            }), 404
+        
+        return jsonify({
+            'success': True,
+            'message': '任务已恢复',
+            'tasks': resumed
+        })
+    except Exception as e:
+        logger.error(f"恢复任务失败: {e}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+
 @app.route('/api/task/status', methods=['GET'])
 def get_task_status():
-    """获取任务状态"""
+    """获取任务状态（可通过 task_id 查询单个任务）"""
     try:
-        status = {
-            'is_running': app_state['is_running'],
-            'current_task': app_state['current_task'],
-            'timestamp': datetime.now().isoformat()
-        }
+        task_id = request.args.get('task_id')
+        status = web_config.task_manager.get_task_status(task_id)
+        if status is None:
+            return jsonify({
+                'success': False,
+                'error': '任务不存在'
+            }), 404
+        
+        status['timestamp'] = datetime.now().isoformat()
         return jsonify({
             'success': True,
             'data': status
@@ -222,15 +416,93 @@ def get_task_status():
         }), 500
 
 
+@app.route('/api/schedule', methods=['GET'])
+def get_schedule():
+    """定时任务及之后的触发时间（按下一次触发时间排序）"""
+    try:
+        limit = max(1, min(request.args.get('limit', 50, type=int), 1000))
+        count = max(1, min(request.args.get('count', 3, type=int), 20))
+        return jsonify({
+            'success': True,
+            'data': web_config.task_manager.get_schedule(limit, count)
+        })
+    except Exception as e:
+        logger.error(f"获取定时任务失败: {e}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+
+@app.route('/api/daemon', methods=['GET'])
+def get_daemon_status():
+    """守护进程状态（每个用户的当天会话数与下一次唤醒时间）"""
+    try:
+        return jsonify({
+            'success': True,
+            'data': web_config.daemon.get_status()
+        })
+    except Exception as e:
+        logger.error(f"获取守护进程状态失败: {e}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+
+@app.route('/api/stats/summary', methods=['GET'])
+def get_stats_summary():
+    """阅读统计汇总（读取日汇总表）：days 为最近天数，可按 user 过滤"""
+    try:
+        days = max(1, min(request.args.get('days', 7, type=int), 3660))
+        stats = web_config.task_manager.stats
+        # 先等待队列中已有的记录落盘，保证刚结束的会话计入汇总
+        stats.flush(timeout=2)
+        return jsonify({
+            'success': True,
+            'data': stats.summary(days, request.args.get('user'))
+        })
+    except Exception as e:
+        logger.error(f"获取阅读统计失败: {e}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+
+@app.route('/api/stats/reset', methods=['POST'])
+def reset_stats():
+    """清空阅读统计"""
+    try:
+        if not web_config.task_manager.stats.reset():
+            return jsonify({
+                'success': False,
+                'error': '统计写入线程未响应'
+            }), 500
+        web_config.log_manager.info("🧹 阅读统计已重置")
+        return jsonify({
+            'success': True,
+            'message': '统计已重置'
+        })
+    except Exception as e:
+        logger.error(f"重置阅读统计失败: {e}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+
 @app.route('/api/logs', methods=['GET'])
 def get_logs():
-    """获取日志"""
+    """获取日志（可通过 since=<seq> 只获取该序号之后的新日志）"""
     try:
         limit = request.args.get('limit', 100, type=int)
-        logs = web_config.get_logs(limit)
+        since = request.args.get('since', type=int)
+        logs = web_config.get_logs(limit, since)
         return jsonify({
             'success': True,
-            'data': logs
+            'data': logs,
+            'last_seq': web_config.log_manager.last_seq
         })
     except Exception as e:
         logger.error(f"获取日志失败: {e}")
@@ -240,6 +512,54 @@ def get_logs():
         }), 500
 
 
+@app.route('/api/stream', methods=['GET'])
+def stream_events():
+    """SSE 事件流：推送日志（log）和任务状态（status），支持 Last-Event-ID 断点续传"""
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    try:
+        since = int(last_event_id)
+    except (TypeError, ValueError):
+        # 新连接先补发最近的日志
+        backlog = request.args.get('backlog', 50, type=int)
+        since = max(0, web_config.log_manager.last_seq - backlog)
+    
+    def _format(event, data, event_id=None):
+        payload = json.dumps(data, ensure_ascii=False)
+        prefix = f"id: {event_id}\n" if event_id is not None else ''
+        return f"{prefix}event: {event}\ndata: {payload}\n\n"
+    
+    def generate():
+        cursor = since
+        status_key = None
+        yield 'retry: 3000\n\n'
+        while True:
+            generation = web_config.event_bus.generation
+            
+            entries = web_config.log_manager.get_logs(500, since=cursor)
+            for entry in entries:
+                cursor = entry['seq']
+                yield _format('log', entry, cursor)
+            
+            status = web_config.task_manager.get_task_status()
+            key = tuple((task['task_id'], task['version']) for task in status['tasks'])
+            if key != status_key:
+                status_key = key
+                status['timestamp'] = datetime.now().isoformat()
+                yield _format('status', status)
+            
+            if len(entries) == 500:
+                # 积压未发完，不等待直接继续
+                continue
+            if web_config.event_bus.wait(generation, timeout=15) == generation:
+                yield ': keepalive\n\n'
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+
 @app.route('/api/logs/clear', methods=['POST'])
 def clear_logs():
     """清空日志"""
@@ -257,23 +577,111 @@ def clear_logs():
         }), 500
 
 
+@app.route('/api/logs/search', methods=['GET'])
+def search_logs():
+    """检索日志文件（含滚动备份）：level、user、since/until（如 24h 或 ISO 时间）、q、limit"""
+    try:
+        try:
+            since = parse_time_arg(request.args.get('since'))
+            until = parse_time_arg(request.args.get('until'))
+        except ValueError:
+            return jsonify({
+                'success': False,
+                'error': '无效的时间参数'
+            }), 400
+        
+        result = web_config.log_manager.search(
+            level=request.args.get('level'),
+            user=request.args.get('user'),
+            since=since,
+            until=until,
+            query=request.args.get('q'),
+            limit=min(request.args.get('limit', 200, type=int), 5000)
+        )
+        return jsonify({
+            'success': True,
+            'data': result['results'],
+            'stats': result['stats']
+        })
+    except Exception as e:
+        logger.error(f"检索日志失败: {e}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+
+@app.route('/api/logs/stats', methods=['GET'])
+def get_log_stats():
+    """获取日志写入队列统计"""
+    try:
+        return jsonify({
+            'success': True,
+            'data': web_config.log_manager.get_queue_stats()
+        })
+    except Exception as e:
+        logger.error(f"获取日志统计失败: {e}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+
+@app.route('/api/logs/tail', methods=['GET'])
+def tail_logs():
+    """读取日志文件的最后 N 行"""
+    try:
+        lines = min(request.args.get('lines', 200, type=int), 10000)
+        return jsonify({
+            'success': True,
+            'data': web_config.log_manager.tail(lines)
+        })
+    except Exception as e:
+        logger.error(f"读取日志失败: {e}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+
 @app.route('/api/logs/download', methods=['GET'])
 def download_logs():
-    """下载日志文件"""
+    """下载日志文件（流式输出，支持 HTTP Range；all=true 时连同滚动备份按时间顺序拼接）"""
     try:
-        from flask import send_file
-        log_file = Path('logs/weread.log')
-        if log_file.exists():
-            return send_file(
-                str(log_file),
-                as_attachment=True,
-                download_name=f'weread-{datetime.now().strftime("%Y%m%d-%H%M%S")}.log'
-            )
-        else:
+        include_backups = request.args.get('all', 'false').lower() in ('1', 'true', 'yes')
+        chain = web_config.log_manager.open_log_chain(include_backups)
+        if not chain.paths:
             return jsonify({
                 'success': False,
                 'error': '日志文件不存在'
             }), 404
+        
+        total = chain.total_size
+        try:
+            byte_range = parse_range_header(request.headers.get('Range'), total)
+        except ValueError:
+            chain.close()
+            return Response(status=416, headers={'Content-Range': f'bytes */{total}'})
+        
+        start, end = byte_range or (0, total - 1)
+        suffix = '-all' if include_backups else ''
+        headers = {
+            'Accept-Ranges': 'bytes',
+            'Content-Length': str(max(0, end - start + 1)),
+            'Content-Disposition': (
+                f'attachment; filename=weread-{datetime.now().strftime("%Y%m%d-%H%M%S")}{suffix}.log'
+            )
+        }
+        status = 200
+        if byte_range is not None:
+            status = 206
+            headers['Content-Range'] = f'bytes {start}-{end}/{total}'
+        return Response(
+            stream_with_context(chain.iter_bytes(start, end)),
+            status=status,
+            mimetype='text/plain',
+            headers=headers
+        )
     except Exception as e:
         logger.error(f"下载日志失败: {e}")
         return jsonify({
@@ -306,6 +714,55 @@ def export_config():
         }), 500
 
 
+@app.route('/api/export/stats', methods=['GET'])
+def export_stats():
+    """流式导出阅读明细：type=requests|sessions，format=csv|jsonl，gzip=true，
+    可按 user、since/until（如 7d、2024-01-01 或 ISO 时间）过滤，book 过滤只适用于 requests"""
+    try:
+        kind = request.args.get('type', 'requests')
+        fmt = request.args.get('format', 'csv')
+        compress = request.args.get('gzip', 'false').lower() in ('1', 'true', 'yes')
+        if kind not in EXPORT_COLUMNS or fmt not in FORMATS:
+            return jsonify({
+                'success': False,
+                'error': '无效的导出类型或格式'
+            }), 400
+        book_id = request.args.get('book')
+        if book_id and kind != 'requests':
+            return jsonify({
+                'success': False,
+                'error': 'book 过滤只适用于 type=requests'
+            }), 400
+        try:
+            since = parse_time_arg(request.args.get('since'))
+            until = parse_time_arg(request.args.get('until'))
+        except ValueError:
+            return jsonify({
+                'success': False,
+                'error': '无效的时间参数'
+            }), 400
+        
+        rows = web_config.task_manager.stats.iter_rows(
+            kind, user=request.args.get('user'), since=since, until=until,
+            book_id=book_id
+        )
+        mimetype, extension = FORMATS[fmt]
+        filename = f'weread-{kind}-{datetime.now().strftime("%Y%m%d-%H%M%S")}.{extension}'
+        if compress:
+            mimetype, filename = 'application/gzip', filename + '.gz'
+        return Response(
+            stream_with_context(iter_export(rows, fmt, compress)),
+            mimetype=mimetype,
+            headers={'Content-Disposition': f'attachment; filename={filename}'}
+        )
+    except Exception as e:
+        logger.error(f"导出阅读统计失败: {e}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+
 @app.route('/api/import/config', methods=['POST'])
 def import_config():
     """导入配置文件"""
@@ -331,10 +788,15 @@ def import_config():
         
         # 保存上传的文件
         config_content = file.read().decode('utf-8')
-        import yaml
-        config_data = yaml.safe_load(config_content)
+        config_data = load_yaml(config_content)
         
-        web_config.save_config(config_data)
+        result = web_config.save_config(config_data)
+        if not result.get('success'):
+            return jsonify({
+                'success': False,
+                'error': result.get('error'),
+                'errors': result.get('errors', [])
+            }), 400 if 'errors' in result else 500
         
         return jsonify({
             'success': True,
@@ -352,8 +814,11 @@ def import_config():
 def test_notification():
     """测试通知功能"""
     try:
-        data = request.get_json()
-        channels = data.get('channels', [])
+        data = request.get_json() or {}
+        channels = data.get('channels') or [
+            channel for channel in web_config.config_manager.get_config_value('notification.channels', []) or []
+            if channel.get('enabled', True)
+        ]
         title = data.get('title', '正条阻弋 - 测试通知')
         content = data.get('content', '这是一条测试通知')
         
@@ -363,65 +828,8 @@ def test_notification():
                 'error': '未配置任何通知通道'
             }), 400
         
-        # 针对不同的通知通道发送测试消息
-        results = []
-        for channel in channels:
-            channel_name = channel.get('name')
-            channel_config = channel.get('config', {})
-            token = channel_config.get('token', '')
-            
-            try:
-                # 这里你可以添加具体的通知发送逻辑
-                # 按照不同的通知通道类型调用相应的API
-                if channel_name == 'pushplus':
-                    # PushPlus通知
-                    import requests
-                    response = requests.post(
-                        'https://www.pushplus.plus/send',
-                        json={
-                            'token': token,
-                            'title': title,
-                            'content': content
-                        },
-                        timeout=10
-                    )
-                    results.append({
-                        'channel': channel_name,
-                        'success': response.status_code == 200,
-                        'message': '发送成功' if response.status_code == 200 else '发送失败'
-                    })
-                elif channel_name == 'telegram':
-                    # Telegram通知
-                    import requests
-                    bot_token, chat_id = token.split(':') if ':' in token else (token, '')
-                    response = requests.post(
-                        f'https://api.telegram.org/bot{bot_token}/sendMessage',
-                        json={
-                            'chat_id': chat_id,
-                            'text': f'<b>{title}</b>\n\n{content}',
-                            'parse_mode': 'HTML'
-                        },
-                        timeout=10
-                    )
-                    results.append({
-                        'channel': channel_name,
-                        'success': response.status_code == 200,
-                        'message': '发送成功' if response.status_code == 200 else '发送失败'
-                    })
-                else:
-                    # 其他通道简易处理
-                    results.append({
-                        'channel': channel_name,
-                        'success': True,
-                        'message': '通道定义待实现'
-                    })
-            except Exception as e:
-                logger.error(f"测试{channel_name}通知失败: {e}")
-                results.append({
-                    'channel': channel_name,
-                    'success': False,
-                    'message': str(e)
-                })
+        # 并行发送到所有通道，结果中包含各通道耗时
+        results = web_config.notifier.send(title, content, channels)
         
         return jsonify({
             'success': True,
@@ -450,11 +858,18 @@ def load_curl_command():
         if Path(filename).exists():
             with open(filename, 'r', encoding='utf-8') as f:
                 content = f.read()
-            return jsonify({
+            result = {
                 'success': True,
                 'content': content,
                 'filename': filename
-            })
+            }
+            # 附带解析结果摘要（按文件 mtime 缓存）
+            try:
+                template = web_config.curl_cache.get(filename)
+                result['parsed'] = template.summary() if template else None
+            except CurlParseError as e:
+                result['parse_error'] = str(e)
+            return jsonify(result)
         else:
             return jsonify({
                 'success': True,
@@ -485,6 +900,7 @@ def save_curl_command():
         # 写入文件
         with open(filename, 'w', encoding='utf-8') as f:
             f.write(content)
+        web_config.curl_cache.invalidate(filename)
         
         return jsonify({
             'success': True,
@@ -499,6 +915,24 @@ def save_curl_command():
         }), 500
 
 
+@app.route('/api/network/stats', methods=['GET'])
+def get_network_stats():
+    """获取连接池与限流器统计"""
+    try:
+        stats = web_config.transport.get_stats()
+        stats['rate_limiter'] = web_config.task_manager.rate_limiter.get_stats()
+        return jsonify({
+            'success': True,
+            'data': stats
+        })
+    except Exception as e:
+        logger.error(f"获取连接池统计失败: {e}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+
 @app.route('/api/health', methods=['GET'])
 def health_check():
     """健康检查"""
@@ -509,6 +943,148 @@ def health_check():
     })
 
 
+@app.route('/api/profile', methods=['GET'])
+def get_profile():
+    """剖析状态、按路由汇总的请求采样和最近的采样请求"""
+    try:
+        profiler = web_config.profiler
+        limit = max(0, min(request.args.get('limit', 50, type=int), 500))
+        data = profiler.status()
+        data['routes'] = profiler.request_summary()
+        data['recent'] = profiler.recent_requests(limit)
+        return jsonify({
+            'success': True,
+            'data': data
+        })
+    except Exception as e:
+        logger.error(f"获取剖析状态失败: {e}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+
+@app.route('/api/profile', methods=['POST'])
+def update_profile():
+    """设置请求采样比例（request_sample_rate，0 关闭），clear=true 时清空已有样本"""
+    try:
+        data = request.get_json(silent=True) or {}
+        profiler = web_config.profiler
+        if 'request_sample_rate' in data:
+            try:
+                profiler.set_request_sample_rate(data['request_sample_rate'])
+            except (TypeError, ValueError) as e:
+                return jsonify({
+                    'success': False,
+                    'error': str(e)
+                }), 400
+        if data.get('clear'):
+            profiler.clear_requests()
+        return jsonify({
+            'success': True,
+            'data': profiler.status()
+        })
+    except Exception as e:
+        logger.error(f"设置剖析失败: {e}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+
+@app.route('/api/profile/capture', methods=['POST'])
+def start_profile_capture():
+    """剖析阅读引擎：mode=stack|cprofile，duration 秒后自动结束，interval 为 stack 模式的采样间隔"""
+    try:
+        data = request.get_json(silent=True) or {}
+        try:
+            capture = web_config.profiler.start_capture(
+                data.get('mode', 'stack'),
+                data.get('duration', 30),
+                data.get('interval', 0.005)
+            )
+        except ProfilerBusyError as e:
+            return jsonify({
+                'success': False,
+                'error': str(e)
+            }), 409
+        except (TypeError, ValueError) as e:
+            return jsonify({
+                'success': False,
+                'error': str(e)
+            }), 400
+        web_config.log_manager.info(
+            f"🔬 开始剖析阅读引擎: 模式={capture['mode']}, 时长={capture['duration']:g}秒"
+        )
+        return jsonify({
+            'success': True,
+            'data': capture
+        })
+    except Exception as e:
+        logger.error(f"启动剖析失败: {e}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+
+@app.route('/api/profile/capture/stop', methods=['POST'])
+def stop_profile_capture():
+    """提前结束剖析"""
+    try:
+        capture = web_config.profiler.stop_capture()
+        if capture is None:
+            return jsonify({
+                'success': False,
+                'error': '没有进行中的剖析'
+            }), 404
+        return jsonify({
+            'success': True,
+            'data': capture
+        })
+    except Exception as e:
+        logger.error(f"结束剖析失败: {e}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+
+@app.route('/api/profile/download', methods=['GET'])
+def download_profile():
+    """下载最近一次剖析结果：format=pstats（cprofile 模式）或 collapsed（stack 模式）"""
+    try:
+        fmt = request.args.get('format', 'collapsed')
+        data = web_config.profiler.export(fmt)
+        if data is None:
+            return jsonify({
+                'success': False,
+                'error': '没有可下载的剖析结果（剖析未结束或格式与模式不符）'
+            }), 404
+        extension, mimetype = ('prof', 'application/octet-stream') if fmt == 'pstats' else ('txt', 'text/plain')
+        return Response(
+            data,
+            mimetype=mimetype,
+            headers={
+                'Content-Disposition': (
+                    f'attachment; filename=weread-profile-{datetime.now().strftime("%Y%m%d-%H%M%S")}.{extension}'
+                )
+            }
+        )
+    except Exception as e:
+        logger.error(f"下载剖析结果失败: {e}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """运行指标（Prometheus 文本格式）"""
+    return Response(REGISTRY.render(), mimetype='text/plain; version=0.0.4; charset=utf-8')
+
+
 # ==================== 错误处理 ====================
 
 @app.errorhandler(404)
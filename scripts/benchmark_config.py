@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""配置加载/保存基准测试
+
+生成一份多用户大配置（大量书籍章节和 12 个通知通道），比较：
+纯 Python 与 libyaml 的解析/输出耗时，以及 ConfigManager 冷启动与命中解析缓存的热启动耗时。
+
+用法: python scripts/benchmark_config.py [--users 50] [--books 40] [--chapters 60] [--repeat 5]
+"""
+
+import argparse
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import yaml
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from services.config_manager import ConfigManager, YamlDumper, YamlLoader  # noqa: E402
+
+
+def build_config(users: int, books: int, chapters: int) -> dict:
+    """构造测试用配置"""
+    config = ConfigManager._get_default_config(None)
+    config['curl_config']['users'] = [
+        {
+            'name': f'user{i}',
+            'file_path': f'user{i}_curl.txt',
+            'reading_overrides': {'target_duration': '45-90', 'reading_interval': '30-48'}
+        }
+        for i in range(users)
+    ]
+    config['reading']['books'] = [
+        {
+            'name': f'书籍{b}',
+            'book_id': f'{b:024x}',
+            'chapters': [
+                {'chapter_id': f'{b:012x}{c:011x}', 'chapter_index': c} if c % 3 else f'{b:012x}{c:011x}'
+                for c in range(chapters)
+            ]
+        }
+        for b in range(books)
+    ]
+    config['notification']['channels'] = [
+        {'name': name, 'enabled': True, 'config': {'token': 'x' * 32, 'server': 'https://example.com'}}
+        for name in ('pushplus', 'telegram', 'wxpusher', 'apprise', 'bark', 'ntfy', 'feishu',
+                     'wework', 'dingtalk', 'gotify', 'serverchan3', 'pushdeer')
+    ]
+    return config
+
+
+def timeit(func, repeat: int) -> float:
+    """多次执行取最短耗时（毫秒）"""
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - started)
+    return best * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description='配置加载/保存基准测试')
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--books', type=int, default=40)
+    parser.add_argument('--chapters', type=int, default=60)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    config = build_config(args.users, args.books, args.chapters)
+    text = yaml.dump(config, Dumper=yaml.SafeDumper, allow_unicode=True, sort_keys=False)
+    print(f"配置大小: {len(text.encode('utf-8')) / 1024:.0f} KB, libyaml: {yaml.__with_libyaml__}")
+
+    results = [
+        ('解析 SafeLoader（纯 Python）', timeit(lambda: yaml.load(text, Loader=yaml.SafeLoader), args.repeat)),
+        (f'解析 {YamlLoader.__name__}', timeit(lambda: yaml.load(text, Loader=YamlLoader), args.repeat)),
+        ('输出 SafeDumper（纯 Python）', timeit(
+            lambda: yaml.dump(config, Dumper=yaml.SafeDumper, allow_unicode=True, sort_keys=False),
+            args.repeat)),
+        (f'输出 {YamlDumper.__name__}', timeit(
+            lambda: yaml.dump(config, Dumper=YamlDumper, allow_unicode=True, sort_keys=False),
+            args.repeat)),
+    ]
+
+    workdir = Path(tempfile.mkdtemp(prefix='weread-bench-'))
+    try:
+        config_path = workdir / 'config.yaml'
+        config_path.write_text(text, encoding='utf-8')
+        cache_dir = workdir / '.cache'
+
+        def cold_start():
+            shutil.rmtree(cache_dir, ignore_errors=True)
+            ConfigManager(str(config_path), reload_interval=0, save_delay=0, cache_dir=str(cache_dir))
+
+        def warm_start():
+            ConfigManager(str(config_path), reload_interval=0, save_delay=0, cache_dir=str(cache_dir))
+
+        results.append(('ConfigManager 冷启动（解析并写缓存）', timeit(cold_start, args.repeat)))
+        warm_start()
+        results.append(('ConfigManager 热启动（命中缓存）', timeit(warm_start, args.repeat)))
+        results.append(('ConfigManager 无缓存', timeit(
+            lambda: ConfigManager(str(config_path), reload_interval=0, save_delay=0, cache_dir=''),
+            args.repeat)))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    width = max(len(name) for name, _ in results)
+    for name, elapsed in results:
+        print(f"{name:<{width}}  {elapsed:8.2f} ms")
+
+
+if __name__ == '__main__':
+    main()
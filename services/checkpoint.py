@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""阅读进度检查点
+
+每个任务、每个用户的阅读进度（已读秒数、目标时长、请求数、当前书籍和章节）
+以 JSON Lines 追加写入同一个文件，同一会话按间隔节流。
+调用方（阅读循环）只更新内存状态并把记录放进队列，文件写入全部由后台写线程完成，
+写线程每取空一次队列 flush 一次；文件中过期的记录累积到一定数量后整体压缩：
+只保留未结束任务的最新记录，写临时文件并 fsync 后原子替换。
+进程重启时回放文件，未结束的任务从最后的检查点继续。
+
+记录格式：
+    {"task": id, "users": [...], "override": {...}}       任务开始
+    {"task": id, "user": u, "elapsed": ..., ...}           会话进度
+    {"task": id, "done": true}                             任务结束
+"""
+
+import json
+import os
+import queue
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+
+class _Tasks:
+    """检查点回放状态：{任务ID: {'users', 'override', 'sessions': {用户: 最后的检查点}}}"""
+
+    def __init__(self):
+        self.tasks: Dict[str, Dict[str, Any]] = {}
+
+    def apply(self, record: Dict[str, Any]):
+        task_id = record.get('task')
+        if not task_id:
+            return
+        if record.get('done'):
+            self.tasks.pop(task_id, None)
+        elif 'user' in record:
+            task = self.tasks.setdefault(task_id, {'users': [], 'override': None, 'sessions': {}})
+            task['sessions'][record['user']] = record
+        else:
+            self.tasks[task_id] = {
+                'users': record.get('users') or [],
+                'override': record.get('override'),
+                'sessions': {}
+            }
+
+    def live_count(self) -> int:
+        return sum(1 + len(task['sessions']) for task in self.tasks.values())
+
+    def records(self) -> Iterator[Dict[str, Any]]:
+        """重建当前状态所需的最少记录"""
+        for task_id, task in self.tasks.items():
+            yield {'task': task_id, 'users': task['users'], 'override': task['override']}
+            yield from task['sessions'].values()
+
+
+# 写线程控制命令
+_FLUSH = 'flush'
+_STOP = 'stop'
+
+
+def _dumps(record: Dict[str, Any]) -> str:
+    return json.dumps(record, ensure_ascii=False, separators=(',', ':')) + '\n'
+
+
+class CheckpointStore:
+    """追加写入、定期压缩的检查点文件（后台线程写入）"""
+
+    def __init__(self, path: str, interval: float = 30.0, compact_after: int = 1000):
+        self.path = Path(path)
+        self.interval = float(interval)
+        self.compact_after = max(1, int(compact_after))
+        self._lock = threading.Lock()
+        # 调用方看到的状态；写线程另有一份与文件内容一致的状态，压缩时使用
+        self._state = _Tasks()
+        self._written = _Tasks()
+        self._last_write: Dict[Tuple[str, str], float] = {}
+        self._stale = 0
+        self._file = None
+        self._closed = False
+        self._load()
+        self._queue: 'queue.Queue' = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name='weread-checkpoint', daemon=True)
+        self._thread.start()
+
+    def _load(self):
+        """回放检查点文件（末尾写了一半的行直接跳过）"""
+        try:
+            f = open(self.path, 'r', encoding='utf-8')
+        except OSError:
+            return
+        lines = 0
+        with f:
+            for line in f:
+                lines += 1
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                self._state.apply(record)
+                self._written.apply(record)
+        self._stale = max(0, lines - self._written.live_count())
+
+    def _put(self, record: Dict[str, Any]):
+        """更新内存状态并交给写线程（调用方持有锁，保证入队顺序与状态变化顺序一致）"""
+        self._state.apply(record)
+        if not self._closed:
+            self._queue.put(('record', record))
+
+    # ==================== 写线程 ====================
+
+    def _run(self):
+        while True:
+            kind, payload = self._queue.get()
+            try:
+                if kind == 'record':
+                    self._write(payload)
+                    # 取空队列后再 flush，连续的记录只 flush 一次
+                    if not self._queue.empty():
+                        continue
+                    self._flush_file()
+                elif kind == _FLUSH:
+                    self._flush_file()
+                elif kind == _STOP:
+                    if self._stale:
+                        self._compact()
+                    self._close_file()
+            except OSError as e:
+                # 写入失败不影响阅读，下一条记录重新尝试
+                print(f"写入检查点失败: {e}")
+                self._close_file()
+            if isinstance(payload, threading.Event):
+                payload.set()
+            if kind == _STOP:
+                return
+
+    def _write(self, record: Dict[str, Any]):
+        """追加一条记录，过期记录足够多时压缩（写线程）"""
+        self._written.apply(record)
+        if self._file is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._file = open(self.path, 'a', encoding='utf-8')
+        self._file.write(_dumps(record))
+        self._stale += 1
+        if self._stale >= self.compact_after:
+            self._compact()
+
+    def _flush_file(self):
+        if self._file is not None:
+            self._file.flush()
+
+    def _close_file(self):
+        file, self._file = self._file, None
+        if file is not None:
+            try:
+                file.close()
+            except OSError:
+                pass
+
+    def _compact(self):
+        """只保留未结束任务的最新记录，写临时文件并 fsync 后原子替换（写线程）"""
+        self._close_file()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(prefix=f'.{self.path.name}.', suffix='.tmp',
+                                        dir=str(self.path.parent))
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                for record in self._written.records():
+                    f.write(_dumps(record))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+            raise
+        self._stale = 0
+
+    # ==================== 调用方接口 ====================
+
+    def begin(self, task_id: str, users: List[str], override: Optional[Dict[str, Any]] = None):
+        """登记新任务"""
+        with self._lock:
+            self._put({'task': task_id, 'users': list(users), 'override': override})
+
+    def record(self, task_id: str, state: Dict[str, Any], force: bool = False) -> bool:
+        """记录会话进度（同一会话 interval 秒内只记一次，force 时总是记录），返回是否记录"""
+        key = (task_id, state['user'])
+        now = time.monotonic()
+        if not force and now - self._last_write.get(key, float('-inf')) < self.interval:
+            return False
+        with self._lock:
+            if task_id not in self._state.tasks:
+                return False
+            self._last_write[key] = now
+            self._put(dict(state, task=task_id, ts=round(time.time(), 3)))
+        return True
+
+    def finish(self, task_id: str):
+        """任务结束，之后不再恢复"""
+        with self._lock:
+            if task_id not in self._state.tasks:
+                return
+            for key in [key for key in self._last_write if key[0] == task_id]:
+                del self._last_write[key]
+            self._put({'task': task_id, 'done': True})
+
+    def pending(self) -> Dict[str, Dict[str, Any]]:
+        """未结束的任务：{任务ID: {'users', 'override', 'sessions': {用户: 最后的检查点}}}"""
+        with self._lock:
+            return {
+                task_id: {
+                    'users': list(task['users']),
+                    'override': task['override'],
+                    'sessions': dict(task['sessions'])
+                }
+                for task_id, task in self._state.tasks.items()
+            }
+
+    def _command(self, command: str, timeout: float) -> bool:
+        """向写线程发送控制命令并等待执行完成"""
+        done = threading.Event()
+        self._queue.put((command, done))
+        return done.wait(timeout)
+
+    def flush(self, timeout: float = 10.0) -> bool:
+        """等待已记录的检查点写入文件"""
+        if self._closed:
+            return False
+        return self._command(_FLUSH, timeout)
+
+    def close(self):
+        """写完剩余记录，压缩并关闭文件"""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+        self._command(_STOP, 10.0)
+        self._thread.join(timeout=5)
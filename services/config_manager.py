@@ -1,33 +1,468 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
-"""配置管理服务"""
+"""配置管理服务
 
+每次配置变化都会发布一个冻结的、带版本号的配置快照（嵌套的只读映射和元组）。
+任务直接持有快照引用，无需深拷贝；配置文件按 mtime 检查变化并热加载。
+逐项修改会在短时间窗口内合并后再写盘，写入通过临时文件 + fsync + 原子替换完成。
+YAML 优先使用 libyaml 的 C 实现；解析结果按文件内容哈希缓存，内容未变时启动无需重新解析。
+整份保存、部分修改和热加载前都会先经过 config_schema 校验，不合法的配置不会写盘或生效。
+在事件循环线程上读取配置时，热加载检查交给后台线程，循环只拿到当前快照，不做文件 IO。
+"""
+
+import asyncio
+import atexit
+import errno
+import hashlib
+import marshal
 import os
 import json
+import stat
+import tempfile
+import threading
+import time
 import yaml
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Dict, Any, Optional
+from types import MappingProxyType
+from typing import Callable, Dict, Any, List, Mapping, Optional
+
+from .config_schema import ConfigValidationError, ConfigValidator
+from .metrics import CONFIG_RELOADS
+from .user_settings import UserSettings
+
+try:
+    from yaml import CSafeDumper as YamlDumper, CSafeLoader as YamlLoader
+except ImportError:  # 未编译 libyaml 时退回纯 Python 实现
+    from yaml import SafeDumper as YamlDumper, SafeLoader as YamlLoader
+
+
+def load_yaml(stream) -> Any:
+    """解析 YAML（safe 语义）"""
+    return yaml.load(stream, Loader=YamlLoader)
+
+
+def dump_yaml(data: Any, stream=None):
+    """输出 YAML（保持键顺序，允许中文）"""
+    return yaml.dump(data, stream, Dumper=YamlDumper, default_flow_style=False,
+                     allow_unicode=True, sort_keys=False)
+
+
+class ParsedConfigCache:
+    """配置解析结果缓存
+
+    以配置文件内容的 SHA-256 为键，用 marshal 保存解析后的结构；内容未变时直接反序列化，
+    跳过 YAML 解析。缓存只是加速手段，读写失败都会被忽略。
+    """
+    
+    def __init__(self, cache_path: str):
+        self.cache_path = Path(cache_path)
+    
+    def load(self, digest: bytes) -> Optional[Dict[str, Any]]:
+        try:
+            with open(self.cache_path, 'rb') as f:
+                if f.read(len(digest)) != digest:
+                    return None
+                data = marshal.loads(f.read())
+        except (OSError, EOFError, ValueError, TypeError):
+            return None
+        return data if isinstance(data, dict) else None
+    
+    def store(self, digest: bytes, data: Dict[str, Any]):
+        try:
+            payload = marshal.dumps(data)
+        except ValueError:
+            # 含有 marshal 不支持的类型（如 YAML 时间戳），不缓存
+            return
+        try:
+            self.cache_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.cache_path.with_suffix('.tmp')
+            with open(tmp_path, 'wb') as f:
+                f.write(digest)
+                f.write(payload)
+            os.replace(tmp_path, self.cache_path)
+        except OSError:
+            pass
+
+
+def freeze(value: Any) -> Any:
+    """把配置转换为只读结构（dict -> MappingProxyType，list -> tuple）"""
+    if isinstance(value, Mapping):
+        return MappingProxyType({key: freeze(item) for key, item in value.items()})
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze(item) for item in value)
+    return value
+
+
+def thaw(value: Any) -> Any:
+    """把只读配置还原为可修改的 dict / list"""
+    if isinstance(value, Mapping):
+        return {key: thaw(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [thaw(item) for item in value]
+    return value
+
+
+def overlay(base: Mapping, updates: Mapping) -> Mapping:
+    """在冻结的配置上叠加覆盖项，返回新的冻结配置
+
+    只重建被覆盖路径上的节点，其余子树与 base 共享，base 本身不会被修改。
+    """
+    merged = dict(base)
+    for key, value in updates.items():
+        current = base.get(key)
+        if isinstance(value, Mapping) and isinstance(current, Mapping):
+            merged[key] = overlay(current, value)
+        else:
+            merged[key] = freeze(value)
+    return MappingProxyType(merged)
+
+
+def merge_patch(base: Mapping, patch: Mapping) -> Dict[str, Any]:
+    """JSON Merge Patch：返回合并后的新字典（值为 None 的键被删除），未涉及的子树与 base 共享"""
+    merged = dict(base)
+    for key, value in patch.items():
+        if value is None:
+            merged.pop(key, None)
+        elif isinstance(value, Mapping) and isinstance(merged.get(key), Mapping):
+            merged[key] = merge_patch(merged[key], value)
+        else:
+            merged[key] = value
+    return merged
+
+
+def user_entries(config: Mapping[str, Any]):
+    """curl_config.users 中的 (用户名, 配置项)，未命名的用户依次命名为 user1、user2 ..."""
+    curl_config = config.get('curl_config') or {}
+    return [
+        (user.get('name') or f"user{index + 1}", user)
+        for index, user in enumerate(curl_config.get('users') or [])
+    ]
+
+
+class ConfigSnapshot:
+    """某一版本的冻结配置"""
+    
+    __slots__ = ('version', 'data')
+    
+    def __init__(self, version: int, data: Mapping[str, Any]):
+        self.version = version
+        self.data = data
+    
+    def get(self, path: str, default: Any = None) -> Any:
+        """按点号路径取值"""
+        current: Any = self.data
+        for key in path.split('.'):
+            if isinstance(current, Mapping) and key in current:
+                current = current[key]
+            else:
+                return default
+        return current
+
+
+class ConfigView:
+    """任务/会话的配置视图：最新配置快照 + 本次任务的覆盖项 + 用户的 reading_overrides
+
+    current() 只在全局配置版本变化时重新叠加，其余时候直接返回缓存的冻结配置；
+    settings() 同样按版本缓存编译好的 UserSettings。
+    """
+    
+    def __init__(self, config_manager: 'ConfigManager',
+                 override: Optional[Mapping[str, Any]] = None, user: Optional[str] = None):
+        self.config_manager = config_manager
+        self.override = override
+        self.user = user
+        self.version = 0
+        self._config: Mapping[str, Any] = MappingProxyType({})
+        self._settings: Optional[UserSettings] = None
+    
+    def settings(self) -> UserSettings:
+        """当前版本的有效用户参数（每个版本只编译一次）"""
+        config = self.current()
+        settings = self._settings
+        if settings is None or settings.version != self.version:
+            settings = self._settings = UserSettings.compile(self.version, self.user, config)
+        return settings
+    
+    def current(self) -> Mapping[str, Any]:
+        snapshot = self.config_manager.snapshot()
+        if snapshot.version != self.version:
+            config = snapshot.data
+            if self.override:
+                config = overlay(config, self.override)
+            if self.user is not None:
+                reading_overrides = next(
+                    (entry.get('reading_overrides') for name, entry in user_entries(config)
+                     if name == self.user),
+                    None
+                )
+                if reading_overrides:
+                    config = overlay(config, {'reading': reading_overrides})
+            self._config = config
+            self.version = snapshot.version
+        return self._config
 
 
 class ConfigManager:
     """Web版本的配置管理器"""
     
-    def __init__(self, config_path: str = "config.yaml"):
+    def __init__(self, config_path: str = "config.yaml", reload_interval: Optional[float] = None,
+                 save_delay: Optional[float] = None, cache_dir: Optional[str] = None):
         self.config_path = config_path
+        # 解析结果缓存，默认放在配置文件旁的 .cache 目录；cache_dir 为空字符串时不缓存
+        if cache_dir is None:
+            cache_dir = str(Path(config_path).parent / '.cache')
+        self._parsed_cache = (
+            ParsedConfigCache(str(Path(cache_dir) / f"{Path(config_path).name}.marshal"))
+            if cache_dir else None
+        )
+        self._lock = threading.RLock()
+        self.validator = ConfigValidator()
+        self.reload_interval = 0.0
+        self._dirty = False
+        self._save_timer: Optional[threading.Timer] = None
+        self._listeners: List[Callable[[ConfigSnapshot], None]] = []
+        # 是否有线程正在调用发布回调
+        self._notifying = False
+        self._version = 0
+        self._mtime_ns = self._stat_mtime()
+        self._last_check = time.monotonic()
+        # 事件循环线程触发的热加载检查在这个单线程池中执行，同一时间最多一个
+        self._reload_executor: Optional[ThreadPoolExecutor] = None
+        self._reload_pending = False
+        # 只保护上面两项；不用 _lock，避免循环线程等待正在读文件的后台线程
+        self._reload_lock = threading.Lock()
         self.config = self._load_config()
+        self._snapshot = self._publish()
+        # 检查配置文件变化的最小间隔（秒），0 表示不热加载
+        if reload_interval is None:
+            reload_interval = self.get_config_value('app.config_reload_interval', 2)
+        self.reload_interval = float(reload_interval or 0)
+        # 逐项修改合并写盘的时间窗口（秒），0 表示每次修改立即写盘
+        if save_delay is None:
+            save_delay = self.get_config_value('app.config_save_delay', 0.5)
+        self.save_delay = float(save_delay or 0)
+        atexit.register(self.flush)
+    
+    def _stat_mtime(self) -> Optional[int]:
+        try:
+            return os.stat(self.config_path).st_mtime_ns
+        except OSError:
+            return None
+    
+    def _read_config_file(self) -> Dict[str, Any]:
+        """读取并解析配置文件（解析失败时抛出异常），内容未变时使用缓存的解析结果"""
+        with open(self.config_path, 'rb') as f:
+            raw = f.read()
+        digest = hashlib.sha256(raw).digest()
+        if self._parsed_cache is not None:
+            cached = self._parsed_cache.load(digest)
+            if cached is not None:
+                return cached
+        config = load_yaml(raw.decode('utf-8')) or {}
+        if self._parsed_cache is not None and isinstance(config, dict):
+            self._parsed_cache.store(digest, config)
+        return config
     
     def _load_config(self) -> Dict[str, Any]:
         """加载配置文件"""
         if Path(self.config_path).exists():
             try:
-                with open(self.config_path, 'r', encoding='utf-8') as f:
-                    return yaml.safe_load(f) or {}
+                config = self._read_config_file()
             except Exception as e:
                 print(f"配置文件加载失败: {e}")
                 return self._get_default_config()
+            # 启动时不拒绝已有的配置文件，只提示问题所在
+            for error in self.validator.validate(config):
+                print(f"⚠️ 配置项 {error['path']}: {error['message']}")
+            return config
         else:
             return self._get_default_config()
     
+    def _write_file(self, config_dict: Dict[str, Any]):
+        """原子写入配置文件：写临时文件并 fsync 后替换原文件，写入中途崩溃不会损坏原文件"""
+        path = Path(self.config_path)
+        directory = str(path.parent)
+        raw = dump_yaml(config_dict).encode('utf-8')
+        fd, tmp_path = tempfile.mkstemp(prefix=f'.{path.name}.', suffix='.tmp', dir=directory)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(raw)
+                f.flush()
+                os.fsync(f.fileno())
+            if path.exists():
+                os.chmod(tmp_path, stat.S_IMODE(os.stat(path).st_mode))
+            try:
+                os.replace(tmp_path, path)
+            except OSError as e:
+                if e.errno not in (errno.EBUSY, errno.EXDEV):
+                    raise
+                # 单文件挂载（如 Docker 绑定挂载 config.yaml）无法被替换，退回原地写入
+                with open(path, 'wb') as dst:
+                    dst.write(raw)
+                    dst.flush()
+                    os.fsync(dst.fileno())
+                os.remove(tmp_path)
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+        
+        # 持久化目录项（rename 本身）
+        try:
+            dir_fd = os.open(directory, os.O_RDONLY)
+            try:
+                os.fsync(dir_fd)
+            finally:
+                os.close(dir_fd)
+        except OSError:
+            pass
+        self._mtime_ns = self._stat_mtime()
+        if self._parsed_cache is not None:
+            self._parsed_cache.store(hashlib.sha256(raw).digest(), config_dict)
+    
+    def _schedule_save(self):
+        """标记配置待写盘；同一时间窗口内的多次修改只写一次"""
+        with self._lock:
+            self._dirty = True
+            if self.save_delay <= 0:
+                self.flush()
+                return
+            if self._save_timer is None:
+                self._save_timer = threading.Timer(self.save_delay, self.flush)
+                self._save_timer.daemon = True
+                self._save_timer.start()
+    
+    def flush(self) -> bool:
+        """立即写出尚未写盘的修改"""
+        with self._lock:
+            timer, self._save_timer = self._save_timer, None
+            if timer is not None:
+                timer.cancel()
+            if not self._dirty:
+                return True
+            try:
+                self._write_file(self.config)
+                self._dirty = False
+                return True
+            except Exception as e:
+                print(f"配置写入失败: {e}")
+                return False
+    
+    @property
+    def has_pending_changes(self) -> bool:
+        """是否有尚未写盘的修改"""
+        return self._dirty
+    
+    def _publish(self) -> ConfigSnapshot:
+        """生成当前配置的冻结快照；调用方释放 _lock 后再调用 _notify 通知回调"""
+        with self._lock:
+            self._version += 1
+            self._snapshot = ConfigSnapshot(self._version, freeze(self.config))
+            return self._snapshot
+    
+    def _notify(self):
+        """在 _lock 之外把最新快照交给发布回调
+        
+        回调可能去拿其他组件的锁，而那些组件持锁时也会读取配置，持有 _lock 调用回调会互相等待。
+        同一时间只有一个线程调用回调：其间的新发布由它接着送达，回调收到的版本只增不减。
+        """
+        with self._lock:
+            if self._notifying:
+                return
+            self._notifying = True
+        delivered = None
+        try:
+            while True:
+                with self._lock:
+                    snapshot = self._snapshot
+                    if snapshot is delivered:
+                        self._notifying = False
+                        return
+                for callback in list(self._listeners):
+                    try:
+                        callback(snapshot)
+                    except Exception as e:
+                        print(f"配置变更回调失败: {e}")
+                delivered = snapshot
+        except BaseException:
+            with self._lock:
+                self._notifying = False
+            raise
+    
+    def add_listener(self, callback: Callable[[ConfigSnapshot], None]):
+        """注册配置发布回调（在发布线程中、配置锁之外同步调用，应尽快返回）"""
+        self._listeners.append(callback)
+    
+    def _check_reload(self):
+        """按 mtime 检查配置文件是否被外部修改，变化时热加载（带节流）"""
+        if self.reload_interval <= 0 or self._dirty:
+            # 有未写盘的修改时以内存为准，不从磁盘覆盖
+            return
+        now = time.monotonic()
+        if now - self._last_check < self.reload_interval:
+            return
+        self._last_check = now
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            self._reload_if_changed()
+        else:
+            self._reload_in_background()
+    
+    def _reload_in_background(self):
+        """在后台线程检查并热加载（已有检查在进行时不重复提交）"""
+        with self._reload_lock:
+            if self._reload_pending:
+                return
+            self._reload_pending = True
+            if self._reload_executor is None:
+                self._reload_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='weread-config')
+            executor = self._reload_executor
+        executor.submit(self._background_reload)
+    
+    def _background_reload(self):
+        """后台线程：执行一次检查并清除进行中标记"""
+        try:
+            self._reload_if_changed()
+        finally:
+            with self._reload_lock:
+                self._reload_pending = False
+    
+    def _reload_if_changed(self):
+        """mtime 变化时重新读取、校验并发布配置文件"""
+        mtime_ns = self._stat_mtime()
+        if mtime_ns is None or mtime_ns == self._mtime_ns:
+            return
+        with self._lock:
+            if mtime_ns == self._mtime_ns:
+                return
+            self._mtime_ns = mtime_ns
+            try:
+                config = self._read_config_file()
+                self.validator.check(config)
+            except Exception as e:
+                # 文件可能正在被编辑，保留当前配置，等待下一次修改
+                print(f"配置文件热加载失败: {e}")
+                CONFIG_RELOADS.inc(('file', 'failure'))
+                return
+            self.config = config
+            self._publish()
+        CONFIG_RELOADS.inc(('file', 'success'))
+        self._notify()
+    
+    @property
+    def version(self) -> int:
+        """当前配置版本号"""
+        return self._snapshot.version
+    
+    def snapshot(self) -> ConfigSnapshot:
+        """最新的冻结配置快照（必要时先热加载配置文件）"""
+        self._check_reload()
+        return self._snapshot
+    
     def _get_default_config(self) -> Dict[str, Any]:
         """获取默认配置"""
         return {
@@ -35,7 +470,17 @@ class ConfigManager:
                 'name': 'WeReadBot',
                 'version': '1.0.5',
                 'startup_mode': 'immediate',
-                'startup_delay': '1-10'
+                'startup_delay': '1-10',
+                'engine_workers': 4,
+                'max_concurrent_tasks': 4,
+                'config_reload_interval': 2,
+                'config_save_delay': 0.5,
+                'checkpoint_file': 'data/checkpoints.jsonl',
+                'checkpoint_interval': 30,
+                'resume_on_restart': True,
+                'stats_file': 'data/stats.db',
+                'stats_batch_size': 200,
+                'stats_flush_interval': 2
             },
             'curl_config': {
                 'file_path': 'curl_command.txt'
@@ -64,11 +509,17 @@ class ConfigManager:
                 'timeout': 30,
                 'retry_times': 3,
                 'retry_delay': '5-15',
-                'rate_limit': 10
+                'rate_limit': 10,
+                'global_rate_limit': 0,
+                'pool_connections': 10,
+                'pool_maxsize': 10
             },
             'notification': {
                 'enabled': True,
                 'include_statistics': True,
+                'channel_timeout': 10,
+                'total_timeout': 30,
+                'retry_times': 1,
                 'channels': []
             },
             'hack': {
@@ -82,7 +533,8 @@ class ConfigManager:
             'daemon': {
                 'enabled': False,
                 'session_interval': '120-180',
-                'max_daily_sessions': 12
+                'max_daily_sessions': 12,
+                'state_file': 'data/daemon_state.json'
             },
             'logging': {
                 'level': 'INFO',
@@ -90,30 +542,53 @@ class ConfigManager:
                 'file': 'logs/weread.log',
                 'max_size': '10MB',
                 'backup_count': 5,
+                'compress': True,
+                'buffer_size': 1000,
+                'queue_size': 10000,
+                'flush_interval': 1.0,
+                'batch_size': 100,
+                'index': True,
                 'console': True
             }
         }
     
     def get_config_dict(self) -> Dict[str, Any]:
         """获取配置字典"""
+        self._check_reload()
         return self.config
     
+    def validate(self, config_dict: Any) -> List[Dict[str, str]]:
+        """校验配置，返回错误列表（为空表示通过）"""
+        return self.validator.validate(config_dict)
+    
     def save_config(self, config_dict: Dict[str, Any]) -> Dict[str, Any]:
-        """保存配置到文件"""
+        """保存配置到文件（校验不通过时不写盘）"""
         try:
-            # 保存到YAML文件
-            with open(self.config_path, 'w', encoding='utf-8') as f:
-                yaml.dump(config_dict, f, default_flow_style=False, 
-                         allow_unicode=True, sort_keys=False)
-            
-            # 更新内存中的配置
-            self.config = config_dict
+            self.validator.check(config_dict)
+            with self._lock:
+                # 整份配置立即原子写入，同时取消待合并的写盘
+                if self._save_timer is not None:
+                    self._save_timer.cancel()
+                    self._save_timer = None
+                self._write_file(config_dict)
+                self._dirty = False
+                
+                # 更新内存中的配置并发布新快照
+                self.config = config_dict
+                self._publish()
+            self._notify()
             
             return {
                 'success': True,
                 'message': '配置已保存',
                 'path': self.config_path
             }
+        except ConfigValidationError as e:
+            return {
+                'success': False,
+                'error': str(e),
+                'errors': e.errors
+            }
         except Exception as e:
             return {
                 'success': False,
@@ -122,6 +597,7 @@ class ConfigManager:
     
     def get_config_value(self, path: str, default: Any = None) -> Any:
         """获取配置值（支持点号路径）"""
+        self._check_reload()
         keys = path.split('.')
         current = self.config
         
@@ -134,30 +610,39 @@ class ConfigManager:
         return current
     
     def set_config_value(self, path: str, value: Any) -> bool:
-        """设置配置值（支持点号路径）"""
+        """设置配置值（支持点号路径），立即生效，写盘在合并窗口结束后进行"""
         keys = path.split('.')
-        current = self.config
         
-        # 遍历到倒数第二个键
-        for key in keys[:-1]:
-            if key not in current:
-                current[key] = {}
-            current = current[key]
-        
-        # 设置最后的键
-        current[keys[-1]] = value
+        with self._lock:
+            current = self.config
+            # 遍历到倒数第二个键
+            for key in keys[:-1]:
+                if key not in current:
+                    current[key] = {}
+                current = current[key]
+            
+            # 设置最后的键
+            current[keys[-1]] = value
+            self._publish()
+        self._notify()
         
-        # 保存到文件
-        result = self.save_config(self.config)
-        return result.get('success', False)
+        # 合并写盘
+        self._schedule_save()
+        return True
     
     def reload_config(self) -> bool:
         """重新加载配置文件"""
         try:
-            self.config = self._load_config()
+            with self._lock:
+                self._mtime_ns = self._stat_mtime()
+                self.config = self._load_config()
+                self._publish()
+            self._notify()
+            CONFIG_RELOADS.inc(('manual', 'success'))
             return True
         except Exception as e:
             print(f"重新加载配置失败: {e}")
+            CONFIG_RELOADS.inc(('manual', 'failure'))
             return False
     
     def reset_config(self) -> Dict[str, Any]:
@@ -167,18 +652,21 @@ class ConfigManager:
         return self.config
     
     def merge_config(self, partial_config: Dict[str, Any]) -> bool:
-        """合并配置"""
-        def deep_merge(base, updates):
-            for key, value in updates.items():
-                if isinstance(value, dict) and key in base and isinstance(base[key], dict):
-                    deep_merge(base[key], value)
-                else:
-                    base[key] = value
+        """合并配置（JSON Merge Patch 语义：值为 None 的键被删除），写盘在合并窗口结束后进行
         
+        合并结果校验不通过时抛出 ConfigValidationError，当前配置保持不变。
+        """
         try:
-            deep_merge(self.config, partial_config)
-            result = self.save_config(self.config)
-            return result.get('success', False)
+            with self._lock:
+                merged = merge_patch(self.config, partial_config)
+                self.validator.check(merged)
+                self.config = merged
+                self._publish()
+            self._notify()
+            self._schedule_save()
+            return True
+        except ConfigValidationError:
+            raise
         except Exception as e:
             print(f"合并配置失败: {e}")
             return False
@@ -0,0 +1,485 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""配置校验
+
+config.yaml 的结构用下面的小型声明式 schema 描述，模块加载时一次性编译成嵌套的校验闭包
+（正则、枚举集合、字段表都在编译期准备好），校验时只做类型判断和查表。
+ConfigValidator 按顶层段落和单个用户缓存校验结果（以 marshal 序列化结果为键，不支持时退回 repr），
+只改动一个键的 PATCH 重新校验时，未变化的段落和用户直接命中缓存。
+"""
+
+import marshal
+import re
+import threading
+from typing import Any, Callable, Dict, Iterable, List, Mapping, Optional, Sequence, Tuple
+
+from .scheduler import validate_cron
+
+try:
+    from zoneinfo import available_timezones
+except ImportError:  # Python < 3.9
+    available_timezones = None
+
+# 校验函数签名：(值, 路径, 错误列表) -> None
+Validator = Callable[[Any, str, List[Dict[str, str]]], None]
+
+
+class ConfigValidationError(ValueError):
+    """配置未通过校验"""
+
+    def __init__(self, errors: List[Dict[str, str]]):
+        self.errors = errors
+        summary = '; '.join(f"{error['path']}: {error['message']}" for error in errors[:3])
+        if len(errors) > 3:
+            summary += f" 等 {len(errors)} 处错误"
+        super().__init__(f"配置验证失败: {summary}")
+
+
+def _join(path: str, key: Any) -> str:
+    if isinstance(key, int):
+        return f"{path}[{key}]"
+    return f"{path}.{key}" if path else str(key)
+
+
+def _error(errors: List[Dict[str, str]], path: str, message: str):
+    errors.append({'path': path, 'message': message})
+
+
+def _type_name(value: Any) -> str:
+    return type(value).__name__
+
+
+# ==================== schema 原语 ====================
+
+def any_value() -> Validator:
+    def validate(value, path, errors):
+        pass
+    return validate
+
+
+def boolean() -> Validator:
+    def validate(value, path, errors):
+        if not isinstance(value, bool):
+            _error(errors, path, f"应为布尔值，实际为 {_type_name(value)}")
+    return validate
+
+
+def number(minimum: Optional[float] = None, maximum: Optional[float] = None,
+           integer: bool = False) -> Validator:
+    kind = '整数' if integer else '数值'
+
+    def validate(value, path, errors):
+        if isinstance(value, bool) or not isinstance(value, (int, float)) \
+                or (integer and not isinstance(value, int)):
+            _error(errors, path, f"应为{kind}，实际为 {_type_name(value)}")
+        elif minimum is not None and value < minimum:
+            _error(errors, path, f"不能小于 {minimum:g}")
+        elif maximum is not None and value > maximum:
+            _error(errors, path, f"不能大于 {maximum:g}")
+    return validate
+
+
+def string(choices: Optional[Iterable[str]] = None, pattern: Optional[str] = None,
+           non_empty: bool = False, hint: str = '') -> Validator:
+    allowed = frozenset(choices) if choices is not None else None
+    regex = re.compile(pattern) if pattern else None
+    choices_text = ', '.join(sorted(allowed)) if allowed else ''
+
+    def validate(value, path, errors):
+        if not isinstance(value, str):
+            _error(errors, path, f"应为字符串，实际为 {_type_name(value)}")
+        elif non_empty and not value.strip():
+            _error(errors, path, "不能为空")
+        elif allowed is not None and value not in allowed:
+            _error(errors, path, f"无效取值 {value!r}，可选: {choices_text}")
+        elif regex is not None and not regex.match(value):
+            _error(errors, path, f"格式无效 {value!r}{'，' + hint if hint else ''}")
+    return validate
+
+
+_RANGE_RE = re.compile(r'^\s*(\d+(?:\.\d+)?)\s*(?:-\s*(\d+(?:\.\d+)?)\s*)?$')
+
+
+def range_value(minimum: float = 0) -> Validator:
+    """区间字符串 "30-48" 或单个非负数值（与 Range.parse 接受的格式一致）"""
+    def validate(value, path, errors):
+        if isinstance(value, bool):
+            _error(errors, path, "应为区间字符串（如 \"30-48\"）或数值")
+            return
+        if isinstance(value, (int, float)):
+            low = high = value
+        elif isinstance(value, str):
+            match = _RANGE_RE.match(value)
+            if not match:
+                _error(errors, path, f"区间格式无效 {value!r}，应为 \"最小值-最大值\" 或单个数值")
+                return
+            low = float(match.group(1))
+            high = float(match.group(2)) if match.group(2) is not None else low
+        else:
+            _error(errors, path, f"应为区间字符串或数值，实际为 {_type_name(value)}")
+            return
+        if low < minimum:
+            _error(errors, path, f"区间下限不能小于 {minimum:g}")
+        elif high < low:
+            _error(errors, path, f"区间上限 {high:g} 小于下限 {low:g}")
+    return validate
+
+
+def size_value() -> Validator:
+    """大小："10MB"、"512KB" 或字节数"""
+    regex = re.compile(r'^\s*(\d+(?:\.\d+)?)\s*([KMG]?B?)\s*$', re.IGNORECASE)
+
+    def validate(value, path, errors):
+        if isinstance(value, bool) or not isinstance(value, (int, float, str)):
+            _error(errors, path, f"应为大小（如 \"10MB\"），实际为 {_type_name(value)}")
+        elif isinstance(value, str) and not regex.match(value):
+            _error(errors, path, f"大小格式无效 {value!r}，应为 \"10MB\"、\"512KB\" 或字节数")
+        elif not isinstance(value, str) and value <= 0:
+            _error(errors, path, "必须大于 0")
+    return validate
+
+
+def cron_expression() -> Validator:
+    def validate(value, path, errors):
+        if not isinstance(value, str):
+            _error(errors, path, f"应为 cron 表达式字符串，实际为 {_type_name(value)}")
+            return
+        message = validate_cron(value)
+        if message:
+            _error(errors, path, message)
+    return validate
+
+
+def timezone() -> Validator:
+    # 系统没有时区数据库时（精简镜像且未安装 tzdata）只检查类型
+    known = available_timezones() if available_timezones is not None else set()
+
+    def validate(value, path, errors):
+        if not isinstance(value, str) or not value:
+            _error(errors, path, "应为时区名称（如 \"Asia/Shanghai\"）")
+        elif known and value not in known:
+            _error(errors, path, f"未知时区 {value!r}")
+    return validate
+
+
+def sequence(item: Validator) -> Validator:
+    def validate(value, path, errors):
+        if not isinstance(value, (list, tuple)):
+            _error(errors, path, f"应为列表，实际为 {_type_name(value)}")
+            return
+        for index, element in enumerate(value):
+            item(element, _join(path, index), errors)
+    return validate
+
+
+def mapping(fields: Mapping[str, Validator], required: Sequence[str] = (),
+            extra: bool = True) -> Validator:
+    """字典：按字段表校验已出现的键；extra=False 时拒绝未声明的键"""
+    field_items = tuple(fields.items())
+    required = tuple(required)
+
+    def validate(value, path, errors):
+        if not isinstance(value, Mapping):
+            _error(errors, path, f"应为对象，实际为 {_type_name(value)}")
+            return
+        for key in required:
+            if value.get(key) in (None, ''):
+                _error(errors, _join(path, key), "缺少必填项")
+        for key, validator in field_items:
+            field_value = value.get(key)
+            if field_value is not None:
+                validator(field_value, _join(path, key), errors)
+        if not extra:
+            for key in value:
+                if key not in fields:
+                    _error(errors, _join(path, key), "未知配置项")
+    return validate
+
+
+def one_of(*alternatives: Tuple[Callable[[Any], bool], Validator], message: str) -> Validator:
+    """按值的形态选择校验分支（如章节的字符串旧格式和对象新格式）"""
+    def validate(value, path, errors):
+        for accepts, validator in alternatives:
+            if accepts(value):
+                validator(value, path, errors)
+                return
+        _error(errors, path, message)
+    return validate
+
+
+# ==================== 配置结构 ====================
+
+_URL = r'^https?://\S+$'
+
+# 通道名称 -> (启用时必填的字段, 附加字段校验)
+CHANNEL_FIELDS: Dict[str, Tuple[Tuple[str, ...], Dict[str, Validator]]] = {
+    'pushplus': (('token',), {}),
+    'telegram': (('bot_token', 'chat_id'), {
+        'proxy': mapping({'http': string(), 'https': string()})
+    }),
+    'wxpusher': (('spt',), {}),
+    'apprise': (('url',), {'url': string(pattern=r'^\w[\w+.-]*://', hint='应为 Apprise URL')}),
+    'bark': (('device_key',), {'server': string(pattern=_URL, hint='应以 http(s):// 开头')}),
+    'ntfy': (('topic',), {'server': string(pattern=_URL, hint='应以 http(s):// 开头')}),
+    'feishu': (('webhook_url',), {
+        'webhook_url': string(pattern=_URL, hint='应以 http(s):// 开头'),
+        'msg_type': string(choices=('text', 'rich_text'))
+    }),
+    'wework': (('webhook_url',), {
+        'webhook_url': string(pattern=_URL, hint='应以 http(s):// 开头'),
+        'msg_type': string(choices=('text', 'markdown', 'news'))
+    }),
+    'dingtalk': (('webhook_url',), {
+        'webhook_url': string(pattern=_URL, hint='应以 http(s):// 开头'),
+        'msg_type': string(choices=('text', 'markdown', 'link'))
+    }),
+    'gotify': (('server', 'token'), {
+        'server': string(pattern=_URL, hint='应以 http(s):// 开头'),
+        'priority': number(1, 10, integer=True)
+    }),
+    'serverchan3': (('uid', 'sendkey'), {}),
+    'pushdeer': (('pushkey',), {'type': string(choices=('text', 'markdown'))}),
+}
+
+
+_CHANNEL_CONFIGS: Dict[str, Validator] = {
+    name: mapping(fields, required=required) for name, (required, fields) in CHANNEL_FIELDS.items()
+}
+# 禁用的通道允许保留模板里的占位值
+_DISABLED_CHANNEL_CONFIG = mapping({})
+_CHANNEL_BASE = mapping({'name': string(), 'enabled': boolean()}, required=('name',))
+
+
+def _channel(value, path, errors):
+    before = len(errors)
+    _CHANNEL_BASE(value, path, errors)
+    if len(errors) > before:
+        return
+    name = value['name']
+    validator = _CHANNEL_CONFIGS.get(name)
+    if validator is None:
+        _error(errors, _join(path, 'name'),
+               f"不支持的通知通道 {name!r}，可选: {', '.join(CHANNEL_FIELDS)}")
+        return
+    if not value.get('enabled', True):
+        validator = _DISABLED_CHANNEL_CONFIG
+    validator(value.get('config') or {}, _join(path, 'config'), errors)
+
+
+def _chapter_object(value, path, errors):
+    before = len(errors)
+    _CHAPTER_FIELDS(value, path, errors)
+    if len(errors) == before and not (value.get('chapter_id') or value.get('id')):
+        _error(errors, path, "缺少 chapter_id（或 id）")
+
+
+_CHAPTER_FIELDS = mapping({
+    'chapter_id': string(non_empty=True),
+    'id': string(non_empty=True),
+    'chapter_index': number(0, integer=True),
+    'index': number(0, integer=True),
+})
+
+# 章节支持旧格式（章节ID字符串）和新格式（chapter_id/id + 可选 chapter_index/index）
+_chapter = one_of(
+    (lambda value: isinstance(value, str), string(non_empty=True)),
+    (lambda value: isinstance(value, Mapping), _chapter_object),
+    message="章节应为章节ID字符串或包含 chapter_id 的对象"
+)
+
+_book = mapping({
+    'name': string(),
+    'book_id': string(non_empty=True),
+    'chapters': sequence(_chapter),
+}, required=('book_id',))
+
+_READING_FIELDS = {
+    'mode': string(choices=('smart_random', 'sequential', 'pure_random')),
+    'target_duration': range_value(),
+    'reading_interval': range_value(),
+    'use_curl_data_first': boolean(),
+    'fallback_to_config': boolean(),
+}
+
+_probability = number(0, 1)
+
+_SCHEDULE = mapping({
+    'enabled': boolean(),
+    'cron_expression': cron_expression(),
+    'timezone': timezone(),
+})
+
+SECTIONS: Dict[str, Validator] = {
+    'app': mapping({
+        'name': string(),
+        'version': any_value(),
+        'startup_mode': string(choices=('immediate', 'scheduled', 'daemon')),
+        'startup_delay': range_value(),
+        'engine_workers': number(1, integer=True),
+        'max_concurrent_tasks': number(1, integer=True),
+        'config_reload_interval': number(0),
+        'config_save_delay': number(0),
+        'checkpoint_file': string(non_empty=True),
+        'checkpoint_interval': number(0),
+        'resume_on_restart': boolean(),
+        'stats_file': string(non_empty=True),
+        'stats_batch_size': number(1, integer=True),
+        'stats_flush_interval': number(0),
+    }),
+    'curl_config': mapping({'file_path': string()}),
+    'reading': mapping(dict(_READING_FIELDS, **{
+        'books': sequence(_book),
+        'smart_random': mapping({
+            'book_continuity': _probability,
+            'chapter_continuity': _probability,
+            'book_switch_cooldown': number(0),
+        }),
+    })),
+    'human_simulation': mapping({
+        'enabled': boolean(),
+        'reading_speed_variation': boolean(),
+        'break_probability': _probability,
+        'break_duration': range_value(),
+        'rotate_user_agent': boolean(),
+    }),
+    'network': mapping({
+        'timeout': number(0.1),
+        'retry_times': number(0, integer=True),
+        'retry_delay': range_value(),
+        'rate_limit': number(0),
+        'global_rate_limit': number(0),
+        'pool_connections': number(1, integer=True),
+        'pool_maxsize': number(1, integer=True),
+    }),
+    'notification': mapping({
+        'enabled': boolean(),
+        'include_statistics': boolean(),
+        'channel_timeout': number(0.1),
+        'total_timeout': number(0.1),
+        'retry_times': number(0, integer=True),
+        'channels': sequence(_channel),
+    }),
+    'hack': mapping({'cookie_refresh_ql': boolean()}),
+    'schedule': _SCHEDULE,
+    'daemon': mapping({
+        'enabled': boolean(),
+        'session_interval': range_value(),
+        'max_daily_sessions': number(1, integer=True),
+        'state_file': string(non_empty=True),
+    }),
+    'logging': mapping({
+        'level': string(choices=('DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL')),
+        'format': string(choices=('simple', 'detailed', 'json')),
+        'file': string(non_empty=True),
+        'max_size': size_value(),
+        'backup_count': number(0, integer=True),
+        'compress': boolean(),
+        'buffer_size': number(1, integer=True),
+        'queue_size': number(1, integer=True),
+        'flush_interval': number(0.01),
+        'batch_size': number(1, integer=True),
+        'index': boolean(),
+        'console': boolean(),
+    }),
+}
+
+# name 可省略：未命名的用户按位置命名为 user1、user2 ...（见 config_manager.user_entries）
+USER: Validator = mapping({
+    'name': string(),
+    'file_path': string(),
+    'reading_overrides': mapping(_READING_FIELDS),
+    # 用户自己的定时（cron_expression/timezone 覆盖全局，enabled: false 表示不参与定时）
+    'schedule': _SCHEDULE,
+})
+
+
+def _cache_key(value: Any):
+    """内容相同则键相同（marshal 保留字典顺序，比 repr 快一个数量级）"""
+    try:
+        return marshal.dumps(value)
+    except ValueError:
+        return repr(value)
+
+
+class ConfigValidator:
+    """带增量缓存的配置校验器
+
+    顶层段落按内容缓存上一次的结果；curl_config.users 拆开按单个用户缓存，
+    用户列表很长时修改其中一人也只重新校验这一人。
+    """
+
+    def __init__(self, sections: Optional[Mapping[str, Validator]] = None,
+                 user_validator: Validator = USER, user_cache_size: int = 4096):
+        self.sections = dict(sections or SECTIONS)
+        self.user_validator = user_validator
+        self.user_cache_size = user_cache_size
+        self._section_cache: Dict[str, Tuple[Any, List[Dict[str, str]]]] = {}
+        self._user_cache: Dict[Any, List[Dict[str, str]]] = {}
+        self._lock = threading.Lock()
+
+    def _section_errors(self, name: str, value: Any) -> List[Dict[str, str]]:
+        key = _cache_key(value)
+        cached = self._section_cache.get(name)
+        if cached is not None and cached[0] == key:
+            return cached[1]
+        errors: List[Dict[str, str]] = []
+        self.sections[name](value, name, errors)
+        self._section_cache[name] = (key, errors)
+        return errors
+
+    def _user_errors(self, user: Any) -> List[Dict[str, str]]:
+        """单个用户的错误（路径相对于该用户）"""
+        key = _cache_key(user)
+        errors = self._user_cache.get(key)
+        if errors is None:
+            errors = []
+            self.user_validator(user, '', errors)
+            if len(self._user_cache) >= self.user_cache_size:
+                self._user_cache.clear()
+            self._user_cache[key] = errors
+        return errors
+
+    def _users_errors(self, users: Any) -> List[Dict[str, str]]:
+        path = 'curl_config.users'
+        if not isinstance(users, (list, tuple)):
+            return [{'path': path, 'message': f"应为列表，实际为 {_type_name(users)}"}]
+        errors = []
+        seen = set()
+        for index, user in enumerate(users):
+            prefix = _join(path, index)
+            for error in self._user_errors(user):
+                errors.append({
+                    'path': f"{prefix}.{error['path']}" if error['path'] else prefix,
+                    'message': error['message']
+                })
+            if not isinstance(user, Mapping):
+                continue
+            # 按生效的用户名判重，显式名称也不能与自动命名冲突
+            name = user.get('name') or f"user{index + 1}"
+            if isinstance(name, str):
+                if name in seen:
+                    _error(errors, _join(prefix, 'name'), f"用户名 {name!r} 重复")
+                seen.add(name)
+        return errors
+
+    def validate(self, config: Any) -> List[Dict[str, str]]:
+        """校验整份配置，返回错误列表（为空表示通过）"""
+        if not isinstance(config, Mapping):
+            return [{'path': '', 'message': f"配置应为对象，实际为 {_type_name(config)}"}]
+        errors: List[Dict[str, str]] = []
+        with self._lock:
+            for name in self.sections:
+                value = config.get(name)
+                if value is not None:
+                    errors.extend(self._section_errors(name, value))
+            users = (config.get('curl_config') or {}).get('users') \
+                if isinstance(config.get('curl_config'), Mapping) else None
+            if users is not None:
+                errors.extend(self._users_errors(users))
+        return errors
+
+    def check(self, config: Any):
+        """校验失败时抛出 ConfigValidationError"""
+        errors = self.validate(config)
+        if errors:
+            raise ConfigValidationError(errors)
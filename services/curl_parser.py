@@ -0,0 +1,288 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""CURL 命令解析服务
+
+把浏览器 "Copy as cURL (bash)" 得到的命令解析为紧凑的请求模板，
+并按 (路径, mtime, 大小) 缓存解析结果，多个用户、多次会话共用同一文件时不会重复解析。
+"""
+
+import json
+import os
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+from .http_client import parse_cookie_header
+
+
+class CurlParseError(ValueError):
+    """CURL 命令无法解析"""
+
+
+# 带参数的 curl 选项
+_HEADER_OPTS = {'-H', '--header'}
+_DATA_OPTS = {'-d', '--data', '--data-raw', '--data-binary', '--data-ascii', '--json'}
+_COOKIE_OPTS = {'-b', '--cookie'}
+_METHOD_OPTS = {'-X', '--request'}
+_VALUE_OPTS = {
+    '-u', '--user', '-x', '--proxy', '-o', '--output', '-m', '--max-time', '--connect-timeout'
+}
+
+# 不应随会话复用的请求头
+_SKIP_HEADERS = {'content-length', 'host', 'connection', 'cookie'}
+
+# $'...' 中的单字符转义
+_ANSI_C_ESCAPES = {
+    'a': '\a', 'b': '\b', 'e': '\x1b', 'E': '\x1b', 'f': '\f', 'n': '\n', 'r': '\r',
+    't': '\t', 'v': '\v', '\\': '\\', "'": "'", '"': '"', '?': '?'
+}
+# $'...' 中的数字转义：前缀 -> (进制, 最多位数)
+_ANSI_C_NUMERIC = {'x': (16, 2), 'u': (16, 4), 'U': (16, 8)}
+_HEX_DIGITS = set('0123456789abcdefABCDEF')
+
+
+class CurlTemplate:
+    """CURL 请求模板"""
+
+    __slots__ = ('method', 'url', 'headers', 'cookies', 'body', 'json_body', 'book_id', 'chapter_id')
+
+    def __init__(self, method: str, url: str, headers: Dict[str, str],
+                 cookies: Dict[str, str], body: Optional[str]):
+        self.method = method
+        self.url = url
+        self.headers = headers
+        self.cookies = cookies
+        self.body = body
+        self.json_body: Optional[Dict[str, Any]] = None
+        self.book_id: Optional[str] = None
+        self.chapter_id: Optional[str] = None
+
+        if body:
+            try:
+                parsed = json.loads(body)
+                if isinstance(parsed, dict):
+                    self.json_body = parsed
+            except ValueError:
+                pass
+
+        # 书籍和章节ID：优先取请求体中的 b/c，其次取 URL 查询参数
+        if self.json_body:
+            self.book_id = self.json_body.get('b') or None
+            self.chapter_id = self.json_body.get('c') or None
+        query = parse_qs(urlsplit(url).query)
+        self.book_id = self.book_id or (query.get('bookId') or [None])[0]
+        self.chapter_id = self.chapter_id or (query.get('chapterUid') or [None])[0]
+
+    def summary(self) -> Dict[str, Any]:
+        """不含敏感值的模板摘要"""
+        return {
+            'method': self.method,
+            'url': self.url,
+            'headers': sorted(self.headers),
+            'cookies': sorted(self.cookies),
+            'has_json_body': self.json_body is not None,
+            'book_id': self.book_id,
+            'chapter_id': self.chapter_id
+        }
+
+
+def _ansi_c_quoted(command: str, index: int) -> Tuple[str, int]:
+    """解析 $'...' 的内容（index 指向开头的 $），返回 (文本, 结束引号之后的位置)
+
+    Chrome "Copy as cURL (bash)" 在值含有单引号、换行或非 ASCII 字符时使用这种引用，
+    \\uXXXX 按 UTF-16 码元输出，相邻的代理对在最后合并。
+    """
+    chars: List[str] = []
+    index += 2
+    while index < len(command):
+        char = command[index]
+        if char == "'":
+            text = ''.join(chars)
+            return text.encode('utf-16', 'surrogatepass').decode('utf-16', 'surrogatepass'), index + 1
+        if char != '\\' or index + 1 >= len(command):
+            chars.append(char)
+            index += 1
+            continue
+        escape = command[index + 1]
+        index += 2
+        if escape in _ANSI_C_ESCAPES:
+            chars.append(_ANSI_C_ESCAPES[escape])
+        elif escape in _ANSI_C_NUMERIC:
+            base, width = _ANSI_C_NUMERIC[escape]
+            digits = ''
+            while len(digits) < width and index < len(command) and command[index] in _HEX_DIGITS:
+                digits += command[index]
+                index += 1
+            chars.append(chr(int(digits, base)) if digits else '\\' + escape)
+        elif escape in '01234567':
+            digits = escape
+            while len(digits) < 3 and index < len(command) and command[index] in '01234567':
+                digits += command[index]
+                index += 1
+            chars.append(chr(int(digits, 8)))
+        else:
+            chars.append('\\' + escape)
+    raise CurlParseError("CURL命令格式错误: $'...' 缺少结束引号")
+
+
+def _tokenize(command: str) -> List[str]:
+    """按 bash 规则切分命令：单引号、双引号、反斜杠转义以及 $'...' ANSI-C 引用"""
+    # 合并 bash 续行符
+    command = command.replace('\\\r\n', ' ').replace('\\\n', ' ')
+    tokens: List[str] = []
+    current: List[str] = []
+    in_token = False
+    index, length = 0, len(command)
+    while index < length:
+        char = command[index]
+        if char.isspace():
+            if in_token:
+                tokens.append(''.join(current))
+                current, in_token = [], False
+            index += 1
+            continue
+        in_token = True
+        if char == "'":
+            end = command.find("'", index + 1)
+            if end < 0:
+                raise CurlParseError('CURL命令格式错误: 单引号未闭合')
+            current.append(command[index + 1:end])
+            index = end + 1
+        elif char == '$' and command.startswith("$'", index):
+            text, index = _ansi_c_quoted(command, index)
+            current.append(text)
+        elif char == '"':
+            index += 1
+            while True:
+                if index >= length:
+                    raise CurlParseError('CURL命令格式错误: 双引号未闭合')
+                char = command[index]
+                if char == '"':
+                    index += 1
+                    break
+                # 双引号内反斜杠只转义 $ ` " \\
+                if char == '\\' and index + 1 < length and command[index + 1] in '$`"\\':
+                    current.append(command[index + 1])
+                    index += 2
+                else:
+                    current.append(char)
+                    index += 1
+        elif char == '\\':
+            if index + 1 < length:
+                current.append(command[index + 1])
+            index += 2
+        else:
+            current.append(char)
+            index += 1
+    if in_token:
+        tokens.append(''.join(current))
+    return tokens
+
+
+def parse_curl_command(command: str) -> CurlTemplate:
+    """解析 curl bash 命令"""
+    tokens = _tokenize(command.strip())
+    if not tokens or tokens[0] != 'curl':
+        raise CurlParseError('不是有效的curl命令')
+
+    method = None
+    url = None
+    headers: Dict[str, str] = {}
+    cookies: Dict[str, str] = {}
+    data: List[str] = []
+
+    index = 1
+    while index < len(tokens):
+        token = tokens[index]
+        value = tokens[index + 1] if index + 1 < len(tokens) else None
+
+        if token in _HEADER_OPTS and value is not None:
+            name, _, header_value = value.partition(':')
+            name, header_value = name.strip(), header_value.strip()
+            if name.lower() == 'cookie':
+                cookies.update(parse_cookie_header(header_value))
+            elif name.lower() not in _SKIP_HEADERS:
+                headers[name] = header_value
+            index += 2
+        elif token in _DATA_OPTS and value is not None:
+            data.append(value)
+            if token == '--json':
+                headers.setdefault('Content-Type', 'application/json')
+            index += 2
+        elif token in _COOKIE_OPTS and value is not None:
+            cookies.update(parse_cookie_header(value))
+            index += 2
+        elif token in _METHOD_OPTS and value is not None:
+            method = value.upper()
+            index += 2
+        elif token in ('-A', '--user-agent') and value is not None:
+            headers['User-Agent'] = value
+            index += 2
+        elif token in ('-e', '--referer') and value is not None:
+            headers['Referer'] = value
+            index += 2
+        elif token == '--url' and value is not None:
+            url = value
+            index += 2
+        elif token in _VALUE_OPTS:
+            index += 2
+        elif token.startswith('-'):
+            # --compressed、-s、-k 等无参数选项
+            index += 1
+        else:
+            url = url or token
+            index += 1
+
+    if not url:
+        raise CurlParseError('CURL命令中未找到URL')
+
+    body = '&'.join(data) if data else None
+    return CurlTemplate(method or ('POST' if body else 'GET'), url, headers, cookies, body)
+
+
+class CurlParserCache:
+    """按文件 (路径, mtime, 大小) 缓存的 CURL 模板"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries: Dict[str, Tuple[Tuple[int, int], CurlTemplate]] = {}
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _key(path: str) -> str:
+        return os.path.abspath(path)
+
+    def get(self, path: str) -> Optional[CurlTemplate]:
+        """获取文件对应的模板，文件不存在时返回 None"""
+        key = self._key(path)
+        try:
+            stat = os.stat(key)
+        except OSError:
+            self.invalidate(path)
+            return None
+        signature = (stat.st_mtime_ns, stat.st_size)
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == signature:
+                self.hits += 1
+                return entry[1]
+
+        with open(key, 'r', encoding='utf-8') as f:
+            template = parse_curl_command(f.read())
+
+        with self._lock:
+            self.misses += 1
+            self._entries[key] = (signature, template)
+        return template
+
+    def invalidate(self, path: str):
+        """使单个文件的缓存失效"""
+        with self._lock:
+            self._entries.pop(self._key(path), None)
+
+    def get_stats(self) -> Dict[str, int]:
+        """缓存统计"""
+        with self._lock:
+            return {'entries': len(self._entries), 'hits': self.hits, 'misses': self.misses}
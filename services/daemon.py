@@ -0,0 +1,308 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""守护进程模式
+
+每个用户一条会话链：一次阅读会话结束后，按 daemon.session_interval（分钟）随机休眠，再开始下一次，
+当天的会话数达到 daemon.max_daily_sessions 后休眠到次日。
+休眠中的用户只是调度器堆里的一个一次性定时器，不占用线程；
+每日计数和下一次唤醒时间保存在磁盘上，进程重启后继续生效。
+"""
+
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from typing import Any, Dict, List, Mapping, Optional
+
+from .config_manager import ConfigManager, ConfigSnapshot, user_entries
+from .log_manager import LogManager
+from .task_manager import TaskManager
+from .task_registry import TaskAdmissionError, TaskHandle
+from .user_settings import Range
+
+# 当天配额用完后，次日零点之后在这个时间窗口（秒）内随机唤醒，避免所有账号同时开始
+_MIDNIGHT_SPREAD = 1800
+# 未能启动（如用户已有手动启动的任务）时的重试间隔（秒），连续失败时逐次翻倍，不超过上限
+_RETRY_DELAY = 60
+_MAX_RETRY_DELAY = 1800
+
+
+class DaemonStateStore:
+    """守护进程状态的磁盘存储
+
+    结构为 {用户: {'date': 'YYYY-MM-DD', 'count': 当天会话数, 'next_run': 下一次唤醒时间戳}}，
+    每次变化后写临时文件再原子替换。
+    """
+
+    def __init__(self, path: str):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._state: Dict[str, Dict[str, Any]] = self._load()
+
+    def _load(self) -> Dict[str, Dict[str, Any]]:
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+            return state if isinstance(state, dict) else {}
+        except (OSError, ValueError):
+            return {}
+
+    def _save(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(prefix=f'.{self.path.name}.', suffix='.tmp',
+                                        dir=str(self.path.parent))
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(self._state, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+            raise
+
+    def sessions_today(self, user: str, today: date) -> int:
+        """用户当天已完成的会话数"""
+        entry = self._state.get(user) or {}
+        return int(entry.get('count', 0)) if entry.get('date') == today.isoformat() else 0
+
+    def record_session(self, user: str, today: date) -> int:
+        """记录一次会话，返回当天累计数"""
+        with self._lock:
+            count = self.sessions_today(user, today) + 1
+            entry = self._state.setdefault(user, {})
+            entry['date'] = today.isoformat()
+            entry['count'] = count
+            self._save()
+            return count
+
+    def next_run(self, user: str) -> Optional[float]:
+        return (self._state.get(user) or {}).get('next_run')
+
+    def set_next_run(self, user: str, when: Optional[float]):
+        with self._lock:
+            entry = self._state.setdefault(user, {})
+            if entry.get('next_run') == when:
+                return
+            entry['next_run'] = when
+            self._save()
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            return {user: dict(entry) for user, entry in self._state.items()}
+
+
+class DaemonSupervisor:
+    """守护进程调度：为每个用户串联阅读会话并执行每日配额
+
+    daemon.enabled 为 true（或 startup_mode 为 daemon）时生效。唤醒定时器放在 TaskManager 的调度器里，
+    会话结束由任务注册表回调通知；手动停止的用户不再自动续期，直到守护进程重新启用或进程重启。
+    会话链的任务不占用 app.max_concurrent_tasks 名额，所有用户都能同时阅读。
+    用户已有运行中的任务（如从检查点恢复的任务）时接管该任务：结束后同样计入配额并按间隔续期。
+    构造后需调用 start() 才开始调度。
+    """
+
+    def __init__(self, task_manager: TaskManager, config_manager: ConfigManager,
+                 log_manager: LogManager, state_file: Optional[str] = None):
+        self.task_manager = task_manager
+        self.config_manager = config_manager
+        self.log_manager = log_manager
+        self.scheduler = task_manager.scheduler
+        self.store = DaemonStateStore(
+            state_file or config_manager.get_config_value('daemon.state_file', 'data/daemon_state.json')
+        )
+        self.enabled = False
+        self.interval = Range(120, 180)
+        self.max_daily_sessions = 12
+        self.registry = task_manager.registry
+        self._users: Dict[str, bool] = {}
+        # 守护进程负责的任务：{任务ID: [用户]}
+        self._tasks: Dict[str, List[str]] = {}
+        self._suspended = set()
+        # 连续启动失败次数，用于退避
+        self._failures: Dict[str, int] = {}
+        self._started = False
+        self._lock = threading.RLock()
+        task_manager.registry.add_listener(self._on_task_finished)
+        config_manager.add_listener(self._on_config_published)
+
+    def start(self):
+        """按当前配置开始调度"""
+        self._started = True
+        self.sync(self.config_manager.snapshot().data)
+
+    @staticmethod
+    def _job_id(user: str) -> str:
+        return f'daemon:{user}'
+
+    def _on_config_published(self, snapshot: ConfigSnapshot):
+        if self._started:
+            self.sync(snapshot.data)
+
+    def sync(self, config: Mapping[str, Any]):
+        """按配置启用/停用守护进程，并为新增用户建立会话链、移除已删除用户的定时器"""
+        daemon_config = config.get('daemon') or {}
+        app_config = config.get('app') or {}
+        enabled = bool(daemon_config.get('enabled')) or app_config.get('startup_mode') == 'daemon'
+        users = [name for name, _ in user_entries(config)] or ['default']
+
+        with self._lock:
+            self.interval = Range.parse(daemon_config.get('session_interval', '120-180'), 150)
+            self.max_daily_sessions = int(daemon_config.get('max_daily_sessions', 12) or 0)
+            if not enabled:
+                if self.enabled:
+                    self.log_manager.info("🌙 守护进程模式已关闭")
+                for user in self._users:
+                    self.scheduler.remove(self._job_id(user))
+                self._users.clear()
+                self._suspended.clear()
+                self._failures.clear()
+                self.enabled = False
+                return
+
+            if not self.enabled:
+                self.log_manager.info(
+                    f"🌙 守护进程模式已启用: {len(users)} 个用户, 会话间隔 "
+                    f"{self.interval.low:g}-{self.interval.high:g} 分钟, 每日最多 {self.max_daily_sessions} 次"
+                )
+            self.enabled = True
+            for user in list(self._users):
+                if user not in users:
+                    self.scheduler.remove(self._job_id(user))
+                    del self._users[user]
+                    self._failures.pop(user, None)
+            for user in users:
+                if user not in self._users:
+                    self._users[user] = True
+                    if not self._adopt_running(user):
+                        self._schedule(user, self._first_run(user))
+        self.scheduler.start()
+
+    def _first_run(self, user: str) -> float:
+        """启用时的首次唤醒：沿用持久化的唤醒时间，否则立即开始（当天配额已满时为次日）"""
+        now = time.time()
+        stored = self.store.next_run(user)
+        if stored and stored > now:
+            return stored
+        return self._next_run(user, now)
+
+    def _next_run(self, user: str, now: float) -> float:
+        today = datetime.fromtimestamp(now).date()
+        if self.max_daily_sessions and self.store.sessions_today(user, today) >= self.max_daily_sessions:
+            midnight = datetime.combine(today + timedelta(days=1), datetime.min.time()).timestamp()
+            return midnight + random.uniform(0, _MIDNIGHT_SPREAD)
+        return now
+
+    def _schedule(self, user: str, when: float):
+        self.store.set_next_run(user, when)
+        self.scheduler.call_at(
+            self._job_id(user), when, lambda: self._wake(user), payload=(user,)
+        )
+
+    def _adopt_running(self, user: str) -> bool:
+        """用户已有运行中的任务时接管它（调用方持有锁），返回是否接管"""
+        handle = self.registry.find_by_user(user)
+        if handle is None or not handle.is_running:
+            return False
+        users = self._tasks.setdefault(handle.task_id, [])
+        if user not in users:
+            users.append(user)
+            self.scheduler.remove(self._job_id(user))
+            self.store.set_next_run(user, None)
+            self.log_manager.info(f"🌙 [{user}] 守护进程接管运行中的任务: {handle.task_id}")
+        return True
+
+    def _wake(self, user: str):
+        """定时器到期：配额允许时为该用户启动一次阅读任务"""
+        with self._lock:
+            if not self.enabled or user not in self._users or user in self._suspended:
+                return
+            if self._adopt_running(user):
+                return
+            now = time.time()
+            when = self._next_run(user, now)
+            if when > now:
+                self.log_manager.info(f"🌙 [{user}] 今日会话数已达上限 {self.max_daily_sessions}，明日继续")
+                self._schedule(user, when)
+                return
+            try:
+                handle = self.task_manager.start_task(
+                    users=[user] if user != 'default' else None, counted=False
+                )
+            except TaskAdmissionError as e:
+                failures = self._failures[user] = self._failures.get(user, 0) + 1
+                delay = min(_MAX_RETRY_DELAY, _RETRY_DELAY * 2 ** min(failures - 1, 10))
+                self.log_manager.warning(f"⚠️ [{user}] 守护进程未能启动会话: {e}，{delay} 秒后重试")
+                self._schedule(user, now + delay)
+                return
+            self._failures.pop(user, None)
+            self._tasks[handle.task_id] = [user]
+            self.store.set_next_run(user, None)
+            self.log_manager.info(f"🌙 [{user}] 守护进程启动会话: {handle.task_id}")
+
+    def _on_task_finished(self, handle: TaskHandle):
+        """任务结束回调（通常在事件循环线程上）：写状态文件的处理放到引擎线程池执行"""
+        self.task_manager.engine.submit_blocking(self._handle_task_finished, handle)
+
+    def _handle_task_finished(self, handle: TaskHandle):
+        """在线程池中处理任务结束（线程池不会报告异常，这里记入日志）"""
+        try:
+            self._settle_task(handle)
+        except Exception as e:
+            self.log_manager.error(f"❌ 守护进程处理任务结束失败: {handle.task_id}: {e}")
+
+    def _settle_task(self, handle: TaskHandle):
+        """守护进程启动的任务结束后记入当天配额，并安排下一次会话"""
+        with self._lock:
+            users = self._tasks.pop(handle.task_id, None)
+            if not users or not self.enabled:
+                return
+            for user in users:
+                if user in self._users:
+                    self._continue_chain(user, handle)
+
+    def _continue_chain(self, user: str, handle: TaskHandle):
+        """一次会话结束：计入当天配额并安排下一次（调用方持有锁）"""
+        if handle.status == 'stopped':
+            self._suspended.add(user)
+            self.log_manager.info(f"🌙 [{user}] 会话被手动停止，守护进程不再自动续期")
+            return
+
+        today = date.today()
+        count = self.store.record_session(user, today)
+        now = time.time()
+        when = self._next_run(user, now)
+        if when == now:
+            when = now + self.interval.sample() * 60
+        self._schedule(user, when)
+        self.log_manager.info(
+            f"🌙 [{user}] 今日第 {count} 次会话结束，下一次: "
+            f"{datetime.fromtimestamp(when).strftime('%Y-%m-%d %H:%M:%S')}"
+        )
+
+    def get_status(self) -> Dict[str, Any]:
+        """守护进程状态：每个用户的当天会话数和下一次唤醒时间"""
+        today = date.today()
+        running = {user: task_id for task_id, users in self._tasks.items() for user in users}
+        users = []
+        for user in list(self._users):
+            job = self.scheduler.get(self._job_id(user))
+            users.append({
+                'user': user,
+                'sessions_today': self.store.sessions_today(user, today),
+                'running_task': running.get(user),
+                'suspended': user in self._suspended,
+                'next_run': datetime.fromtimestamp(job.next_fire).isoformat()
+                if job is not None and job.next_fire else None
+            })
+        return {
+            'enabled': self.enabled,
+            'session_interval': [self.interval.low, self.interval.high],
+            'max_daily_sessions': self.max_daily_sessions,
+            'users': users
+        }
@@ -0,0 +1,35 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""事件通知
+
+LogManager 写入日志、任务发布新的状态快照时调用 notify，
+SSE 推送线程在 wait 上阻塞，有新事件时才被唤醒去拉取增量。
+"""
+
+import threading
+from typing import Optional
+
+
+class EventBus:
+    """以递增代号唤醒等待者的事件总线"""
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._generation = 0
+
+    @property
+    def generation(self) -> int:
+        """当前代号，每次 notify 加一"""
+        return self._generation
+
+    def notify(self):
+        """发布事件，唤醒所有等待者"""
+        with self._cond:
+            self._generation += 1
+            self._cond.notify_all()
+
+    def wait(self, generation: int, timeout: Optional[float] = None) -> int:
+        """等待代号变化（或超时），返回最新代号"""
+        with self._cond:
+            self._cond.wait_for(lambda: self._generation != generation, timeout)
+            return self._generation
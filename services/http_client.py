@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""HTTP 传输层
+
+所有出站请求（微信读书阅读请求、通知推送）共用的连接池：
+- 通知等公共流量走一个共享会话，按主机复用长连接
+- 每个用户一个独立的 keep-alive 会话，携带该用户 curl 模板中的 Cookie 和请求头
+- 统计连接池命中（复用连接）与未命中（新建连接）次数：在 urllib3 连接池取连接时计数，
+  多个线程共用同一个连接池时也不会互相干扰
+"""
+
+import threading
+from typing import Any, Dict, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+
+def parse_cookie_header(cookie_str: str) -> Dict[str, str]:
+    """解析 'k1=v1; k2=v2' 格式的 Cookie 字符串"""
+    cookies = {}
+    for item in cookie_str.split(';'):
+        if '=' in item:
+            key, value = item.split('=', 1)
+            cookies[key.strip()] = value.strip()
+    return cookies
+
+
+class PoolStats:
+    """连接池统计"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+
+    def record_request(self, error: bool = False):
+        with self._lock:
+            self.requests += 1
+            if error:
+                self.errors += 1
+
+    def record_connection(self, new_connection: bool):
+        """一次从连接池取连接（重试和重定向各算一次）"""
+        with self._lock:
+            if new_connection:
+                self.misses += 1
+            else:
+                self.hits += 1
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            checkouts = self.hits + self.misses
+            return {
+                'requests': self.requests,
+                'hits': self.hits,
+                'misses': self.misses,
+                'errors': self.errors,
+                'hit_rate': round(self.hits / checkouts, 4) if checkouts else 0.0
+            }
+
+
+class _TrackedPoolMixin:
+    """取连接时计数的 urllib3 连接池：拿到仍然连着的池内连接为命中，新建或断开后重连的为未命中"""
+
+    pool_stats: Optional[PoolStats] = None
+
+    def _get_conn(self, timeout=None):
+        conn = super()._get_conn(timeout)
+        if self.pool_stats is not None:
+            self.pool_stats.record_connection(getattr(conn, 'sock', None) is None)
+        return conn
+
+
+class _TrackedHTTPConnectionPool(_TrackedPoolMixin, HTTPConnectionPool):
+    pass
+
+
+class _TrackedHTTPSConnectionPool(_TrackedPoolMixin, HTTPSConnectionPool):
+    pass
+
+
+class _PooledAdapter(HTTPAdapter):
+    """连接池换成计数版本的适配器（每个适配器一组绑定了统计对象的连接池类）"""
+
+    def __init__(self, stats: PoolStats, **kwargs):
+        self._stats = stats
+        self._pool_classes = {
+            'http': type('TrackedHTTPConnectionPool', (_TrackedHTTPConnectionPool,), {'pool_stats': stats}),
+            'https': type('TrackedHTTPSConnectionPool', (_TrackedHTTPSConnectionPool,), {'pool_stats': stats})
+        }
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = self._pool_classes
+
+    def send(self, request, **kwargs):
+        error = False
+        try:
+            return super().send(request, **kwargs)
+        except Exception:
+            error = True
+            raise
+        finally:
+            self._stats.record_request(error)
+
+
+class HttpTransport:
+    """带连接池的 HTTP 传输层"""
+
+    def __init__(self, pool_connections: int = 10, pool_maxsize: int = 10,
+                 timeout: float = 30):
+        self.pool_connections = max(1, int(pool_connections))
+        self.pool_maxsize = max(1, int(pool_maxsize))
+        self.timeout = timeout
+        self.stats = PoolStats()
+        self._lock = threading.Lock()
+        self._shared = self._new_session()
+        self._users: Dict[str, requests.Session] = {}
+
+    @classmethod
+    def from_config(cls, network_config: Dict[str, Any]) -> 'HttpTransport':
+        """根据 network 配置创建"""
+        return cls(
+            pool_connections=network_config.get('pool_connections', 10),
+            pool_maxsize=network_config.get('pool_maxsize', 10),
+            timeout=network_config.get('timeout', 30)
+        )
+
+    def _new_session(self) -> requests.Session:
+        session = requests.Session()
+        adapter = _PooledAdapter(
+            self.stats,
+            pool_connections=self.pool_connections,
+            pool_maxsize=self.pool_maxsize
+        )
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        return session
+
+    def request(self, method: str, url: str, **kwargs) -> requests.Response:
+        """通过共享会话发送请求"""
+        kwargs.setdefault('timeout', self.timeout)
+        return self._shared.request(method, url, **kwargs)
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        return self.request('POST', url, **kwargs)
+
+    def user_session(self, user: str, cookies: Optional[Dict[str, str]] = None,
+                     headers: Optional[Dict[str, str]] = None) -> requests.Session:
+        """获取（或创建）用户专属的 keep-alive 会话"""
+        with self._lock:
+            session = self._users.get(user)
+            if session is None:
+                session = self._new_session()
+                self._users[user] = session
+        if cookies:
+            session.cookies.update(cookies)
+        if headers:
+            session.headers.update(headers)
+        return session
+
+    def release_user(self, user: str):
+        """关闭用户会话，释放其连接"""
+        with self._lock:
+            session = self._users.pop(user, None)
+        if session is not None:
+            session.close()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """连接池统计信息"""
+        stats = self.stats.to_dict()
+        with self._lock:
+            stats['user_sessions'] = len(self._users)
+        stats['pool_connections'] = self.pool_connections
+        stats['pool_maxsize'] = self.pool_maxsize
+        return stats
+
+    def close(self):
+        """关闭所有会话"""
+        with self._lock:
+            sessions = list(self._users.values())
+            self._users.clear()
+        for session in sessions:
+            session.close()
+        self._shared.close()
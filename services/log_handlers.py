@@ -0,0 +1,300 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""日志处理器管线
+
+weread_bot 记录器上只挂一个 QueueHandler，调用方只做一次入队（队列满时丢弃并计数）；
+真正的文件/控制台写入和日志滚动都在专用的写线程里完成，按批次或时间间隔 flush，
+磁盘卡顿不会拖慢阅读请求。滚动出的备份文件在后台线程中压缩为 gzip。
+"""
+
+import gzip
+import json
+import logging
+import os
+import queue
+import shutil
+import threading
+import time
+from datetime import datetime
+from logging.handlers import QueueHandler, RotatingFileHandler
+from typing import Any, Dict, List, Optional
+
+from .log_index import record_user
+
+# 写线程退出标记
+_STOP = object()
+
+# logging.format 对应的文本格式
+TEXT_FORMATS = {
+    'simple': '%(asctime)s - %(levelname)s - %(message)s',
+    'detailed': '%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+}
+
+
+class JsonFormatter(logging.Formatter):
+    """JSON Lines 格式：每条记录一行，附带 LogManager.log 传入的结构化字段
+
+    字段顺序固定（ts、level、logger、user 在前），日志索引据此直接用正则提取，无需完整解析。
+    """
+
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created).strftime('%Y-%m-%d %H:%M:%S.%f')[:-3],
+            'level': record.levelname,
+            'logger': record.name,
+        }
+        user = record_user(record)
+        if user:
+            entry['user'] = user
+        entry['message'] = record.getMessage()
+        data = getattr(record, 'data', None)
+        if data:
+            entry['data'] = data
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exc'] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, separators=(',', ':'), default=str)
+
+
+def build_formatter(fmt: str) -> logging.Formatter:
+    """按 logging.format（simple / detailed / json）创建格式化器"""
+    if fmt == 'json':
+        return JsonFormatter()
+    return logging.Formatter(TEXT_FORMATS.get(fmt, TEXT_FORMATS['detailed']), datefmt='%Y-%m-%d %H:%M:%S')
+
+
+class BatchStreamHandler(logging.StreamHandler):
+    """控制台处理器：flush 推迟到写线程按批次调用 flush_now"""
+
+    def flush(self):
+        pass
+
+    def flush_now(self):
+        super().flush()
+
+
+class BatchRotatingFileHandler(RotatingFileHandler):
+    """滚动文件处理器：在内存中累计文件大小判断滚动，不在每条日志上 seek/stat
+
+    设置了 index（LogIndexWriter）时，每条记录的字节偏移会同步登记到日志索引。
+    compress 为 True 时，滚动出的备份先改名，再由后台线程压缩为 .gz。
+    """
+
+    def __init__(self, *args, index=None, compress: bool = False, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._size = None
+        self.index = index
+        self.compress = compress
+        self._compressor: Optional[threading.Thread] = None
+        if compress:
+            self.namer = lambda name: name + '.gz'
+            # 上次退出时未压缩完的备份
+            leftover = f"{self.baseFilename}.1"
+            if os.path.exists(leftover) and not os.path.exists(leftover + '.gz'):
+                self._start_compression(leftover, leftover + '.gz')
+
+    def flush(self):
+        pass
+
+    def flush_now(self):
+        super().flush()
+        if self.index is not None:
+            self.index.flush()
+
+    def _current_size(self) -> int:
+        if self._size is None:
+            try:
+                self._size = os.path.getsize(self.baseFilename)
+            except OSError:
+                self._size = 0
+        return self._size
+
+    def emit(self, record):
+        try:
+            msg = self.format(record) + self.terminator
+            length = len(msg.encode(self.encoding or 'utf-8', errors='replace'))
+            size = self._current_size()
+            if self.maxBytes > 0 and size > 0 and size + length >= self.maxBytes:
+                self.doRollover()
+            if self.stream is None:
+                self.stream = self._open()
+            if self.index is not None and not self.index.attached:
+                self.stream.flush()
+                self.index.attach(self.baseFilename)
+            offset = self._size
+            self.stream.write(msg)
+            self._size += length
+            if self.index is not None:
+                self.index.add(offset, length, record)
+        except RecursionError:
+            raise
+        except Exception:
+            self.handleError(record)
+
+    def rotate(self, source, dest):
+        if not self.compress:
+            super().rotate(source, dest)
+            return
+        # 先改名腾出当前文件，压缩交给后台线程，写线程只等待一次 rename
+        pending = dest[:-len('.gz')]
+        if os.path.exists(source):
+            os.rename(source, pending)
+            self._start_compression(pending, dest)
+
+    def _start_compression(self, source: str, dest: str):
+        self._compressor = threading.Thread(
+            target=self._compress, args=(source, dest),
+            name='weread-log-compress', daemon=True
+        )
+        self._compressor.start()
+
+    def _compress(self, source: str, dest: str):
+        tmp = dest + '.tmp'
+        try:
+            with open(source, 'rb') as src, gzip.open(tmp, 'wb', compresslevel=6) as dst:
+                shutil.copyfileobj(src, dst, 1024 * 1024)
+            os.replace(tmp, dest)
+            if self.index is not None:
+                self.index.relink(source, dest)
+            os.remove(source)
+        except OSError:
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+
+    def wait_compression(self, timeout: Optional[float] = None):
+        """等待进行中的备份压缩完成"""
+        compressor = self._compressor
+        if compressor is not None:
+            compressor.join(timeout)
+
+    def doRollover(self):
+        # 上一个备份还在压缩时不能移动备份文件
+        self.wait_compression()
+        if self.index is not None:
+            self.index.detach()
+        super().doRollover()
+        self._size = 0
+        if self.index is not None:
+            self.index.collect_garbage(
+                [self.baseFilename]
+                + [f"{self.baseFilename}.{i}" for i in range(1, self.backupCount + 1)]
+            )
+
+    def close(self):
+        if self.index is not None:
+            self.index.detach()
+        super().close()
+        self.wait_compression(timeout=30)
+
+
+class DroppingQueueHandler(QueueHandler):
+    """非阻塞入队的 QueueHandler，队列满时丢弃记录并计数"""
+
+    def __init__(self, log_queue: queue.Queue, writer: 'LogWriter'):
+        super().__init__(log_queue)
+        self.writer = writer
+        self.dropped = 0
+
+    def prepare(self, record):
+        # 格式化推迟到写线程；只需提前合并 msg 和 args，避免参数对象被后续修改
+        if record.args:
+            record.msg = record.getMessage()
+            record.args = None
+        if record.exc_info and not record.exc_text:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def close(self):
+        self.writer.stop()
+        super().close()
+
+
+class LogWriter(threading.Thread):
+    """日志写线程：逐条写入下游处理器，攒够一批或超过间隔时统一 flush"""
+
+    def __init__(self, log_queue: queue.Queue, handlers: List[logging.Handler],
+                 flush_interval: float = 1.0, batch_size: int = 100):
+        super().__init__(name='weread-log-writer', daemon=True)
+        self.queue = log_queue
+        self.handlers = handlers
+        self.flush_interval = max(0.01, float(flush_interval))
+        self.batch_size = max(1, int(batch_size))
+        self.written = 0
+        self.flushes = 0
+        self._stopped = False
+        self._stop_lock = threading.Lock()
+
+    def run(self):
+        pending = 0
+        last_flush = time.monotonic()
+        while True:
+            timeout = None if not pending else max(0.0, last_flush + self.flush_interval - time.monotonic())
+            try:
+                record = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                record = None
+
+            if record is _STOP:
+                self._flush()
+                return
+            if record is not None:
+                self._handle(record)
+                pending += 1
+
+            if pending and (
+                pending >= self.batch_size
+                or record is None
+                or time.monotonic() - last_flush >= self.flush_interval
+            ):
+                self._flush()
+                pending = 0
+                last_flush = time.monotonic()
+
+    def _handle(self, record):
+        for handler in self.handlers:
+            if record.levelno >= handler.level:
+                handler.handle(record)
+        self.written += 1
+
+    def _flush(self):
+        for handler in self.handlers:
+            try:
+                handler.flush_now()
+            except Exception:
+                pass
+        self.flushes += 1
+
+    def stop(self, timeout: float = 5.0):
+        """写入退出标记并等待队列排空，然后关闭下游处理器"""
+        with self._stop_lock:
+            if self._stopped:
+                return
+            self._stopped = True
+        if self.is_alive():
+            # 阻塞入队：退出标记排在所有已入队记录之后，保证先写完再退出
+            self.queue.put(_STOP)
+            self.join(timeout)
+        for handler in self.handlers:
+            try:
+                handler.close()
+            except Exception:
+                pass
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            'alive': self.is_alive(),
+            'written': self.written,
+            'flushes': self.flushes,
+            'batch_size': self.batch_size,
+            'flush_interval': self.flush_interval
+        }
@@ -0,0 +1,385 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""日志索引与检索
+
+日志文件按块建立摘要索引：每块是一段连续的完整日志记录（不超过 block_size 字节，
+且落在同一个时间桶内），记录其字节区间、时间范围、最高日志级别和出现的用户。
+索引文件以日志文件的 inode 命名，滚动改名后依然有效；没有索引的文件在首次检索时
+补建。检索时先按摘要筛掉不相关的块，只读取候选块和尚未建索引的文件末尾。
+"""
+
+import json
+import os
+import re
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, BinaryIO, Callable, Dict, Iterator, List, Optional, Tuple
+
+from .log_reader import content_size, is_compressed, log_file_chain, open_log_file
+
+LEVEL_NUMBERS = {'DEBUG': 10, 'INFO': 20, 'WARNING': 30, 'ERROR': 40, 'CRITICAL': 50}
+
+# 文本格式：2024-01-01 12:00:00 - weread_bot - INFO - [user] message（simple 格式没有记录器名）
+_TEXT_RE = re.compile(
+    rb'^(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2})(?: - \S+)? - ([A-Z]+) - (?:\[([^\]\r\n]+)\])?'
+)
+# JSON 格式：{"ts":"2024-01-01 12:00:00.123","level":"INFO","logger":"weread_bot","user":"...",...}
+_JSON_RE = re.compile(
+    rb'^\{"ts":"(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2})[^"]*","level":"([A-Z]+)"'
+    rb'(?:,"logger":"[^"]*")?(?:,"user":("(?:[^"\\]|\\.)*"))?'
+)
+_USER_RE = re.compile(r'^\[([^\]\r\n]+)\]')
+_RELATIVE_RE = re.compile(r'^(\d+(?:\.\d+)?)\s*([smhd])$')
+_UNITS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+def message_user(message: str) -> Optional[str]:
+    """从 "[user] ..." 形式的消息前缀中取出用户名"""
+    match = _USER_RE.match(message)
+    return match.group(1) if match else None
+
+
+def record_user(record) -> Optional[str]:
+    """日志记录所属的用户：优先取结构化数据中的 user 字段，其次取消息前缀"""
+    data = getattr(record, 'data', None)
+    if data and data.get('user'):
+        return str(data['user'])
+    return message_user(str(record.msg))
+
+
+class _TimestampParser:
+    """解析日志行的时间戳（同一秒内的行很多，缓存上一次结果）"""
+
+    def __init__(self):
+        self._last_text = None
+        self._last_value = 0.0
+
+    def __call__(self, text: bytes) -> float:
+        if text != self._last_text:
+            self._last_value = datetime.strptime(text.decode('ascii'), '%Y-%m-%d %H:%M:%S').timestamp()
+            self._last_text = text
+        return self._last_value
+
+
+def parse_time_arg(value: Optional[str]) -> Optional[float]:
+    """解析时间参数：相对时长（30m、24h、7d）、Unix 时间戳或 ISO 时间"""
+    if value is None or value == '':
+        return None
+    value = value.strip()
+    match = _RELATIVE_RE.match(value)
+    if match:
+        return time.time() - float(match.group(1)) * _UNITS[match.group(2)]
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value).timestamp()
+
+
+def scan_records(f: BinaryIO, start: int, end: int) -> Iterator[Tuple[int, bytes, float, str, Optional[str]]]:
+    """扫描 [start, end) 内的日志记录，产出 (偏移, 原始字节, 时间, 级别, 用户)
+
+    不以时间戳开头的行（如异常堆栈）并入上一条记录。
+    """
+    parse_ts = _TimestampParser()
+    f.seek(start)
+    position = start
+    current = None
+    while position < end:
+        line = f.readline()
+        if not line:
+            break
+        match = _TEXT_RE.match(line)
+        if match:
+            user = match.group(3)
+            user = user.decode('utf-8', errors='replace') if user else None
+        else:
+            match = _JSON_RE.match(line)
+            if match:
+                user = match.group(3)
+                user = json.loads(user) if user else None
+        if match:
+            if current is not None:
+                yield current[0], b''.join(current[1]), current[2], current[3], current[4]
+            current = (
+                position, [line], parse_ts(match.group(1)),
+                match.group(2).decode('ascii'), user
+            )
+        elif current is not None:
+            current[1].append(line)
+        position += len(line)
+    if current is not None:
+        yield current[0], b''.join(current[1]), current[2], current[3], current[4]
+
+
+class _BlockBuilder:
+    """把连续的记录累积成索引块"""
+
+    def __init__(self, block_size: int, bucket_seconds: int, sink: Callable[[Dict[str, Any]], None]):
+        self.block_size = block_size
+        self.bucket_seconds = bucket_seconds
+        self.sink = sink
+        self.current: Optional[Dict[str, Any]] = None
+
+    def add(self, offset: int, length: int, ts: float, level: str, user: Optional[str]):
+        bucket = int(ts // self.bucket_seconds)
+        block = self.current
+        if block is not None and (
+            block['bucket'] != bucket
+            or block['e'] != offset
+            or offset + length - block['s'] > self.block_size
+        ):
+            self.finish()
+            block = None
+        if block is None:
+            block = self.current = {
+                's': offset, 'e': offset, 't0': ts, 't1': ts, 'lv': 0,
+                'users': set(), 'bucket': bucket
+            }
+        block['e'] = offset + length
+        block['t0'] = min(block['t0'], ts)
+        block['t1'] = max(block['t1'], ts)
+        block['lv'] = max(block['lv'], LEVEL_NUMBERS.get(level, 0))
+        if user:
+            block['users'].add(user)
+
+    def finish(self):
+        block, self.current = self.current, None
+        if block is not None:
+            self.sink({
+                's': block['s'], 'e': block['e'],
+                't0': int(block['t0']), 't1': int(block['t1']),
+                'lv': block['lv'], 'users': sorted(block['users'])
+            })
+
+
+def index_path(index_dir: Path, path) -> Path:
+    """日志文件对应的索引文件（以设备号和 inode 命名）"""
+    st = os.stat(path)
+    return index_dir / f"{st.st_dev}-{st.st_ino}.idx"
+
+
+def read_index(idx_path: Path, size: int) -> Tuple[List[Dict[str, Any]], int]:
+    """读取索引块，返回 (块列表, 已索引到的字节偏移)；索引超出文件大小时视为失效"""
+    blocks: List[Dict[str, Any]] = []
+    try:
+        with open(idx_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    blocks.append(json.loads(line))
+                except ValueError:
+                    # 写线程可能正在追加最后一行
+                    break
+    except OSError:
+        return [], 0
+    indexed_end = blocks[-1]['e'] if blocks else 0
+    if indexed_end > size:
+        return [], 0
+    return blocks, indexed_end
+
+
+class LogIndexWriter:
+    """随日志写入增量维护当前日志文件的索引（只在日志写线程中调用）"""
+
+    def __init__(self, index_dir: str, block_size: int = 64 * 1024, bucket_seconds: int = 300):
+        self.index_dir = Path(index_dir)
+        self.block_size = block_size
+        self.bucket_seconds = bucket_seconds
+        self.attached = False
+        self._file = None
+        self._builder: Optional[_BlockBuilder] = None
+
+    def attach(self, path: str):
+        """开始为 path 建索引，先补齐文件中已有但尚未索引的部分"""
+        self.index_dir.mkdir(parents=True, exist_ok=True)
+        size = os.path.getsize(path)
+        idx_path = index_path(self.index_dir, path)
+        blocks, indexed_end = read_index(idx_path, size)
+        self._file = open(idx_path, 'a' if blocks else 'w', encoding='utf-8')
+        self._builder = _BlockBuilder(self.block_size, self.bucket_seconds, self._write_block)
+        if indexed_end < size:
+            with open(path, 'rb') as f:
+                for offset, raw, ts, level, user in scan_records(f, indexed_end, size):
+                    self._builder.add(offset, len(raw), ts, level, user)
+            self._builder.finish()
+        self.attached = True
+
+    def _write_block(self, block: Dict[str, Any]):
+        self._file.write(json.dumps(block, ensure_ascii=False, separators=(',', ':')) + '\n')
+
+    def add(self, offset: int, length: int, record):
+        """登记一条刚写入 [offset, offset + length) 的日志记录"""
+        if self._builder is None:
+            return
+        self._builder.add(offset, length, int(record.created), record.levelname, record_user(record))
+
+    def flush(self):
+        if self._file is not None:
+            self._file.flush()
+
+    def detach(self):
+        """当前文件即将滚动：写出未完成的块并关闭索引文件"""
+        if self._builder is not None:
+            self._builder.finish()
+            self._builder = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        self.attached = False
+
+    def relink(self, source: str, dest: str):
+        """source 被压缩为 dest 后，把索引改挂到 dest 的 inode 上（偏移仍按解压后的内容计算）"""
+        try:
+            os.replace(index_path(self.index_dir, source), index_path(self.index_dir, dest))
+        except OSError:
+            pass
+
+    def collect_garbage(self, live_paths: List[str]):
+        """删除已不对应任何现存日志文件的索引"""
+        live = set()
+        for path in live_paths:
+            for candidate in (path, f"{path}.gz"):
+                try:
+                    live.add(index_path(self.index_dir, candidate).name)
+                except OSError:
+                    pass
+        for idx in self.index_dir.glob('*.idx'):
+            if idx.name not in live:
+                try:
+                    idx.unlink()
+                except OSError:
+                    pass
+
+
+class LogSearcher:
+    """基于块索引检索当前日志及滚动备份"""
+
+    def __init__(self, log_file: str, backup_count: int, index_dir: str,
+                 block_size: int = 64 * 1024, bucket_seconds: int = 300):
+        self.log_file = log_file
+        self.backup_count = backup_count
+        self.index_dir = Path(index_dir)
+        self.block_size = block_size
+        self.bucket_seconds = bucket_seconds
+        self._build_lock = threading.Lock()
+
+    def _build_index(self, path: Path, size: int) -> Tuple[List[Dict[str, Any]], int]:
+        """为不再写入的滚动备份补建完整索引（写临时文件后原子替换）"""
+        blocks: List[Dict[str, Any]] = []
+        builder = _BlockBuilder(self.block_size, self.bucket_seconds, blocks.append)
+        with open_log_file(path) as f:
+            for offset, raw, ts, level, user in scan_records(f, 0, size):
+                builder.add(offset, len(raw), ts, level, user)
+        builder.finish()
+
+        self.index_dir.mkdir(parents=True, exist_ok=True)
+        idx_path = index_path(self.index_dir, path)
+        tmp_path = idx_path.with_suffix('.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            for block in blocks:
+                f.write(json.dumps(block, ensure_ascii=False, separators=(',', ':')) + '\n')
+        os.replace(tmp_path, idx_path)
+        return blocks, size
+
+    def _load_blocks(self, path: Path, size: int, is_current: bool) -> Tuple[List[Dict[str, Any]], int]:
+        try:
+            blocks, indexed_end = read_index(index_path(self.index_dir, path), size)
+        except OSError:
+            return [], 0
+        if is_current or indexed_end >= size:
+            return blocks, indexed_end
+        with self._build_lock:
+            return self._build_index(path, size)
+
+    @staticmethod
+    def _iter_batches(f: BinaryIO, ranges, record_matches, stats) -> Iterator[List[tuple]]:
+        """按给定顺序逐个区间读取，产出每个区间内的匹配记录"""
+        for start, end in ranges:
+            stats['bytes_scanned'] += end - start
+            yield [
+                (ts, record_level, user_name, raw)
+                for _, raw, ts, record_level, user_name in scan_records(f, start, end)
+                if record_matches(ts, record_level, user_name, raw)
+            ]
+
+    def search(self, level: Optional[str] = None, user: Optional[str] = None,
+               since: Optional[float] = None, until: Optional[float] = None,
+               query: Optional[str] = None, limit: int = 200) -> Dict[str, Any]:
+        """检索日志（最新的在前）
+
+        level 为最低级别（ERROR 同时匹配 CRITICAL），user 按记录所属用户匹配，
+        since/until 为 Unix 时间戳，query 为区分大小写的子串。
+        """
+        min_level = LEVEL_NUMBERS.get(level.upper(), 0) if level else 0
+        query_bytes = query.encode('utf-8') if query else None
+        limit = max(1, int(limit))
+        stats = {'files': 0, 'blocks': 0, 'blocks_scanned': 0, 'bytes_scanned': 0}
+        results: List[Dict[str, Any]] = []
+
+        def block_matches(block: Dict[str, Any]) -> bool:
+            if block['lv'] < min_level:
+                return False
+            if since is not None and block['t1'] < int(since):
+                return False
+            if until is not None and block['t0'] > until:
+                return False
+            if user is not None and user not in block['users']:
+                return False
+            return True
+
+        def record_matches(ts: float, record_level: str, record_user: Optional[str], raw: bytes) -> bool:
+            if LEVEL_NUMBERS.get(record_level, 0) < min_level:
+                return False
+            if since is not None and ts < int(since):
+                return False
+            if until is not None and ts > until:
+                return False
+            if user is not None and record_user != user:
+                return False
+            if query_bytes is not None and query_bytes not in raw:
+                return False
+            return True
+
+        paths = log_file_chain(self.log_file, self.backup_count)
+        for path in reversed(paths):
+            try:
+                size = content_size(path)
+            except OSError:
+                continue
+            is_current = str(path) == str(self.log_file)
+            blocks, indexed_end = self._load_blocks(path, size, is_current)
+            stats['files'] += 1
+            stats['blocks'] += len(blocks)
+
+            ranges = [(indexed_end, size)] if indexed_end < size else []
+            ranges += [(block['s'], block['e']) for block in reversed(blocks) if block_matches(block)]
+            stats['blocks_scanned'] += len(ranges)
+
+            with open_log_file(path) as f:
+                if is_compressed(path):
+                    # gzip 只能向前高效 seek：按偏移升序读完全部候选块，合并后倒序输出
+                    ranges.reverse()
+                    batches = [[
+                        match for batch in self._iter_batches(f, ranges, record_matches, stats)
+                        for match in batch
+                    ]]
+                else:
+                    batches = self._iter_batches(f, ranges, record_matches, stats)
+                for matches in batches:
+                    for ts, record_level, record_user, raw in reversed(matches):
+                        results.append({
+                            'timestamp': datetime.fromtimestamp(ts).isoformat(),
+                            'level': record_level,
+                            'user': record_user,
+                            'message': raw.decode('utf-8', errors='replace').rstrip('\r\n'),
+                            'file': path.name
+                        })
+                        if len(results) >= limit:
+                            return {'results': results, 'stats': stats}
+
+            if since is not None and blocks and blocks[0]['t0'] < since:
+                # 更早的备份只会更旧
+                break
+
+        return {'results': results, 'stats': stats}
@@ -2,78 +2,152 @@
 # -*- coding: utf-8 -*-
 """日志管理服务"""
 
-import os
+import atexit
 import logging
+import queue
+import re
+import threading
 from pathlib import Path
 from datetime import datetime
-from typing import List, Dict, Any
-from logging.handlers import RotatingFileHandler
+from typing import List, Dict, Any, Optional
+
+from .event_bus import EventBus
+from .log_handlers import (
+    BatchRotatingFileHandler, BatchStreamHandler, DroppingQueueHandler, LogWriter,
+    build_formatter
+)
+from .log_index import LogIndexWriter, LogSearcher
+from .log_reader import LogChain, log_file_chain, tail_lines
+
+_SIZE_RE = re.compile(r'^\s*(\d+(?:\.\d+)?)\s*([KMG]?B?)\s*$', re.IGNORECASE)
+_SIZE_UNITS = {'': 1, 'B': 1, 'K': 1024, 'KB': 1024, 'M': 1024 ** 2, 'MB': 1024 ** 2,
+               'G': 1024 ** 3, 'GB': 1024 ** 3}
+
+
+def parse_size(value, default: int = 10 * 1024 * 1024) -> int:
+    """解析 "10MB"、"512KB" 或字节数形式的大小"""
+    if isinstance(value, (int, float)):
+        return int(value)
+    match = _SIZE_RE.match(str(value or ''))
+    if not match:
+        return default
+    return int(float(match.group(1)) * _SIZE_UNITS[match.group(2).upper()])
 
 
 class LogManager:
-    """日志管理器"""
+    """日志管理器
+    
+    内存日志保存在固定容量的环形缓冲区中，每条日志分配单调递增的序号，
+    客户端可以通过序号游标只拉取新增的日志。
+    文件和控制台写入经由队列交给后台写线程完成，调用方不会被磁盘 I/O 阻塞。
+    """
     
-    def __init__(self, log_file: str = "logs/weread.log"):
+    def __init__(self, log_file: str = "logs/weread.log", capacity: int = 1000,
+                 event_bus: Optional[EventBus] = None,
+                 options: Optional[Dict[str, Any]] = None):
         self.log_file = log_file
-        self.logs = []
+        self.capacity = max(1, int(capacity))
+        self.event_bus = event_bus
+        # logging 配置段：level / format / max_size / backup_count / console / queue_size ...
+        self.options = options or {}
+        self.backup_count = max(0, int(self.options.get('backup_count', 5)))
+        self.index_dir = str(Path(log_file).parent / '.index')
+        self.searcher = LogSearcher(log_file, self.backup_count, self.index_dir)
+        # 环形缓冲区：每个槽位是 (seq, timestamp, level, message, data) 元组
+        self._buffer: List[Optional[tuple]] = [None] * self.capacity
+        self._seq = 0
+        self._floor = 0
+        self._lock = threading.Lock()
+        self._queue_handler: Optional[DroppingQueueHandler] = None
         self.logger = self._setup_logger()
+        atexit.register(self.close)
     
     def _setup_logger(self) -> logging.Logger:
         """设置日志记录器"""
         # 创建日志目录
-        Path(self.log_file).parent.mkdir(exist_ok=True)
+        Path(self.log_file).parent.mkdir(parents=True, exist_ok=True)
         
         logger = logging.getLogger('weread_bot')
         logger.setLevel(logging.DEBUG)
+        logger.propagate = False
         
-        # 移除现有的处理器，避免重复
+        # 移除现有的处理器，避免重复（旧的队列处理器关闭时会排空并停止其写线程）
+        for handler in list(logger.handlers):
+            handler.close()
         logger.handlers.clear()
         
-        # 文件处理器
-        file_handler = RotatingFileHandler(
+        level = getattr(logging, str(self.options.get('level', 'INFO')).upper(), logging.INFO)
+        
+        # 文件处理器（备份在后台压缩为 .gz）
+        file_handler = BatchRotatingFileHandler(
             self.log_file,
-            maxBytes=10*1024*1024,  # 10MB
-            backupCount=5,
-            encoding='utf-8'
+            maxBytes=parse_size(self.options.get('max_size', '10MB')),
+            backupCount=self.backup_count,
+            encoding='utf-8',
+            index=LogIndexWriter(self.index_dir) if self.options.get('index', True) else None,
+            compress=self.options.get('compress', True)
         )
-        file_handler.setLevel(logging.DEBUG)
+        file_handler.setLevel(level)
+        file_handler.setFormatter(build_formatter(self.options.get('format', 'detailed')))
+        handlers = [file_handler]
         
-        # 控制台处理器
-        console_handler = logging.StreamHandler()
-        console_handler.setLevel(logging.INFO)
+        # 控制台处理器（JSON 格式只用于文件，控制台保持可读的文本）
+        if self.options.get('console', True):
+            console_handler = BatchStreamHandler()
+            console_handler.setLevel(max(level, logging.INFO))
+            console_format = self.options.get('format', 'detailed')
+            console_handler.setFormatter(build_formatter('detailed' if console_format == 'json' else console_format))
+            handlers.append(console_handler)
         
-        # 日志格式
-        formatter = logging.Formatter(
-            '%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-            datefmt='%Y-%m-%d %H:%M:%S'
+        # 文件和控制台处理器只由写线程调用，记录器上只挂队列处理器
+        log_queue = queue.Queue(maxsize=max(1, int(self.options.get('queue_size', 10000))))
+        writer = LogWriter(
+            log_queue, handlers,
+            flush_interval=self.options.get('flush_interval', 1.0),
+            batch_size=self.options.get('batch_size', 100)
         )
-        file_handler.setFormatter(formatter)
-        console_handler.setFormatter(formatter)
-        
-        # 添加处理器
-        logger.addHandler(file_handler)
-        logger.addHandler(console_handler)
+        writer.start()
+        self._queue_handler = DroppingQueueHandler(log_queue, writer)
+        logger.addHandler(self._queue_handler)
         
         return logger
     
+    def close(self):
+        """停止写线程（先写完队列中的全部日志）"""
+        handler = self._queue_handler
+        if handler is None:
+            return
+        self._queue_handler = None
+        self.logger.removeHandler(handler)
+        handler.close()
+    
+    def get_queue_stats(self) -> Dict[str, Any]:
+        """日志写入队列统计：队列深度、丢弃条数与写线程状态"""
+        handler = self._queue_handler
+        if handler is None:
+            return {'queue_depth': 0, 'queue_capacity': 0, 'dropped': 0, 'writer': None}
+        return {
+            'queue_depth': handler.queue.qsize(),
+            'queue_capacity': handler.queue.maxsize,
+            'dropped': handler.dropped,
+            'writer': handler.writer.get_stats()
+        }
+    
     def log(self, level: str, message: str, **kwargs):
         """记录日志"""
-        log_entry = {
-            'timestamp': datetime.now().isoformat(),
-            'level': level.upper(),
-            'message': message,
-            'data': kwargs
-        }
-        
-        self.logs.append(log_entry)
-        
-        # 限制内存中的日志数量
-        if len(self.logs) > 1000:
-            self.logs = self.logs[-1000:]
+        timestamp = datetime.now().isoformat()
+        with self._lock:
+            self._seq += 1
+            # 覆盖最旧的槽位，追加为 O(1)
+            self._buffer[self._seq % self.capacity] = (
+                self._seq, timestamp, level.upper(), message, kwargs or None
+            )
+        if self.event_bus is not None:
+            self.event_bus.notify()
         
-        # 同时写入系统日志
+        # 同时写入系统日志（结构化字段随记录一起写出，JSON 格式下落盘）
         log_method = getattr(self.logger, level.lower(), self.logger.info)
-        log_method(message)
+        log_method(message, extra={'data': kwargs} if kwargs else None)
     
     def debug(self, message: str, **kwargs):
         """记录调试日志"""
@@ -95,21 +169,65 @@ class LogManager:
         """记录严重错误日志"""
         self.log('critical', message, **kwargs)
     
-    def get_logs(self, limit: int = 100) -> List[Dict[str, Any]]:
-        """获取日志"""
-        return self.logs[-limit:]
+    @property
+    def last_seq(self) -> int:
+        """最新一条日志的序号"""
+        return self._seq
+    
+    def get_logs(self, limit: int = 100, since: Optional[int] = None) -> List[Dict[str, Any]]:
+        """获取日志
+        
+        未指定 since 时返回最近 limit 条；指定 since 时返回序号大于 since 的日志（最多 limit 条）。
+        """
+        limit = max(0, int(limit))
+        with self._lock:
+            last = self._seq
+            first = max(self._floor + 1, last - self.capacity + 1, 1)
+            if since is None:
+                start = max(first, last - limit + 1)
+                end = last
+            else:
+                start = max(first, since + 1)
+                end = min(last, start + limit - 1)
+            entries = [self._buffer[seq % self.capacity] for seq in range(start, end + 1)]
+        
+        return [
+            {
+                'seq': seq,
+                'timestamp': timestamp,
+                'level': level,
+                'message': message,
+                'data': data or {}
+            }
+            for seq, timestamp, level, message, data in entries
+        ]
     
     def clear_logs(self):
-        """清空日志"""
-        self.logs = []
+        """清空日志（序号继续递增，已有的游标仍然有效）"""
+        with self._lock:
+            self._floor = self._seq
         self.info("日志已清空")
     
-    def get_log_file_content(self) -> str:
-        """获取日志文件内容"""
+    def tail(self, lines: int = 100) -> List[str]:
+        """读取日志文件的最后 lines 行（从文件末尾向前按块读取）"""
+        if not Path(self.log_file).exists():
+            return []
+        return tail_lines(self.log_file, max(0, int(lines)))
+    
+    def open_log_chain(self, include_backups: bool = False) -> LogChain:
+        """打开当前日志（可选连同滚动备份，按从旧到新拼接）用于流式读取"""
+        paths = log_file_chain(self.log_file, self.backup_count if include_backups else 0)
+        return LogChain(paths)
+    
+    def search(self, level: Optional[str] = None, user: Optional[str] = None,
+               since: Optional[float] = None, until: Optional[float] = None,
+               query: Optional[str] = None, limit: int = 200) -> Dict[str, Any]:
+        """按级别、用户、时间范围和关键字检索日志文件（含滚动备份）"""
+        return self.searcher.search(level, user, since, until, query, limit)
+    
+    def get_log_file_content(self, max_lines: int = 1000) -> str:
+        """获取日志文件内容（最后 max_lines 行）"""
         try:
-            if Path(self.log_file).exists():
-                with open(self.log_file, 'r', encoding='utf-8') as f:
-                    return f.read()
-            return ""
+            return '\n'.join(self.tail(max_lines))
         except Exception as e:
             return f"读取日志文件失败: {e}"
@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""日志文件读取
+
+从文件末尾向前按块读取最后 N 行；把当前日志和滚动备份视为一个按时间顺序拼接的
+虚拟文件，按字节区间（HTTP Range）流式读取，整个过程不把文件读入内存。
+gzip 压缩的备份按解压后的内容参与拼接，解压后大小取自 gzip 尾部的 ISIZE 字段。
+"""
+
+import gzip
+import os
+import re
+import struct
+from pathlib import Path
+from typing import BinaryIO, Iterator, List, Optional, Tuple
+
+CHUNK_SIZE = 64 * 1024
+
+_RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def log_file_chain(log_file: str, backup_count: int) -> List[Path]:
+    """当前日志及其滚动备份，按从旧到新排列（weread.log.5 ... weread.log.1, weread.log）
+
+    备份可以是 weread.log.N 或压缩后的 weread.log.N.gz（压缩过程中两者并存时取未压缩的）。
+    """
+    base = Path(log_file)
+    paths = []
+    for index in range(backup_count, 0, -1):
+        plain = Path(f"{base}.{index}")
+        compressed = Path(f"{base}.{index}.gz")
+        if plain.exists():
+            paths.append(plain)
+        elif compressed.exists():
+            paths.append(compressed)
+    if base.exists():
+        paths.append(base)
+    return paths
+
+
+def is_compressed(path) -> bool:
+    return str(path).endswith('.gz')
+
+
+def open_log_file(path) -> BinaryIO:
+    """以二进制方式打开日志文件，gzip 备份透明解压"""
+    if is_compressed(path):
+        return gzip.open(path, 'rb')
+    return open(path, 'rb')
+
+
+def content_size(path) -> int:
+    """日志内容大小（gzip 备份为解压后的大小）"""
+    if not is_compressed(path):
+        return os.path.getsize(path)
+    with open(path, 'rb') as f:
+        if f.seek(0, os.SEEK_END) < 4:
+            return 0
+        f.seek(-4, os.SEEK_END)
+        return struct.unpack('<I', f.read(4))[0]
+
+
+def tail_lines(path: str, lines: int, block_size: int = CHUNK_SIZE) -> List[str]:
+    """从文件末尾向前按块读取最后 lines 行"""
+    if lines <= 0:
+        return []
+    with open(path, 'rb') as f:
+        position = f.seek(0, os.SEEK_END)
+        blocks: List[bytes] = []
+        newlines = 0
+        # 末尾的换行不算作一行的分隔
+        while position > 0 and newlines <= lines:
+            step = min(block_size, position)
+            position -= step
+            f.seek(position)
+            block = f.read(step)
+            blocks.append(block)
+            newlines += block.count(b'\n')
+    data = b''.join(reversed(blocks))
+    result = data.decode('utf-8', errors='replace').splitlines()
+    return result[-lines:]
+
+
+def parse_range_header(header: Optional[str], total: int) -> Optional[Tuple[int, int]]:
+    """解析单个 bytes 区间，返回闭区间 (start, end)
+
+    无 Range 头或格式不支持（多区间等）时返回 None，按完整内容响应；
+    区间无法满足时抛出 ValueError（应返回 416）。
+    """
+    if not header:
+        return None
+    match = _RANGE_RE.match(header.strip())
+    if not match:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # 后缀区间：最后 N 个字节
+        length = int(last)
+        if length == 0 or total == 0:
+            raise ValueError('unsatisfiable range')
+        return max(0, total - length), total - 1
+    start = int(first)
+    end = int(last) if last else total - 1
+    if start >= total or end < start:
+        raise ValueError('unsatisfiable range')
+    return start, min(end, total - 1)
+
+
+class LogChain:
+    """按顺序拼接的多个日志文件
+
+    打开时即持有全部文件句柄并记录大小，读取过程中发生滚动（改名）不影响结果，
+    追加的新内容也不会超出已声明的长度。
+    """
+
+    def __init__(self, paths: List[Path]):
+        self.paths = paths
+        self._files: List[Tuple[BinaryIO, int]] = []
+        try:
+            for path in paths:
+                f = open_log_file(path)
+                size = content_size(path) if is_compressed(path) else os.fstat(f.fileno()).st_size
+                self._files.append((f, size))
+        except OSError:
+            self.close()
+            raise
+        self.total_size = sum(size for _, size in self._files)
+
+    def iter_bytes(self, start: int = 0, end: Optional[int] = None,
+                   chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+        """按块产出闭区间 [start, end] 内的字节，结束后关闭所有文件"""
+        end = self.total_size - 1 if end is None else end
+        try:
+            offset = 0
+            for f, size in self._files:
+                file_start, file_end = offset, offset + size - 1
+                offset += size
+                if file_end < start or file_start > end:
+                    continue
+                f.seek(max(start, file_start) - file_start)
+                remaining = min(end, file_end) - max(start, file_start) + 1
+                while remaining > 0:
+                    chunk = f.read(min(chunk_size, remaining))
+                    if not chunk:
+                        break
+                    remaining -= len(chunk)
+                    yield chunk
+        finally:
+            self.close()
+
+    def close(self):
+        for f, _ in self._files:
+            try:
+                f.close()
+            except OSError:
+                pass
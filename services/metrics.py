@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""运行指标（Prometheus 文本格式）
+
+计数器和直方图按线程分片：每个线程只写自己的分片，更新时不加锁，
+只有线程第一次写入某个指标时登记分片需要一次加锁；采集时把所有分片相加。
+线程结束时它的分片并入退役合计并注销，分片数只与存活线程数有关（Web 服务每个请求一个线程）。
+阅读循环全部运行在引擎线程上，一次更新只是一次字典查找加列表元素自增。
+瞬时值（日志队列深度、活跃会话数等）用采集时调用的函数提供，平时没有任何开销。
+"""
+
+import math
+import threading
+import weakref
+from bisect import bisect_left
+from typing import Callable, Dict, Iterator, List, Mapping, Optional, Sequence, Tuple, Union
+
+LabelValues = Tuple[str, ...]
+
+# 默认直方图分桶（秒）
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return '+Inf'
+    if isinstance(value, int) or float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + '}'
+
+
+class _ShardOwner:
+    """放在线程局部存储中的分片持有者：线程结束时被回收，触发分片退役"""
+
+    __slots__ = ('__weakref__',)
+
+
+def _fold(total: Dict[LabelValues, List[float]], shard: Dict[LabelValues, List[float]]):
+    """把 shard 逐单元加到 total 上
+
+    dict/list 的复制在持有 GIL 的 C 代码中一次完成，读到的是分片某一刻的一致状态。
+    """
+    for labels, cell in list(shard.items()):
+        cell = list(cell)
+        current = total.get(labels)
+        if current is None:
+            total[labels] = cell
+        else:
+            for index, value in enumerate(cell):
+                current[index] += value
+
+
+class _ShardedMetric:
+    """按线程分片存储的指标：{标签值: 单元（列表）}"""
+
+    kind = ''
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._local = threading.local()
+        self._shards: Dict[int, Dict[LabelValues, List[float]]] = {}
+        # 已结束线程的分片合计
+        self._retired: Dict[LabelValues, List[float]] = {}
+        self._next_key = 0
+        self._lock = threading.RLock()
+
+    def _shard(self) -> Dict[LabelValues, List[float]]:
+        """当前线程的分片（首次使用时登记，线程结束时自动退役）"""
+        shard: Dict[LabelValues, List[float]] = {}
+        owner = _ShardOwner()
+        with self._lock:
+            key = self._next_key
+            self._next_key += 1
+            self._shards[key] = shard
+        # 线程结束时其局部存储被清理，owner 随之回收
+        weakref.finalize(owner, self._retire, key)
+        self._local.owner = owner
+        self._local.shard = shard
+        return shard
+
+    def _retire(self, key: int):
+        """线程已结束：分片并入退役合计并注销"""
+        with self._lock:
+            shard = self._shards.pop(key, None)
+            if shard:
+                _fold(self._retired, shard)
+
+    @property
+    def shard_count(self) -> int:
+        """登记中的分片数（即写过该指标且仍存活的线程数）"""
+        return len(self._shards)
+
+    def _merged(self) -> Dict[LabelValues, List[float]]:
+        """退役合计与所有存活分片之和"""
+        merged: Dict[LabelValues, List[float]] = {}
+        with self._lock:
+            _fold(merged, self._retired)
+            shards = list(self._shards.values())
+        for shard in shards:
+            _fold(merged, shard)
+        return merged
+
+    def reset(self):
+        with self._lock:
+            self._retired.clear()
+            for shard in self._shards.values():
+                shard.clear()
+
+    def samples(self) -> Iterator[str]:
+        raise NotImplementedError
+
+    def render(self) -> Iterator[str]:
+        yield f'# HELP {self.name} {self.documentation}'
+        yield f'# TYPE {self.name} {self.kind}'
+        yield from self.samples()
+
+
+class Counter(_ShardedMetric):
+    """单调递增计数器"""
+
+    kind = 'counter'
+
+    def inc(self, labels: LabelValues = (), amount: float = 1):
+        try:
+            shard = self._local.shard
+        except AttributeError:
+            shard = self._shard()
+        cell = shard.get(labels)
+        if cell is None:
+            shard[labels] = [amount]
+        else:
+            cell[0] += amount
+
+    def value(self, labels: LabelValues = ()) -> float:
+        cell = self._merged().get(labels)
+        return cell[0] if cell else 0
+
+    def samples(self) -> Iterator[str]:
+        for labels, (value,) in sorted(self._merged().items()):
+            yield f'{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}'
+
+
+class Histogram(_ShardedMetric):
+    """固定分桶直方图
+
+    单元布局为 [各分桶计数..., +Inf 计数, 总和]；分桶计数不累计，采集时再做前缀和。
+    """
+
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._size = len(self.buckets) + 2
+
+    def observe(self, value: float, labels: LabelValues = ()):
+        try:
+            shard = self._local.shard
+        except AttributeError:
+            shard = self._shard()
+        cell = shard.get(labels)
+        if cell is None:
+            cell = shard[labels] = [0] * self._size
+        cell[bisect_left(self.buckets, value)] += 1
+        cell[-1] += value
+
+    def count(self, labels: LabelValues = ()) -> int:
+        cell = self._merged().get(labels)
+        return int(sum(cell[:-1])) if cell else 0
+
+    def samples(self) -> Iterator[str]:
+        names = self.labelnames + ('le',)
+        for labels, cell in sorted(self._merged().items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), cell[:-1]):
+                cumulative += count
+                yield (f'{self.name}_bucket{_format_labels(names, labels + (_format_value(bound),))} '
+                       f'{_format_value(cumulative)}')
+            label_text = _format_labels(self.labelnames, labels)
+            yield f'{self.name}_sum{label_text} {_format_value(cell[-1])}'
+            yield f'{self.name}_count{label_text} {_format_value(cumulative)}'
+
+
+GaugeValue = Union[float, Mapping[LabelValues, float]]
+
+
+class Gauge:
+    """采集时由函数计算的瞬时值；函数返回数值，或有标签时返回 {标签值: 数值}"""
+
+    kind = 'gauge'
+
+    def __init__(self, name: str, documentation: str, function: Callable[[], GaugeValue],
+                 labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.function = function
+        self.labelnames = tuple(labelnames)
+
+    def render(self) -> Iterator[str]:
+        value = self.function()
+        yield f'# HELP {self.name} {self.documentation}'
+        yield f'# TYPE {self.name} {self.kind}'
+        values = value.items() if isinstance(value, Mapping) else [((), value)]
+        for labels, number in sorted(values):
+            yield f'{self.name}{_format_labels(self.labelnames, labels)} {_format_value(number)}'
+
+
+class MetricsRegistry:
+    """指标注册表"""
+
+    def __init__(self):
+        self._metrics: Dict[str, Union[_ShardedMetric, Gauge]] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric):
+        with self._lock:
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def gauge(self, name: str, documentation: str, function: Callable[[], GaugeValue],
+              labelnames: Sequence[str] = ()) -> Gauge:
+        """注册（或替换）采集时计算的瞬时值"""
+        return self._register(Gauge(name, documentation, function, labelnames))
+
+    def get(self, name: str) -> Optional[Union[_ShardedMetric, Gauge]]:
+        return self._metrics.get(name)
+
+    def render(self) -> str:
+        """Prometheus 文本格式（0.0.4）；单个瞬时值计算失败时跳过该指标"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines: List[str] = []
+        for metric in metrics:
+            try:
+                lines.extend(metric.render())
+            except Exception as e:
+                lines.append(f'# {metric.name} 采集失败: {_escape(e)}')
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = MetricsRegistry()
+
+READING_REQUEST_SECONDS = REGISTRY.histogram(
+    'weread_reading_request_seconds', '阅读请求耗时（秒）', ('user', 'outcome')
+)
+SLEEP_DRIFT_SECONDS = REGISTRY.histogram(
+    'weread_sleep_drift_seconds', '请求间隔实际等待时间与计划时间之差（秒）', ('user',),
+    buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+)
+NOTIFICATION_SEND_SECONDS = REGISTRY.histogram(
+    'weread_notification_send_seconds', '通知发送耗时（秒）', ('channel', 'outcome')
+)
+CONFIG_RELOADS = REGISTRY.counter(
+    'weread_config_reloads_total', '配置重新加载次数', ('source', 'result')
+)
+API_REQUEST_SECONDS = REGISTRY.histogram(
+    'weread_api_request_seconds', 'Web API 请求处理耗时（秒）', ('method', 'route', 'status'),
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0)
+)
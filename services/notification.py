@@ -0,0 +1,411 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""通知推送服务
+
+实现 config.yaml.example 中的全部 12 种通知通道，并行发送到所有通道。
+每个通道从提交时起有一个截止时间（channel_timeout 与 total_timeout 取小），由发送函数自己执行：
+HTTP 请求的连接/读取超时和响应体读取都受剩余时间约束，Apprise 通过 URL 参数传入超时，
+重试也只在剩余时间内进行，因此慢的 Webhook 不会长期占住共享线程池，拖住之后的报告。
+"""
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, List, Optional, Union
+
+import requests
+
+from .http_client import HttpTransport
+from .log_manager import LogManager
+from .metrics import NOTIFICATION_SEND_SECONDS
+
+# 重试前的退避时间（秒），剩余时间不足时不再重试
+_RETRY_BACKOFF = 0.5
+# 等待线程池结果时在截止时间之外多给的余量（秒）
+_DEADLINE_GRACE = 1.0
+
+
+class ChannelTimeout(Exception):
+    """通道超过截止时间"""
+
+
+class _Deadline:
+    """单个通道的截止时间"""
+
+    __slots__ = ('seconds', 'expires')
+
+    def __init__(self, seconds: float):
+        self.seconds = seconds
+        self.expires = time.monotonic() + seconds
+
+    def remaining(self) -> float:
+        """剩余秒数，已过期时抛出 ChannelTimeout"""
+        remaining = self.expires - time.monotonic()
+        if remaining <= 0:
+            raise ChannelTimeout(f'超过截止时间 {self.seconds:g}s')
+        return remaining
+
+
+class _DeadlineTransport:
+    """受截止时间约束的传输层：每个请求的超时取剩余时间，响应体按块读取并检查截止时间"""
+
+    _CHUNK_SIZE = 16 * 1024
+
+    def __init__(self, transport: HttpTransport, deadline: _Deadline):
+        self.transport = transport
+        self.deadline = deadline
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        kwargs['timeout'] = min(kwargs.get('timeout') or self.deadline.seconds, self.deadline.remaining())
+        kwargs['stream'] = True
+        response = self.transport.post(url, **kwargs)
+        try:
+            chunks = []
+            for chunk in self._iter_body(response):
+                chunks.append(chunk)
+                self.deadline.remaining()
+            # 与 requests 读取完整响应后的状态一致，之后 .text / .json() 可正常使用
+            response._content = b''.join(chunks)
+        except BaseException:
+            response.close()
+            raise
+        return response
+
+    def _iter_body(self, response: requests.Response):
+        """按到达的数据逐块产出响应体
+
+        urllib3 2.x 的 read1 有数据就返回，服务端慢慢吐字节时也能在块之间检查截止时间；
+        旧版本退回 iter_content（单次读取仍受 socket 超时约束）。
+        """
+        raw = response.raw
+        if not hasattr(raw, 'read1'):
+            yield from response.iter_content(self._CHUNK_SIZE)
+            return
+        while True:
+            chunk = raw.read1(self._CHUNK_SIZE, decode_content=True)
+            if not chunk:
+                return
+            yield chunk
+
+
+def _json_field(response, key: str, expected: Any) -> bool:
+    """检查响应 JSON 中的状态字段"""
+    try:
+        return response.json().get(key) == expected
+    except ValueError:
+        return False
+
+
+def _send_pushplus(transport, config, title, content, timeout):
+    response = transport.post(
+        'https://www.pushplus.plus/send',
+        json={'token': config.get('token'), 'title': title, 'content': content},
+        timeout=timeout
+    )
+    return response.ok and _json_field(response, 'code', 200), response
+
+
+def _send_telegram(transport, config, title, content, timeout):
+    response = transport.post(
+        f"https://api.telegram.org/bot{config.get('bot_token')}/sendMessage",
+        json={'chat_id': config.get('chat_id'), 'text': f"{title}\n\n{content}"},
+        proxies=config.get('proxy') or None,
+        timeout=timeout
+    )
+    return response.ok and _json_field(response, 'ok', True), response
+
+
+def _send_wxpusher(transport, config, title, content, timeout):
+    response = transport.post(
+        'https://wxpusher.zjiecode.com/api/send/message/simple-push',
+        json={'spt': config.get('spt'), 'summary': title, 'content': f"{title}\n\n{content}", 'contentType': 1},
+        timeout=timeout
+    )
+    return response.ok and _json_field(response, 'success', True), response
+
+
+def _send_apprise(transport, config, title, content, timeout):
+    try:
+        import apprise
+    except ImportError:
+        raise RuntimeError('未安装 apprise，请运行: pip install apprise')
+    url = config.get('url', '')
+    # cto/rto 为 Apprise 通用的连接/读取超时参数，URL 中已指定时保留用户的设置
+    params = [f'{key}={timeout:.3f}' for key in ('cto', 'rto') if f'{key}=' not in url]
+    if params:
+        url += ('&' if '?' in url else '?') + '&'.join(params)
+    notifier = apprise.Apprise()
+    if not notifier.add(url):
+        raise ValueError('无效的 Apprise URL')
+    return bool(notifier.notify(title=title, body=content)), None
+
+
+def _send_bark(transport, config, title, content, timeout):
+    server = (config.get('server') or 'https://api.day.app').rstrip('/')
+    response = transport.post(
+        f"{server}/push",
+        json={
+            'device_key': config.get('device_key'),
+            'title': title,
+            'body': content,
+            'sound': config.get('sound') or 'default'
+        },
+        timeout=timeout
+    )
+    return response.ok and _json_field(response, 'code', 200), response
+
+
+def _send_ntfy(transport, config, title, content, timeout):
+    server = (config.get('server') or 'https://ntfy.sh').rstrip('/')
+    headers = {}
+    if config.get('token'):
+        headers['Authorization'] = f"Bearer {config['token']}"
+    response = transport.post(
+        server,
+        json={'topic': config.get('topic'), 'title': title, 'message': content},
+        headers=headers,
+        timeout=timeout
+    )
+    return response.ok, response
+
+
+def _send_feishu(transport, config, title, content, timeout):
+    if config.get('msg_type') == 'rich_text':
+        payload = {
+            'msg_type': 'post',
+            'content': {'post': {'zh_cn': {
+                'title': title,
+                'content': [[{'tag': 'text', 'text': content}]]
+            }}}
+        }
+    else:
+        payload = {'msg_type': 'text', 'content': {'text': f"{title}\n\n{content}"}}
+    response = transport.post(config.get('webhook_url'), json=payload, timeout=timeout)
+    return response.ok and _json_field(response, 'code', 0), response
+
+
+def _send_wework(transport, config, title, content, timeout):
+    msg_type = config.get('msg_type', 'text')
+    if msg_type == 'markdown':
+        payload = {'msgtype': 'markdown', 'markdown': {'content': f"## {title}\n{content}"}}
+    elif msg_type == 'news':
+        payload = {'msgtype': 'news', 'news': {'articles': [{
+            'title': title, 'description': content, 'url': 'https://weread.qq.com'
+        }]}}
+    else:
+        payload = {'msgtype': 'text', 'text': {'content': f"{title}\n\n{content}"}}
+    response = transport.post(config.get('webhook_url'), json=payload, timeout=timeout)
+    return response.ok and _json_field(response, 'errcode', 0), response
+
+
+def _send_dingtalk(transport, config, title, content, timeout):
+    msg_type = config.get('msg_type', 'text')
+    if msg_type == 'markdown':
+        payload = {'msgtype': 'markdown', 'markdown': {'title': title, 'text': f"## {title}\n{content}"}}
+    elif msg_type == 'link':
+        payload = {'msgtype': 'link', 'link': {
+            'title': title, 'text': content, 'messageUrl': 'https://weread.qq.com'
+        }}
+    else:
+        payload = {'msgtype': 'text', 'text': {'content': f"{title}\n\n{content}"}}
+    response = transport.post(config.get('webhook_url'), json=payload, timeout=timeout)
+    return response.ok and _json_field(response, 'errcode', 0), response
+
+
+def _send_gotify(transport, config, title, content, timeout):
+    server = (config.get('server') or '').rstrip('/')
+    response = transport.post(
+        f"{server}/message",
+        params={'token': config.get('token')},
+        json={
+            'title': config.get('title') or title,
+            'message': content,
+            'priority': int(config.get('priority', 5))
+        },
+        timeout=timeout
+    )
+    return response.ok, response
+
+
+def _send_serverchan3(transport, config, title, content, timeout):
+    response = transport.post(
+        f"https://{config.get('uid')}.push.ft07.com/send/{config.get('sendkey')}.send",
+        json={
+            'title': title,
+            'desp': content,
+            'tags': config.get('tags', ''),
+            'short': config.get('short', '')
+        },
+        timeout=timeout
+    )
+    return response.ok and _json_field(response, 'code', 0), response
+
+
+def _send_pushdeer(transport, config, title, content, timeout):
+    response = transport.post(
+        'https://api2.pushdeer.com/message/push',
+        data={
+            'pushkey': config.get('pushkey'),
+            'text': title,
+            'desp': content,
+            'type': config.get('type', 'markdown')
+        },
+        timeout=timeout
+    )
+    return response.ok and _json_field(response, 'code', 0), response
+
+
+# 通道名称 -> 发送函数
+CHANNEL_SENDERS: Dict[str, Callable] = {
+    'pushplus': _send_pushplus,
+    'telegram': _send_telegram,
+    'wxpusher': _send_wxpusher,
+    'apprise': _send_apprise,
+    'bark': _send_bark,
+    'ntfy': _send_ntfy,
+    'feishu': _send_feishu,
+    'wework': _send_wework,
+    'dingtalk': _send_dingtalk,
+    'gotify': _send_gotify,
+    'serverchan3': _send_serverchan3,
+    'pushdeer': _send_pushdeer,
+}
+
+
+class NotificationDispatcher:
+    """并行通知分发器"""
+
+    def __init__(self, transport: HttpTransport, max_workers: int = 12,
+                 channel_timeout: float = 10, total_timeout: float = 30, retry_times: int = 1,
+                 log_manager: Optional[LogManager] = None):
+        self.transport = transport
+        self.channel_timeout = channel_timeout
+        self.total_timeout = total_timeout
+        self.retry_times = retry_times
+        self.log_manager = log_manager
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='weread-notify')
+
+    def _warn(self, message: str):
+        if self.log_manager is not None:
+            self.log_manager.warning(message)
+        else:
+            print(message)
+
+    def _send_one(self, channel: Dict[str, Any], title: str, content: str,
+                  deadline: _Deadline, retry_times: int) -> Dict[str, Any]:
+        """发送到单个通道：连接错误和 5xx 在剩余时间内重试，超过截止时间即放弃"""
+        name = channel.get('name')
+        started = time.perf_counter()
+        result = {'channel': name, 'success': False}
+        sender = CHANNEL_SENDERS.get(name)
+        transport = _DeadlineTransport(self.transport, deadline)
+        attempt = 0
+        while True:
+            retryable = False
+            try:
+                if sender is None:
+                    result['message'] = '不支持的通知通道'
+                    break
+                success, response = sender(
+                    transport, channel.get('config') or {}, title, content, deadline.remaining()
+                )
+                result['success'] = success
+                if success:
+                    result['message'] = '发送成功'
+                elif response is not None:
+                    result['message'] = f"发送失败: HTTP {response.status_code} {response.text[:200]}"
+                    retryable = response.status_code >= 500
+                else:
+                    result['message'] = '发送失败'
+            except ChannelTimeout as e:
+                result['message'] = str(e)
+                result['timed_out'] = True
+                self._warn(f"⏱️ 通知[{name}] {e}，已放弃")
+                break
+            except requests.RequestException as e:
+                result['message'] = str(e)
+                retryable = True
+            except Exception as e:
+                result['message'] = str(e)
+            attempt += 1
+            if result['success'] or not retryable or attempt > retry_times:
+                break
+            if deadline.expires - time.monotonic() <= _RETRY_BACKOFF:
+                break
+            time.sleep(_RETRY_BACKOFF)
+        if not result['success'] and not result.get('timed_out') and time.monotonic() >= deadline.expires:
+            # requests 的连接/读取超时取的是剩余时间，到期时表现为超时异常
+            result['timed_out'] = True
+            self._warn(f"⏱️ 通知[{name}] 超过截止时间 {deadline.seconds:g}s，已放弃")
+        if attempt > 1:
+            result['attempts'] = attempt
+        latency = time.perf_counter() - started
+        result['latency_ms'] = round(latency * 1000, 1)
+        NOTIFICATION_SEND_SECONDS.observe(latency, (str(name), 'success' if result['success'] else 'failure'))
+        return result
+
+    def send(self, title: str, content: str, channels: List[Dict[str, Any]],
+             channel_timeout: Optional[float] = None,
+             total_timeout: Optional[float] = None,
+             retry_times: Optional[int] = None) -> List[Dict[str, Any]]:
+        """并行发送到所有通道
+
+        截止时间从提交时起算（排队等待也计入），由各通道的发送函数自己执行；
+        极端情况下（如第三方库不遵守超时）截止时间后仍未返回的通道记为超时并记录日志。
+        """
+        channel_timeout = channel_timeout or self.channel_timeout
+        total_timeout = total_timeout or self.total_timeout
+        retry_times = self.retry_times if retry_times is None else int(retry_times)
+        limit = min(channel_timeout, total_timeout)
+
+        futures = [
+            (channel, self._executor.submit(
+                self._send_one, channel, title, content, _Deadline(limit), retry_times
+            ))
+            for channel in channels
+        ]
+        wait([future for _, future in futures], timeout=limit + _DEADLINE_GRACE)
+
+        results = []
+        for channel, future in futures:
+            if future.done():
+                results.append(future.result())
+            else:
+                self._warn(f"⏱️ 通知[{channel.get('name')}] 超过截止时间 {limit:g}s 仍未返回")
+                results.append({
+                    'channel': channel.get('name'),
+                    'success': False,
+                    'timed_out': True,
+                    'message': f'超过截止时间 {limit:g}s',
+                    'latency_ms': round(limit * 1000, 1)
+                })
+        return results
+
+    def send_report(self, notification_config: Dict[str, Any], title: str,
+                    content: str) -> List[Dict[str, Any]]:
+        """按 notification 配置发送到所有已启用的通道"""
+        if not notification_config.get('enabled'):
+            return []
+        channels = [
+            channel for channel in notification_config.get('channels') or []
+            if channel.get('enabled', True)
+        ]
+        if not channels:
+            return []
+        return self.send(
+            title, content, channels,
+            channel_timeout=notification_config.get('channel_timeout'),
+            total_timeout=notification_config.get('total_timeout'),
+            retry_times=notification_config.get('retry_times')
+        )
+
+    def send_report_async(self, notification_config: Dict[str, Any], title: str,
+                          content: Union[str, Callable[[], str]], callback: Optional[Callable] = None):
+        """在后台线程中发送报告，不阻塞调用方（content 可以是在后台线程中生成内容的函数）"""
+        def _run():
+            text = content() if callable(content) else content
+            results = self.send_report(notification_config, title, text)
+            if callback is not None:
+                callback(results)
+
+        threading.Thread(target=_run, name='weread-report', daemon=True).start()
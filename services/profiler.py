@@ -0,0 +1,284 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""按需性能剖析
+
+两部分，都在运行时通过 API 开关，默认关闭：
+
+- 请求采样：按比例抽取 Web API 请求，记录墙钟耗时和线程 CPU 时间，保留最近的样本并按路由汇总。
+  关闭时每个请求只多一次属性判断。
+- 阅读引擎剖析：在限定时长内剖析阅读引擎线程（事件循环 + 请求线程池）。
+  cprofile 模式在事件循环线程上启用 cProfile，结果下载为 pstats 文件；
+  stack 模式由采样线程定时读取这些线程的调用栈，结果下载为折叠栈文本（flamegraph.pl / speedscope 可直接读取）。
+"""
+
+import cProfile
+import io
+import marshal
+import pstats
+import random
+import sys
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+# 剖析窗口上限（秒）
+MAX_DURATION = 600
+# 采样间隔范围（秒）
+MIN_INTERVAL = 0.001
+MAX_INTERVAL = 1.0
+# 折叠栈最多保留的不同调用栈数，超出的样本计入 [other]
+MAX_STACKS = 20000
+
+# 阅读引擎线程：事件循环线程与请求线程池
+_ENGINE_THREAD = 'weread-engine'
+_WORKER_PREFIX = 'weread-io'
+
+
+class ProfilerBusyError(RuntimeError):
+    """已有剖析在进行中"""
+
+
+def _engine_threads() -> Dict[int, str]:
+    """当前的阅读引擎线程 {线程ID: 线程名}"""
+    return {
+        thread.ident: thread.name for thread in threading.enumerate()
+        if thread.ident is not None
+        and (thread.name == _ENGINE_THREAD or thread.name.startswith(_WORKER_PREFIX))
+    }
+
+
+def _collapse(frame) -> List[str]:
+    """调用栈（由外到内）：文件名:函数名:行号"""
+    stack = []
+    while frame is not None:
+        code = frame.f_code
+        stack.append(f"{code.co_filename.rsplit('/', 1)[-1]}:{code.co_name}:{frame.f_lineno}")
+        frame = frame.f_back
+    stack.reverse()
+    return stack
+
+
+class _Capture:
+    """一次剖析窗口"""
+
+    def __init__(self, mode: str, duration: float, interval: float):
+        self.mode = mode
+        self.duration = duration
+        self.interval = interval
+        self.started_at = datetime.now()
+        self.started = time.monotonic()
+        self.ended: Optional[float] = None
+        self.samples = 0
+        self.stacks: Dict[str, int] = {}
+        self.profile: Optional[cProfile.Profile] = None
+        self.pstats_data: Optional[bytes] = None
+        self.stop_event = threading.Event()
+        self.done = threading.Event()
+
+    @property
+    def running(self) -> bool:
+        return not self.done.is_set()
+
+    def describe(self) -> Dict[str, Any]:
+        ended = self.ended if self.ended is not None else time.monotonic()
+        return {
+            'mode': self.mode,
+            'running': self.running,
+            'started_at': self.started_at.isoformat(),
+            'duration': self.duration,
+            'elapsed': round(ended - self.started, 2),
+            'interval': self.interval if self.mode == 'stack' else None,
+            'samples': self.samples,
+            'unique_stacks': len(self.stacks),
+            'formats': ['pstats'] if self.mode == 'cprofile' else ['collapsed']
+        }
+
+
+class Profiler:
+    """请求采样与阅读引擎剖析
+
+    call_in_engine(callback) 在阅读引擎的事件循环线程上执行回调，cprofile 模式用它启停 cProfile。
+    """
+
+    def __init__(self, call_in_engine: Callable[[Callable[[], None]], None], history_size: int = 500):
+        self.call_in_engine = call_in_engine
+        self.request_sample_rate = 0.0
+        self._requests: Deque[Dict[str, Any]] = deque(maxlen=history_size)
+        self._capture: Optional[_Capture] = None
+        self._lock = threading.Lock()
+
+    # ==================== 请求采样 ====================
+
+    def set_request_sample_rate(self, rate: float):
+        """设置请求采样比例（0 关闭，1 全部采样）"""
+        rate = float(rate)
+        if not 0 <= rate <= 1:
+            raise ValueError('采样比例必须在 0 到 1 之间')
+        self.request_sample_rate = rate
+
+    def should_sample(self) -> bool:
+        rate = self.request_sample_rate
+        return rate > 0 and (rate >= 1 or random.random() < rate)
+
+    @staticmethod
+    def request_started() -> Tuple[float, float]:
+        return time.perf_counter(), time.thread_time()
+
+    def request_finished(self, started: Tuple[float, float], method: str, route: str, status: int):
+        """记录一个采样请求（在处理请求的线程中调用，CPU 时间为该线程的时间）"""
+        wall, cpu = started
+        self._requests.append({
+            'timestamp': datetime.now().isoformat(),
+            'method': method,
+            'route': route,
+            'status': status,
+            'wall_ms': round((time.perf_counter() - wall) * 1000, 3),
+            'cpu_ms': round((time.thread_time() - cpu) * 1000, 3)
+        })
+
+    def request_summary(self) -> List[Dict[str, Any]]:
+        """按路由汇总采样请求，按总耗时降序"""
+        routes: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        for sample in list(self._requests):
+            entry = routes.setdefault((sample['method'], sample['route']), {
+                'method': sample['method'], 'route': sample['route'],
+                'count': 0, 'wall_ms_total': 0.0, 'wall_ms_max': 0.0, 'cpu_ms_total': 0.0
+            })
+            entry['count'] += 1
+            entry['wall_ms_total'] += sample['wall_ms']
+            entry['wall_ms_max'] = max(entry['wall_ms_max'], sample['wall_ms'])
+            entry['cpu_ms_total'] += sample['cpu_ms']
+        summary = []
+        for entry in routes.values():
+            count = entry['count']
+            summary.append({
+                'method': entry['method'],
+                'route': entry['route'],
+                'count': count,
+                'wall_ms_avg': round(entry['wall_ms_total'] / count, 3),
+                'wall_ms_max': entry['wall_ms_max'],
+                'cpu_ms_avg': round(entry['cpu_ms_total'] / count, 3),
+                'wall_ms_total': round(entry['wall_ms_total'], 3)
+            })
+        summary.sort(key=lambda entry: entry['wall_ms_total'], reverse=True)
+        return summary
+
+    def recent_requests(self, limit: int = 50) -> List[Dict[str, Any]]:
+        samples = list(self._requests)
+        return samples[-limit:] if limit > 0 else []
+
+    def clear_requests(self):
+        self._requests.clear()
+
+    # ==================== 阅读引擎剖析 ====================
+
+    def start_capture(self, mode: str = 'stack', duration: float = 30,
+                      interval: float = 0.005) -> Dict[str, Any]:
+        """开始一个剖析窗口，duration 秒后自动结束；已有剖析在进行时抛出 ProfilerBusyError"""
+        if mode not in ('stack', 'cprofile'):
+            raise ValueError(f"未知的剖析模式: {mode}")
+        duration = float(duration)
+        interval = float(interval)
+        if not 0 < duration <= MAX_DURATION:
+            raise ValueError(f"剖析时长必须在 0 到 {MAX_DURATION} 秒之间")
+        if not MIN_INTERVAL <= interval <= MAX_INTERVAL:
+            raise ValueError(f"采样间隔必须在 {MIN_INTERVAL} 到 {MAX_INTERVAL} 秒之间")
+
+        with self._lock:
+            if self._capture is not None and self._capture.running:
+                raise ProfilerBusyError('已有剖析在进行中')
+            capture = self._capture = _Capture(mode, duration, interval)
+
+        target = self._sample_stacks if mode == 'stack' else self._run_cprofile
+        threading.Thread(target=target, args=(capture,), name='weread-profiler', daemon=True).start()
+        return capture.describe()
+
+    def stop_capture(self, timeout: float = 5.0) -> Optional[Dict[str, Any]]:
+        """提前结束当前剖析窗口，等待结果就绪"""
+        capture = self._capture
+        if capture is None:
+            return None
+        capture.stop_event.set()
+        capture.done.wait(timeout)
+        return capture.describe()
+
+    def _sample_stacks(self, capture: _Capture):
+        """定时读取阅读引擎线程的调用栈并折叠计数"""
+        stacks = capture.stacks
+        deadline = capture.started + capture.duration
+        try:
+            while not capture.stop_event.wait(capture.interval) and time.monotonic() < deadline:
+                threads = _engine_threads()
+                frames = sys._current_frames()
+                for ident, name in threads.items():
+                    frame = frames.get(ident)
+                    if frame is None:
+                        continue
+                    key = ';'.join([name.rstrip('_0123456789') or name] + _collapse(frame))
+                    if key not in stacks and len(stacks) >= MAX_STACKS:
+                        key = '[other]'
+                    stacks[key] = stacks.get(key, 0) + 1
+                    capture.samples += 1
+                del frames
+        finally:
+            capture.ended = time.monotonic()
+            capture.done.set()
+
+    def _run_cprofile(self, capture: _Capture):
+        """在事件循环线程上启用 cProfile，窗口结束后停用并生成 pstats 数据"""
+        profile = capture.profile = cProfile.Profile()
+        enabled = threading.Event()
+
+        def _enable():
+            try:
+                profile.enable()
+            finally:
+                enabled.set()
+
+        def _disable():
+            try:
+                profile.disable()
+            finally:
+                disabled.set()
+
+        disabled = threading.Event()
+        try:
+            self.call_in_engine(_enable)
+            if not enabled.wait(5):
+                return
+            capture.stop_event.wait(capture.duration)
+            self.call_in_engine(_disable)
+            if not disabled.wait(5):
+                return
+            stats = pstats.Stats(profile)
+            capture.samples = sum(entry[1] for entry in stats.stats.values())
+            # 与 pstats.Stats.dump_stats 写出的文件格式相同
+            capture.pstats_data = marshal.dumps(stats.stats)
+        finally:
+            capture.ended = time.monotonic()
+            capture.profile = None
+            capture.done.set()
+
+    def status(self) -> Dict[str, Any]:
+        capture = self._capture
+        return {
+            'request_sample_rate': self.request_sample_rate,
+            'sampled_requests': len(self._requests),
+            'capture': capture.describe() if capture is not None else None
+        }
+
+    def export(self, fmt: str) -> Optional[bytes]:
+        """最近一次剖析的结果：pstats（cprofile 模式）或 collapsed（stack 模式）；没有结果时返回 None"""
+        capture = self._capture
+        if capture is None or capture.running:
+            return None
+        if fmt == 'pstats':
+            return capture.pstats_data
+        if fmt == 'collapsed' and capture.mode == 'stack':
+            buffer = io.StringIO()
+            for stack, count in sorted(capture.stacks.items()):
+                buffer.write(f'{stack} {count}\n')
+            return buffer.getvalue().encode('utf-8')
+        return None
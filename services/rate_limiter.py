@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""请求频率限制
+
+两级令牌桶：一个全局桶限制所有会话的总请求速率，每个用户一个桶执行
+network.rate_limit。先等用户桶，轮到该用户后才取全局令牌，被自己速率限制的用户不会提前占用全局名额；
+等待被取消（停止或暂停任务）时预约的令牌退回桶中。等待通过 asyncio.sleep 完成，不占用任何线程。
+"""
+
+import asyncio
+import bisect
+import threading
+import time
+from typing import Any, Dict, Optional
+
+
+# 等待时长直方图的桶边界（秒）
+WAIT_BUCKETS = (0.0, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0)
+
+
+class TokenBucket:
+    """令牌桶（预约式：令牌可以透支，返回需要等待的时长）"""
+
+    __slots__ = ('rate', 'capacity', 'tokens', 'updated')
+
+    def __init__(self, rate_per_minute: float, capacity: float = 1.0, now: Optional[float] = None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = max(1.0, capacity)
+        self.tokens = self.capacity
+        self.updated = time.monotonic() if now is None else now
+
+    def update(self, rate_per_minute: float, capacity: float, now: float):
+        """原地修改速率与容量：先按旧速率结算到 now，已有的令牌和透支都保留"""
+        if not self.unlimited:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.rate = rate_per_minute / 60.0
+        self.capacity = max(1.0, capacity)
+        self.tokens = min(self.capacity, self.tokens)
+
+    @property
+    def unlimited(self) -> bool:
+        return self.rate <= 0
+
+    def reserve(self, now: float) -> float:
+        """预约一个令牌，返回需要等待的秒数"""
+        if self.unlimited:
+            return 0.0
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= 1
+        if self.tokens >= 0:
+            return 0.0
+        return -self.tokens / self.rate
+
+    def refund(self):
+        """退回一个预约了但没有使用的令牌"""
+        if not self.unlimited:
+            self.tokens = min(self.capacity, self.tokens + 1)
+
+
+class RateLimiter:
+    """全局 + 每用户两级令牌桶限流器"""
+
+    def __init__(self, rate_limit: float = 10, global_rate_limit: float = 0, burst: float = 1):
+        self._lock = threading.Lock()
+        self._users: Dict[str, TokenBucket] = {}
+        # 单独指定过速率的用户（任务覆盖项等），不跟随默认速率
+        self._user_rates: Dict[str, float] = {}
+        self._waiting: Dict[str, int] = {}
+        # 最后一格为超过最大边界的等待
+        self._histogram = [0] * (len(WAIT_BUCKETS) + 1)
+        self._wait_total = 0.0
+        self._acquired = 0
+        self.rate_limit = float(rate_limit or 0)
+        self.global_rate_limit = float(global_rate_limit or 0)
+        self.burst = float(burst or 1)
+        self._global = TokenBucket(self.global_rate_limit, self.burst)
+
+    def configure(self, rate_limit: float, global_rate_limit: float = 0, burst: float = 1,
+                  user: Optional[str] = None):
+        """更新速率（请求/分钟），0 表示不限制
+
+        指定 user 时只修改该用户的速率，否则修改默认速率（作用于没有单独指定速率的用户）。
+        现有的桶都原地修改速率，不会丢弃已有的令牌和透支，参数未变化时不做任何事。
+        """
+        rate_limit = float(rate_limit or 0)
+        global_rate_limit = float(global_rate_limit or 0)
+        burst = float(burst or 1)
+        now = time.monotonic()
+        with self._lock:
+            if (global_rate_limit, burst) != (self.global_rate_limit, self.burst):
+                self.global_rate_limit = global_rate_limit
+                self._global.update(global_rate_limit, burst, now)
+            burst_changed = burst != self.burst
+            self.burst = burst
+            if user is not None:
+                self._user_rates[user] = rate_limit
+                bucket = self._users.get(user)
+                if bucket is not None:
+                    bucket.update(rate_limit, burst, now)
+                return
+            if rate_limit == self.rate_limit and not burst_changed:
+                return
+            self.rate_limit = rate_limit
+            for name, bucket in self._users.items():
+                bucket.update(self._user_rates.get(name, rate_limit), burst, now)
+
+    def _bucket(self, user: str, now: float) -> TokenBucket:
+        """用户的桶（调用方持有锁）"""
+        bucket = self._users.get(user)
+        if bucket is None:
+            rate = self._user_rates.get(user, self.rate_limit)
+            bucket = self._users[user] = TokenBucket(rate, self.burst, now)
+        return bucket
+
+    def reserve(self, user: str) -> float:
+        """从用户桶预约一个令牌，返回需要等待的秒数"""
+        now = time.monotonic()
+        with self._lock:
+            return self._bucket(user, now).reserve(now)
+
+    def reserve_global(self) -> float:
+        """从全局桶预约一个令牌，返回需要等待的秒数"""
+        now = time.monotonic()
+        with self._lock:
+            return self._global.reserve(now)
+
+    def _refund(self, bucket: TokenBucket):
+        with self._lock:
+            bucket.refund()
+
+    def _set_waiting(self, user: str, delta: int):
+        with self._lock:
+            count = self._waiting.get(user, 0) + delta
+            if count > 0:
+                self._waiting[user] = count
+            else:
+                self._waiting.pop(user, None)
+
+    async def acquire(self, user: str):
+        """等待直到用户可以发送下一次请求：先等用户桶，再等全局桶；取消时退回两边的令牌"""
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._bucket(user, now)
+            wait = bucket.reserve(now)
+        global_wait = 0.0
+        waiting = False
+        try:
+            if wait > 0:
+                self._set_waiting(user, 1)
+                waiting = True
+                await asyncio.sleep(wait)
+            global_wait = self.reserve_global()
+            if global_wait > 0:
+                if not waiting:
+                    self._set_waiting(user, 1)
+                    waiting = True
+                try:
+                    await asyncio.sleep(global_wait)
+                except asyncio.CancelledError:
+                    self._refund(self._global)
+                    raise
+        except asyncio.CancelledError:
+            self._refund(bucket)
+            raise
+        finally:
+            if waiting:
+                self._set_waiting(user, -1)
+        total = wait + global_wait
+        with self._lock:
+            # 第 i 格统计 (WAIT_BUCKETS[i-1], WAIT_BUCKETS[i]] 内的等待
+            self._histogram[bisect.bisect_left(WAIT_BUCKETS, total)] += 1
+            self._wait_total += total
+            self._acquired += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        """队列深度与等待时长直方图（le_X 为等待不超过 X 秒的累计次数）"""
+        with self._lock:
+            histogram, cumulative = {}, 0
+            for bound, count in zip(WAIT_BUCKETS + ('inf',), self._histogram):
+                cumulative += count
+                histogram[f"le_{bound}"] = cumulative
+            return {
+                'rate_limit': self.rate_limit,
+                'global_rate_limit': self.global_rate_limit,
+                'queue_depth': sum(self._waiting.values()),
+                'queue_depth_by_user': dict(self._waiting),
+                'acquired': self._acquired,
+                'avg_wait': round(self._wait_total / self._acquired, 3) if self._acquired else 0.0,
+                'wait_histogram': histogram
+            }
@@ -0,0 +1,373 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""异步阅读引擎
+
+所有用户的阅读会话都作为协程运行在同一个事件循环线程上，
+阻塞操作（网络请求等）统一交给有界线程池执行，
+因此同时驱动的会话数量不再受线程数限制。
+会话中的所有等待都可以被取消（停止）或暂停打断，暂停中的会话只是挂起的协程，不占用线程。
+"""
+
+import asyncio
+import functools
+import threading
+import time
+from datetime import datetime
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+from .config_manager import ConfigView
+from .curl_parser import CurlParseError, CurlParserCache, CurlTemplate
+from .http_client import HttpTransport
+from .log_manager import LogManager
+from .metrics import READING_REQUEST_SECONDS, SLEEP_DRIFT_SECONDS
+from .rate_limiter import RateLimiter
+from .user_settings import Range, UserSettings
+
+
+def parse_range(range_str: Any, default: float = 60.0) -> float:
+    """解析范围字符串，如 '60-70' 返回区间内的随机数"""
+    return Range.parse(range_str, default).sample()
+
+
+class ReadingEngine:
+    """异步阅读引擎（单事件循环线程 + 有界线程池）"""
+
+    def __init__(self, max_workers: int = 4):
+        self.max_workers = max(1, int(max_workers))
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop:
+        """事件循环（首次访问时启动）"""
+        self.start()
+        return self._loop
+
+    def start(self):
+        """启动事件循环线程"""
+        with self._lock:
+            if self._loop is not None:
+                return
+
+            loop = asyncio.new_event_loop()
+            executor = ThreadPoolExecutor(
+                max_workers=self.max_workers,
+                thread_name_prefix='weread-io'
+            )
+            loop.set_default_executor(executor)
+            ready = threading.Event()
+
+            def _run():
+                asyncio.set_event_loop(loop)
+                ready.set()
+                loop.run_forever()
+
+            thread = threading.Thread(target=_run, name='weread-engine', daemon=True)
+            thread.start()
+            ready.wait()
+
+            self._loop = loop
+            self._executor = executor
+            self._thread = thread
+
+    def submit(self, coro) -> Future:
+        """在引擎线程上调度协程，返回线程安全的 Future"""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def call_soon(self, callback: Callable, *args):
+        """在引擎线程上执行回调"""
+        self.loop.call_soon_threadsafe(callback, *args)
+
+    async def run_blocking(self, func: Callable, *args, **kwargs):
+        """在有界线程池中执行阻塞函数"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, functools.partial(func, *args, **kwargs))
+
+    def submit_blocking(self, func: Callable, *args) -> Future:
+        """从任意线程把阻塞函数放到有界线程池执行（事件循环线程上的回调用它把磁盘 IO 移出循环）"""
+        self.start()
+        return self._executor.submit(func, *args)
+
+    def shutdown(self):
+        """停止事件循环并回收线程池"""
+        with self._lock:
+            loop, thread, executor = self._loop, self._thread, self._executor
+            self._loop = self._thread = self._executor = None
+
+        if loop is None:
+            return
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join(timeout=5)
+        executor.shutdown(wait=False)
+
+
+class ReadingSession:
+    """单个用户的阅读会话（协程）"""
+
+    __slots__ = (
+        'user', 'settings', 'config_view', 'log_manager', 'status', 'progress',
+        'request_count', 'target_seconds', 'elapsed', 'start_time', 'end_time',
+        'listener', 'file_path', 'transport', 'curl_cache', 'template', 'http',
+        'failure_count', 'rate_limiter', 'paused_seconds', '_paused_at', '_resumed', '_pause_signal',
+        'resume_state', 'checkpointer', 'stats_recorder'
+    )
+
+    def __init__(self, user: str, config_view: ConfigView, log_manager: LogManager,
+                 file_path: Optional[str] = None, transport: Optional[HttpTransport] = None,
+                 curl_cache: Optional[CurlParserCache] = None,
+                 rate_limiter: Optional[RateLimiter] = None):
+        self.user = user
+        self.config_view = config_view
+        self.settings: UserSettings = config_view.settings()
+        self.log_manager = log_manager
+        self.file_path = file_path
+        self.transport = transport
+        self.curl_cache = curl_cache
+        self.template: Optional[CurlTemplate] = None
+        self.http = None
+        self.failure_count = 0
+        self.rate_limiter = rate_limiter
+        self.status = 'pending'
+        self.progress = 0
+        self.request_count = 0
+        self.target_seconds = 0.0
+        self.elapsed = 0.0
+        self.start_time: Optional[str] = None
+        self.end_time: Optional[str] = None
+        self.listener: Optional[Callable[[], None]] = None
+        self.paused_seconds = 0.0
+        self._paused_at: Optional[float] = None
+        # 未暂停时 _resumed 处于 set 状态；暂停时 _pause_signal 被 set，用于打断正在进行的等待
+        self._resumed = asyncio.Event()
+        self._resumed.set()
+        self._pause_signal = asyncio.Event()
+        # 从检查点恢复时的进度；checkpointer(session, force) 由任务管理器注入，负责节流写入
+        self.resume_state: Optional[Dict[str, Any]] = None
+        self.checkpointer: Optional[Callable[['ReadingSession', bool], None]] = None
+        # stats_recorder(session, latency_ms, ok) 由任务管理器注入，只把记录放进统计写入队列
+        self.stats_recorder: Optional[Callable[['ReadingSession', float, bool], None]] = None
+
+    @property
+    def is_paused(self) -> bool:
+        return self._paused_at is not None
+    
+    def pause(self):
+        """暂停会话（需在事件循环线程调用），正在进行的等待立即被打断"""
+        if self.is_paused or self.status != 'running':
+            return
+        self._paused_at = time.monotonic()
+        self._resumed.clear()
+        self._pause_signal.set()
+        self.status = 'paused'
+        self._log('info', "⏸️ 会话已暂停")
+        self._changed()
+    
+    def resume(self):
+        """恢复会话（需在事件循环线程调用），暂停时长不计入阅读时长"""
+        if not self.is_paused:
+            return
+        self.paused_seconds += time.monotonic() - self._paused_at
+        self._paused_at = None
+        self._pause_signal.clear()
+        self._resumed.set()
+        self.status = 'running'
+        self._log('info', "▶️ 会话已恢复")
+        self._changed()
+    
+    async def _wait(self, seconds: float):
+        """可暂停的等待：暂停期间挂起且不计时，恢复后只等待剩余时间；停止时随 CancelledError 立即退出"""
+        loop = asyncio.get_running_loop()
+        remaining = seconds
+        while True:
+            if self.is_paused:
+                await self._resumed.wait()
+            if remaining <= 0:
+                return
+            started = loop.time()
+            try:
+                await asyncio.wait_for(self._pause_signal.wait(), remaining)
+            except asyncio.TimeoutError:
+                return
+            remaining -= loop.time() - started
+    
+    def _changed(self):
+        """通知状态变化"""
+        if self.listener is not None:
+            self.listener()
+
+    async def _open_http_session(self):
+        """加载 curl 模板，并创建携带其 Cookie 和请求头的用户会话"""
+        if self.transport is None:
+            return
+        if self.file_path and self.curl_cache is not None:
+            loop = asyncio.get_running_loop()
+            try:
+                self.template = await loop.run_in_executor(None, self.curl_cache.get, self.file_path)
+            except (OSError, CurlParseError) as e:
+                self._log('warning', f"⚠️ 解析CURL文件失败: {e}")
+            if self.template is None:
+                self._log('warning', f"⚠️ 未找到可用的CURL文件 {self.file_path}，将以模拟方式阅读")
+
+        if self.template is not None:
+            self.http = self.transport.user_session(
+                self.user, cookies=self.template.cookies, headers=self.template.headers
+            )
+
+    def _send_request(self):
+        template = self.template
+        body = template.body.encode('utf-8') if template.body else None
+        response = self.http.request(
+            template.method, template.url, data=body, timeout=self.settings.timeout
+        )
+        return response.ok
+
+    async def _send_reading_request(self) -> bool:
+        """发送一次阅读请求（没有 curl 模板时只做模拟）"""
+        if self.http is None:
+            return True
+        if self.rate_limiter is not None:
+            await self.rate_limiter.acquire(self.user)
+        loop = asyncio.get_running_loop()
+        started = time.perf_counter()
+        try:
+            ok = await loop.run_in_executor(None, self._send_request)
+        except Exception as e:
+            self._log('warning', f"⚠️ 阅读请求失败: {e}")
+            ok = False
+        latency = time.perf_counter() - started
+        READING_REQUEST_SECONDS.observe(latency, (self.user, 'success' if ok else 'failure'))
+        if self.stats_recorder is not None:
+            self.stats_recorder(self, latency * 1000, ok)
+        if not ok:
+            self.failure_count += 1
+        return ok
+
+    def _refresh_config(self):
+        """配置有新版本时切换到新参数（每轮请求前调用，无变化时只是一次版本号比较）"""
+        settings = self.config_view.settings()
+        if settings is self.settings:
+            return
+        previous, self.settings = self.settings, settings
+        target = settings.target_duration
+        if (target.low, target.high) != (previous.target_duration.low, previous.target_duration.high):
+            self.target_seconds = target.sample() * 60
+        if self.rate_limiter is not None:
+            self.rate_limiter.configure(settings.rate_limit, settings.global_rate_limit, user=self.user)
+        self._log('info', f"🔄 已应用新配置（版本 {settings.version}）")
+
+    def _checkpoint(self, force: bool = False):
+        if self.checkpointer is not None:
+            self.checkpointer(self, force)
+    
+    def checkpoint_state(self) -> Dict[str, Any]:
+        """写入检查点的进度字段"""
+        template = self.template
+        return {
+            'user': self.user,
+            'status': self.status,
+            'elapsed': round(self.elapsed, 1),
+            'target_seconds': round(self.target_seconds, 1),
+            'request_count': self.request_count,
+            'failure_count': self.failure_count,
+            'book_id': template.book_id if template else None,
+            'chapter_id': template.chapter_id if template else None
+        }
+    
+    def _log(self, level: str, message: str):
+        self.log_manager.log(level, f"[{self.user}] {message}", user=self.user)
+
+    async def run(self):
+        """执行阅读会话"""
+        self.status = 'running'
+        self.start_time = datetime.now().isoformat()
+        self._changed()
+        try:
+            await self._open_http_session()
+
+            resumed = self.resume_state
+            if resumed:
+                # 从检查点继续：沿用原目标时长和已读进度，跳过启动延迟
+                self.target_seconds = float(resumed.get('target_seconds') or 0) \
+                    or self.settings.target_duration.sample() * 60
+                self.elapsed = float(resumed.get('elapsed') or 0)
+                self.request_count = int(resumed.get('request_count') or 0)
+                self.failure_count = int(resumed.get('failure_count') or 0)
+                self._log(
+                    'info',
+                    f"♻️ 从检查点恢复，已阅读 {self.elapsed/60:.1f} 分钟, "
+                    f"目标时长: {self.target_seconds/60:.0f} 分钟"
+                )
+            else:
+                delay = self.settings.startup_delay.sample()
+                self._log('info', f"等待 {delay:.0f} 秒...")
+                await self._wait(delay)
+
+                self.target_seconds = self.settings.target_duration.sample() * 60
+                self._log(
+                    'info',
+                    f"📖 开始阅读，模式: {self.settings.mode}, "
+                    f"目标时长: {self.target_seconds/60:.0f} 分钟"
+                )
+
+            started = time.monotonic() - self.elapsed
+            paused_before = self.paused_seconds
+            while self.elapsed < self.target_seconds:
+                self._refresh_config()
+                if self.request_count % 10 == 0:
+                    self._log(
+                        'info',
+                        f"⏱️ 已阅读 {self.elapsed/60:.1f} 分钟, 进度: {self.progress}%"
+                    )
+
+                # 执行阅读请求
+                await self._send_reading_request()
+                self.request_count += 1
+                interval = self.settings.reading_interval.sample()
+                wait_started, paused_at_start = time.monotonic(), self.paused_seconds
+                await self._wait(interval)
+                # 调度偏差：实际等待减去计划间隔（不含暂停时长）
+                SLEEP_DRIFT_SECONDS.observe(
+                    time.monotonic() - wait_started - (self.paused_seconds - paused_at_start) - interval,
+                    (self.user,)
+                )
+                self.elapsed = time.monotonic() - started - (self.paused_seconds - paused_before)
+                self.progress = min(99, int((self.elapsed / self.target_seconds) * 100))
+                self._changed()
+                self._checkpoint()
+
+            self.progress = 100
+            self.status = 'completed'
+            self._log('info', f"✅ 阅读完成，共发送 {self.request_count} 个请求")
+        except asyncio.CancelledError:
+            self.status = 'stopped'
+            self._log('info', "⏹️ 会话已停止")
+            raise
+        except Exception as e:
+            self.status = 'failed'
+            self._log('error', f"❌ 会话执行失败: {e}")
+        finally:
+            if self.http is not None:
+                self.transport.release_user(self.user)
+                self.http = None
+            self.end_time = datetime.now().isoformat()
+            self._changed()
+            if self.status != 'stopped':
+                self._checkpoint(force=True)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """会话状态快照"""
+        return {
+            'user': self.user,
+            'status': self.status,
+            'progress': self.progress,
+            'request_count': self.request_count,
+            'failure_count': self.failure_count,
+            'paused_seconds': round(self.paused_seconds, 1),
+            'elapsed': round(self.elapsed, 1),
+            'target_seconds': round(self.target_seconds, 1),
+            'start_time': self.start_time,
+            'end_time': self.end_time
+        }
@@ -0,0 +1,372 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""定时调度
+
+cron 表达式只解析一次，预先展开成每个字段允许取值的有序元组，
+下一次触发时间按字段逐级跳转直接算出，不做逐分钟轮询。
+所有任务（全局和每个用户的定时、守护进程的一次性唤醒）放在同一个按触发时间排序的最小堆里，
+调度线程只睡到堆顶任务到期，空闲时不消耗 CPU，定时数量再多也只有一个线程。
+"""
+
+import bisect
+import heapq
+import itertools
+import threading
+import time
+from datetime import datetime, timedelta, tzinfo
+from functools import lru_cache
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+try:
+    from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+except ImportError:  # Python < 3.9
+    ZoneInfo = None
+
+_MONTH_NAMES = {name: index for index, name in enumerate(
+    ('jan', 'feb', 'mar', 'apr', 'may', 'jun', 'jul', 'aug', 'sep', 'oct', 'nov', 'dec'), 1)}
+_WEEKDAY_NAMES = {name: index for index, name in enumerate(
+    ('sun', 'mon', 'tue', 'wed', 'thu', 'fri', 'sat'))}
+
+# (名称, 最小值, 最大值, 名称表)
+_FIELDS = (
+    ('分钟', 0, 59, None),
+    ('小时', 0, 23, None),
+    ('日', 1, 31, None),
+    ('月', 1, 12, _MONTH_NAMES),
+    ('星期', 0, 7, _WEEKDAY_NAMES),
+)
+
+# 表达式无法匹配任何日期时（如 2 月 30 日）的最大搜索年数
+_MAX_YEARS = 8
+
+
+def _parse_value(text: str, label: str, minimum: int, maximum: int,
+                 names: Optional[Dict[str, int]]) -> int:
+    value = names.get(text.lower()) if names else None
+    if value is None:
+        if not text.isdigit():
+            raise ValueError(f"{label}字段无法解析 {text!r}")
+        value = int(text)
+    if value < minimum or value > maximum:
+        raise ValueError(f"{label}字段 {text!r} 超出范围 {minimum}-{maximum}")
+    return value
+
+
+def _parse_field(field: str, label: str, minimum: int, maximum: int,
+                 names: Optional[Dict[str, int]]) -> Tuple[int, ...]:
+    """展开单个字段（*、a、a-b、*/n、a/n、a-b/n 与逗号列表）为有序取值"""
+    values = set()
+    for item in field.split(','):
+        base, _, step_text = item.partition('/')
+        step = 1
+        if step_text:
+            if not step_text.isdigit() or int(step_text) == 0:
+                raise ValueError(f"{label}字段步长无效 {item!r}")
+            step = int(step_text)
+        if base == '*':
+            start, end = minimum, maximum
+        elif '-' in base:
+            start_text, _, end_text = base.partition('-')
+            start = _parse_value(start_text, label, minimum, maximum, names)
+            end = _parse_value(end_text, label, minimum, maximum, names)
+            if start > end:
+                raise ValueError(f"{label}字段区间起点大于终点 {item!r}")
+        else:
+            start = _parse_value(base, label, minimum, maximum, names)
+            # "a/n" 表示从 a 开始每隔 n 个取值
+            end = maximum if step_text else start
+        values.update(range(start, end + 1, step))
+    return tuple(sorted(values))
+
+
+class CronExpression:
+    """5 字段 cron 表达式（分 时 日 月 周）
+
+    日和星期都被限定时按 cron 惯例取并集（任一满足即触发），
+    以 * 开头的字段（包括 */n）视为未限定。
+    在搜索范围（_MAX_YEARS 年）内一次都不会触发的表达式（如 2 月 31 日）视为无效。
+    """
+
+    __slots__ = ('expression', 'minutes', 'hours', 'days', 'months', 'weekdays',
+                 'day_any', 'weekday_any')
+
+    def __init__(self, expression: str):
+        fields = expression.split()
+        if len(fields) != len(_FIELDS):
+            raise ValueError(f"cron 表达式应包含 5 个字段（分 时 日 月 周），实际为 {len(fields)} 个")
+        parsed = [
+            _parse_field(field, label, minimum, maximum, names)
+            for field, (label, minimum, maximum, names) in zip(fields, _FIELDS)
+        ]
+        self.expression = ' '.join(fields)
+        self.minutes, self.hours, self.days, self.months, weekdays = parsed
+        # 0 和 7 都表示周日
+        self.weekdays = frozenset(day % 7 for day in weekdays)
+        self.day_any = fields[2].startswith('*')
+        self.weekday_any = fields[4].startswith('*')
+        if self.next_after(datetime.now()) is None:
+            raise ValueError(f"cron 表达式 {self.expression!r} 在 {_MAX_YEARS} 年内不会触发")
+
+    @staticmethod
+    @lru_cache(maxsize=1024)
+    def parse(expression: str) -> 'CronExpression':
+        """解析表达式（相同表达式共享同一个解析结果）"""
+        return CronExpression(expression)
+
+    def _day_matches(self, moment: datetime) -> bool:
+        day_ok = moment.day in self.days
+        weekday_ok = (moment.weekday() + 1) % 7 in self.weekdays
+        if self.day_any or self.weekday_any:
+            return day_ok and weekday_ok
+        return day_ok or weekday_ok
+
+    def next_after(self, after: datetime) -> Optional[datetime]:
+        """严格晚于 after 的下一个触发时间（墙上时间，不含时区），永不触发时返回 None"""
+        moment = after.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        last_year = moment.year + _MAX_YEARS
+        while moment.year <= last_year:
+            if moment.month not in self.months:
+                index = bisect.bisect_left(self.months, moment.month)
+                if index < len(self.months):
+                    moment = moment.replace(month=self.months[index], day=1, hour=0, minute=0)
+                else:
+                    moment = moment.replace(year=moment.year + 1, month=self.months[0],
+                                            day=1, hour=0, minute=0)
+                continue
+            if not self._day_matches(moment):
+                moment = moment.replace(hour=0, minute=0) + timedelta(days=1)
+                continue
+            if moment.hour not in self.hours:
+                index = bisect.bisect_left(self.hours, moment.hour)
+                if index < len(self.hours):
+                    moment = moment.replace(hour=self.hours[index], minute=0)
+                else:
+                    moment = moment.replace(hour=0, minute=0) + timedelta(days=1)
+                continue
+            if moment.minute not in self.minutes:
+                index = bisect.bisect_left(self.minutes, moment.minute)
+                if index < len(self.minutes):
+                    moment = moment.replace(minute=self.minutes[index])
+                else:
+                    moment = moment.replace(minute=0) + timedelta(hours=1)
+                continue
+            return moment
+        return None
+
+    def __repr__(self) -> str:
+        return f"CronExpression({self.expression!r})"
+
+
+def get_timezone(name: Optional[str]) -> Optional[tzinfo]:
+    """按名称获取时区，未指定或系统没有时区数据时返回 None（使用本地时间）"""
+    if not name or ZoneInfo is None:
+        return None
+    try:
+        return ZoneInfo(name)
+    except (ZoneInfoNotFoundError, ValueError):
+        return None
+
+
+def next_fire_time(cron: CronExpression, tz: Optional[tzinfo], after: float) -> Optional[float]:
+    """after（时间戳）之后下一次触发的时间戳，按 tz 的墙上时间计算"""
+    local = datetime.fromtimestamp(after, tz).replace(tzinfo=None)
+    while True:
+        moment = cron.next_after(local)
+        if moment is None:
+            return None
+        timestamp = moment.replace(tzinfo=tz).timestamp() if tz else moment.timestamp()
+        # 夏令时回拨时同一墙上时间会出现两次，只取晚于 after 的那次
+        if timestamp > after:
+            return timestamp
+        local = moment
+
+
+class ScheduledJob:
+    """堆中的一个定时任务（cron 为 None 时是只触发一次的定时器）"""
+
+    __slots__ = ('job_id', 'cron', 'timezone', 'tz', 'callback', 'payload', 'next_fire')
+
+    def __init__(self, job_id: str, cron: Optional[CronExpression], timezone: Optional[str],
+                 callback: Optional[Callable[[], Any]], payload: Any = None):
+        self.job_id = job_id
+        self.cron = cron
+        self.timezone = timezone
+        self.tz = get_timezone(timezone)
+        self.callback = callback
+        self.payload = payload
+        self.next_fire: Optional[float] = None
+
+    def upcoming(self, count: int, after: Optional[float] = None) -> List[float]:
+        """之后的 count 个触发时间戳"""
+        if self.cron is None:
+            return [self.next_fire] if self.next_fire is not None else []
+        times = []
+        moment = self.next_fire if after is None else next_fire_time(self.cron, self.tz, after)
+        while moment is not None and len(times) < count:
+            times.append(moment)
+            moment = next_fire_time(self.cron, self.tz, moment)
+        return times
+
+    def describe(self, count: int = 3) -> Dict[str, Any]:
+        return {
+            'job_id': self.job_id,
+            'cron_expression': self.cron.expression if self.cron else None,
+            'timezone': self.timezone,
+            'payload': self.payload,
+            'next_runs': [
+                datetime.fromtimestamp(moment, self.tz).isoformat() for moment in self.upcoming(count)
+            ]
+        }
+
+
+class Scheduler:
+    """单线程最小堆调度器
+
+    堆元素为 (触发时间, 序号, 任务)。替换或删除任务时不在堆里查找，
+    而是让旧元素在出堆时因与任务当前状态不符被丢弃（惰性删除）。
+    同一次唤醒中到期、没有自己回调的任务交给 dispatch 一起处理，便于调用方合并成一个阅读任务。
+    """
+
+    # 墙上时钟可能被调整，最长睡眠后重新核对一次
+    MAX_SLEEP = 3600.0
+
+    def __init__(self, dispatch: Optional[Callable[[List[ScheduledJob]], None]] = None,
+                 on_error: Optional[Callable[[ScheduledJob, Exception], None]] = None,
+                 name: str = 'weread-scheduler'):
+        self.dispatch = dispatch
+        self.on_error = on_error
+        self.name = name
+        self._heap: List[Tuple[float, int, ScheduledJob]] = []
+        self._jobs: Dict[str, ScheduledJob] = {}
+        self._counter = itertools.count()
+        self._cond = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self._running = False
+
+    def add_cron(self, job_id: str, expression: str, callback: Optional[Callable[[], Any]] = None,
+                 timezone: Optional[str] = None, payload: Any = None) -> ScheduledJob:
+        """添加或替换 cron 任务（表达式无效时抛出 ValueError）"""
+        job = ScheduledJob(job_id, CronExpression.parse(expression), timezone, callback, payload)
+        with self._cond:
+            self._jobs[job_id] = job
+            self._push(job, time.time())
+        return job
+
+    def call_at(self, job_id: str, when: float, callback: Callable[[], Any],
+                payload: Any = None) -> ScheduledJob:
+        """添加或替换一次性定时器，在时间戳 when 触发后自动移除"""
+        job = ScheduledJob(job_id, None, None, callback, payload)
+        with self._cond:
+            self._jobs[job_id] = job
+            job.next_fire = when
+            self._enqueue(job)
+        return job
+
+    def remove(self, job_id: str) -> bool:
+        """删除任务（堆中的旧元素出堆时丢弃）"""
+        with self._cond:
+            return self._jobs.pop(job_id, None) is not None
+
+    def get(self, job_id: str) -> Optional[ScheduledJob]:
+        return self._jobs.get(job_id)
+
+    def jobs(self) -> List[ScheduledJob]:
+        with self._cond:
+            return list(self._jobs.values())
+
+    def upcoming(self, limit: int = 50) -> List[ScheduledJob]:
+        """按下一次触发时间排序的前 limit 个任务"""
+        with self._cond:
+            jobs = [job for job in self._jobs.values() if job.next_fire is not None]
+        return heapq.nsmallest(limit, jobs, key=lambda job: job.next_fire)
+
+    def _push(self, job: ScheduledJob, after: float):
+        job.next_fire = next_fire_time(job.cron, job.tz, after)
+        if job.next_fire is not None:
+            self._enqueue(job)
+
+    def _enqueue(self, job: ScheduledJob):
+        is_first = not self._heap or job.next_fire < self._heap[0][0]
+        heapq.heappush(self._heap, (job.next_fire, next(self._counter), job))
+        if is_first:
+            # 新任务比当前等待的更早到期，唤醒调度线程重新计算睡眠时间
+            self._cond.notify()
+
+    def start(self):
+        """启动调度线程"""
+        with self._cond:
+            if self._running:
+                return
+            self._running = True
+            self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+            self._thread.start()
+
+    def shutdown(self):
+        """停止调度线程"""
+        with self._cond:
+            self._running = False
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def _pop_due(self) -> Optional[List[ScheduledJob]]:
+        """等待到堆顶任务到期并取出所有到期任务；停止时返回 None"""
+        with self._cond:
+            while self._running:
+                if not self._heap:
+                    self._cond.wait()
+                    continue
+                fire, _, job = self._heap[0]
+                if self._jobs.get(job.job_id) is not job or job.next_fire != fire:
+                    heapq.heappop(self._heap)
+                    continue
+                delay = fire - time.time()
+                if delay > 0:
+                    self._cond.wait(min(delay, self.MAX_SLEEP))
+                    continue
+
+                now = time.time()
+                due = []
+                while self._heap and self._heap[0][0] <= now:
+                    fire, _, job = heapq.heappop(self._heap)
+                    if self._jobs.get(job.job_id) is job and job.next_fire == fire:
+                        due.append(job)
+                        if job.cron is None:
+                            del self._jobs[job.job_id]
+                        else:
+                            # 执行耗时较长时跳过已错过的触发点
+                            self._push(job, max(now, fire))
+                return due
+            return None
+
+    def _run(self):
+        while True:
+            due = self._pop_due()
+            if due is None:
+                return
+            batch = []
+            for job in due:
+                if job.callback is not None:
+                    self._call(job, job.callback)
+                else:
+                    batch.append(job)
+            if batch and self.dispatch is not None:
+                self._call(batch[0], self.dispatch, batch)
+
+    def _call(self, job: ScheduledJob, func: Callable, *args):
+        try:
+            func(*args)
+        except Exception as e:
+            if self.on_error is not None:
+                self.on_error(job, e)
+
+
+def validate_cron(expression: str) -> Optional[str]:
+    """校验 cron 表达式，返回错误描述（通过时返回 None）"""
+    try:
+        CronExpression.parse(expression)
+    except ValueError as e:
+        return str(e)
+    return None
+
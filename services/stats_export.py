@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""阅读统计导出
+
+把 StatsStore.iter_rows 产出的明细逐块编码为 CSV 或 JSON Lines，可选 gzip 流式压缩。
+每攒够 CHUNK_SIZE 字节产出一块，整个导出过程的内存占用与历史数据量无关。
+"""
+
+import csv
+import io
+import json
+import zlib
+from typing import Iterable, Iterator, Sequence, Tuple
+
+# 每块的目标大小（字节）
+CHUNK_SIZE = 64 * 1024
+
+FORMATS = {
+    'csv': ('text/csv', 'csv'),
+    'jsonl': ('application/x-ndjson', 'jsonl')
+}
+
+
+def _encode_csv(columns: Sequence[str], rows: Iterable[Tuple]) -> Iterator[str]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator='\n')
+    writer.writerow(columns)
+    for row in rows:
+        writer.writerow(row)
+        if buffer.tell() >= CHUNK_SIZE:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def _encode_jsonl(columns: Sequence[str], rows: Iterable[Tuple]) -> Iterator[str]:
+    parts, size = [], 0
+    dumps = json.JSONEncoder(ensure_ascii=False, separators=(',', ':')).encode
+    for row in rows:
+        line = dumps(dict(zip(columns, row))) + '\n'
+        parts.append(line)
+        size += len(line)
+        if size >= CHUNK_SIZE:
+            yield ''.join(parts)
+            parts, size = [], 0
+    yield ''.join(parts)
+
+
+def _gzip(chunks: Iterable[bytes]) -> Iterator[bytes]:
+    """流式 gzip 压缩（wbits=31 输出带 gzip 头和校验的完整文件）"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def iter_export(rows: Iterator, fmt: str = 'csv', compress: bool = False) -> Iterator[bytes]:
+    """把 iter_rows 的输出（首项为列名）编码为字节块"""
+    if fmt not in FORMATS:
+        raise ValueError(f"不支持的导出格式: {fmt}")
+    columns = next(rows)
+    encode = _encode_csv if fmt == 'csv' else _encode_jsonl
+    chunks = (text.encode('utf-8') for text in encode(columns, rows) if text)
+    return _gzip(chunks) if compress else chunks
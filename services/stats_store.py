@@ -0,0 +1,370 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""阅读统计存储
+
+每次阅读请求（耗时、结果、用户、书籍、章节）和每个会话的结果写入 SQLite。
+数据库使用 WAL 模式，读取不阻塞写入；写入由后台线程独占一个连接，
+阅读循环只把记录放进队列，按批量大小或间隔在一个事务里批量插入，
+同一事务内同时累加按 (日期, 用户) 预聚合的日汇总表，
+仪表板和阅读报告只查询日汇总，开销与天数成正比而与请求数无关。
+"""
+
+import queue
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS requests (
+    id INTEGER PRIMARY KEY,
+    ts REAL NOT NULL,
+    day TEXT NOT NULL,
+    task_id TEXT,
+    user TEXT NOT NULL,
+    book_id TEXT,
+    chapter_id TEXT,
+    latency_ms REAL NOT NULL,
+    ok INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_requests_day_user ON requests (day, user);
+CREATE TABLE IF NOT EXISTS sessions (
+    id INTEGER PRIMARY KEY,
+    task_id TEXT,
+    user TEXT NOT NULL,
+    day TEXT NOT NULL,
+    start_time TEXT,
+    end_time TEXT,
+    status TEXT NOT NULL,
+    elapsed REAL NOT NULL,
+    request_count INTEGER NOT NULL,
+    failure_count INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_sessions_day_user ON sessions (day, user);
+CREATE TABLE IF NOT EXISTS daily (
+    day TEXT NOT NULL,
+    user TEXT NOT NULL,
+    requests INTEGER NOT NULL DEFAULT 0,
+    failures INTEGER NOT NULL DEFAULT 0,
+    latency_ms_sum REAL NOT NULL DEFAULT 0,
+    latency_ms_max REAL NOT NULL DEFAULT 0,
+    sessions INTEGER NOT NULL DEFAULT 0,
+    completed_sessions INTEGER NOT NULL DEFAULT 0,
+    reading_seconds REAL NOT NULL DEFAULT 0,
+    PRIMARY KEY (day, user)
+);
+"""
+
+_UPSERT_DAILY = """
+INSERT INTO daily (day, user, requests, failures, latency_ms_sum, latency_ms_max,
+                   sessions, completed_sessions, reading_seconds)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (day, user) DO UPDATE SET
+    requests = requests + excluded.requests,
+    failures = failures + excluded.failures,
+    latency_ms_sum = latency_ms_sum + excluded.latency_ms_sum,
+    latency_ms_max = MAX(latency_ms_max, excluded.latency_ms_max),
+    sessions = sessions + excluded.sessions,
+    completed_sessions = completed_sessions + excluded.completed_sessions,
+    reading_seconds = reading_seconds + excluded.reading_seconds
+"""
+
+# 导出的明细列
+EXPORT_COLUMNS = {
+    'requests': ('ts', 'day', 'task_id', 'user', 'book_id', 'chapter_id', 'latency_ms', 'ok'),
+    'sessions': ('task_id', 'user', 'day', 'start_time', 'end_time', 'status', 'elapsed',
+                 'request_count', 'failure_count')
+}
+
+# 写线程控制命令
+_FLUSH = 'flush'
+_RESET = 'reset'
+_STOP = 'stop'
+
+
+def day_of(ts: float) -> str:
+    """时间戳对应的本地日期"""
+    return time.strftime('%Y-%m-%d', time.localtime(ts))
+
+
+class StatsStore:
+    """SQLite 统计存储（后台批量写入 + 日汇总）"""
+
+    def __init__(self, path: str = 'data/stats.db', batch_size: int = 200,
+                 flush_interval: float = 2.0, queue_size: int = 100000):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.batch_size = max(1, int(batch_size))
+        self.flush_interval = float(flush_interval)
+        self.dropped = 0
+        self._queue: 'queue.Queue' = queue.Queue(maxsize=queue_size)
+        self._local = threading.local()
+        self._closed = False
+        # 建表在调用线程完成，保证构造返回后即可查询
+        conn = self._connect()
+        conn.executescript(_SCHEMA)
+        conn.commit()
+        self._thread = threading.Thread(target=self._run, name='weread-stats', daemon=True)
+        self._thread.start()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(str(self.path), timeout=30, check_same_thread=False)
+        conn.execute('PRAGMA journal_mode=WAL')
+        # WAL 下 NORMAL 只在检查点时 fsync，崩溃最多丢失最近的事务，不会损坏数据库
+        conn.execute('PRAGMA synchronous=NORMAL')
+        return conn
+
+    def _reader(self) -> sqlite3.Connection:
+        """每个读取线程各自的连接"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = self._connect()
+            conn.row_factory = sqlite3.Row
+        return conn
+
+    # ==================== 写入 ====================
+
+    def _put(self, item: Tuple):
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            self.dropped += 1
+
+    def record_request(self, task_id: Optional[str], user: str, book_id: Optional[str],
+                       chapter_id: Optional[str], latency_ms: float, ok: bool):
+        """记录一次阅读请求（非阻塞）"""
+        ts = time.time()
+        self._put(('request', (ts, day_of(ts), task_id, user, book_id, chapter_id,
+                               round(latency_ms, 2), 1 if ok else 0)))
+
+    def record_session(self, task_id: Optional[str], session: Dict[str, Any]):
+        """记录一个结束的会话（session 为会话快照）"""
+        ts = time.time()
+        self._put(('session', (
+            task_id, session['user'], day_of(ts), session.get('start_time'), session.get('end_time'),
+            session.get('status') or 'unknown', float(session.get('elapsed') or 0),
+            int(session.get('request_count') or 0), int(session.get('failure_count') or 0)
+        )))
+
+    def _command(self, command: str, timeout: float = 10.0) -> bool:
+        """向写线程发送控制命令并等待执行完成"""
+        if self._closed:
+            return False
+        done = threading.Event()
+        self._queue.put((command, done))
+        return done.wait(timeout)
+
+    def flush(self, timeout: float = 10.0) -> bool:
+        """等待队列中已有的记录写入数据库"""
+        return self._command(_FLUSH, timeout)
+
+    def reset(self) -> bool:
+        """清空所有统计数据"""
+        return self._command(_RESET)
+
+    def close(self):
+        """写完剩余记录并停止写线程"""
+        if self._closed:
+            return
+        self._command(_STOP)
+        self._closed = True
+        self._thread.join(timeout=5)
+
+    def _run(self):
+        conn = self._connect()
+        requests: List[Tuple] = []
+        sessions: List[Tuple] = []
+        deadline = None
+        while True:
+            timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+            try:
+                kind, payload = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                kind, payload = _FLUSH, None
+
+            if kind == 'request':
+                requests.append(payload)
+            elif kind == 'session':
+                sessions.append(payload)
+
+            if kind in ('request', 'session'):
+                if deadline is None:
+                    deadline = time.monotonic() + self.flush_interval
+                if len(requests) + len(sessions) < self.batch_size:
+                    continue
+
+            if requests or sessions:
+                try:
+                    self._write_batch(conn, requests, sessions)
+                except sqlite3.Error as e:
+                    print(f"写入统计失败: {e}")
+                requests, sessions = [], []
+            deadline = None
+
+            if kind == _RESET:
+                with conn:
+                    conn.execute('DELETE FROM requests')
+                    conn.execute('DELETE FROM sessions')
+                    conn.execute('DELETE FROM daily')
+            if isinstance(payload, threading.Event):
+                payload.set()
+            if kind == _STOP:
+                conn.close()
+                return
+
+    @staticmethod
+    def _write_batch(conn: sqlite3.Connection, requests: List[Tuple], sessions: List[Tuple]):
+        """一个事务内插入明细并累加日汇总"""
+        rollup: Dict[Tuple[str, str], List[float]] = {}
+
+        def bucket(day: str, user: str) -> List[float]:
+            entry = rollup.get((day, user))
+            if entry is None:
+                entry = rollup[(day, user)] = [0, 0, 0.0, 0.0, 0, 0, 0.0]
+            return entry
+
+        for _, day, _, user, _, _, latency_ms, ok in requests:
+            entry = bucket(day, user)
+            entry[0] += 1
+            entry[1] += 0 if ok else 1
+            entry[2] += latency_ms
+            entry[3] = max(entry[3], latency_ms)
+        for _, user, day, _, _, status, elapsed, _, _ in sessions:
+            entry = bucket(day, user)
+            entry[4] += 1
+            entry[5] += 1 if status == 'completed' else 0
+            entry[6] += elapsed
+
+        with conn:
+            if requests:
+                conn.executemany(
+                    'INSERT INTO requests (ts, day, task_id, user, book_id, chapter_id, latency_ms, ok) '
+                    'VALUES (?, ?, ?, ?, ?, ?, ?, ?)', requests
+                )
+            if sessions:
+                conn.executemany(
+                    'INSERT INTO sessions (task_id, user, day, start_time, end_time, status, elapsed, '
+                    'request_count, failure_count) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)', sessions
+                )
+            conn.executemany(
+                _UPSERT_DAILY, [(day, user, *values) for (day, user), values in rollup.items()]
+            )
+
+    # ==================== 查询 ====================
+
+    def daily(self, days: int = 7, user: Optional[str] = None) -> List[Dict[str, Any]]:
+        """最近 days 天的日汇总（按日期、用户）"""
+        since = day_of(time.time() - max(0, days - 1) * 86400)
+        sql = 'SELECT * FROM daily WHERE day >= ?'
+        params: List[Any] = [since]
+        if user:
+            sql += ' AND user = ?'
+            params.append(user)
+        rows = self._reader().execute(sql + ' ORDER BY day, user', params).fetchall()
+        return [dict(row) for row in rows]
+
+    def summary(self, days: int = 7, user: Optional[str] = None) -> Dict[str, Any]:
+        """最近 days 天的汇总：总计、按天、按用户"""
+        rows = self.daily(days, user)
+        by_day: Dict[str, Dict[str, float]] = {}
+        by_user: Dict[str, Dict[str, float]] = {}
+        for row in rows:
+            for key, target in ((row['day'], by_day), (row['user'], by_user)):
+                entry = target.setdefault(key, {
+                    'requests': 0, 'failures': 0, 'latency_ms_sum': 0.0, 'latency_ms_max': 0.0,
+                    'sessions': 0, 'completed_sessions': 0, 'reading_seconds': 0.0
+                })
+                for field in ('requests', 'failures', 'latency_ms_sum', 'sessions',
+                              'completed_sessions', 'reading_seconds'):
+                    entry[field] += row[field]
+                entry['latency_ms_max'] = max(entry['latency_ms_max'], row['latency_ms_max'])
+
+        def finish(entry: Dict[str, float]) -> Dict[str, Any]:
+            requests = entry['requests']
+            result = {key: value for key, value in entry.items() if key != 'latency_ms_sum'}
+            result['reading_seconds'] = round(entry['reading_seconds'], 1)
+            result['success_rate'] = round((requests - entry['failures']) / requests * 100, 1) if requests else None
+            result['avg_latency_ms'] = round(entry['latency_ms_sum'] / requests, 1) if requests else None
+            return result
+
+        total = {
+            'requests': 0, 'failures': 0, 'latency_ms_sum': 0.0, 'latency_ms_max': 0.0,
+            'sessions': 0, 'completed_sessions': 0, 'reading_seconds': 0.0
+        }
+        for entry in by_day.values():
+            for field in total:
+                if field == 'latency_ms_max':
+                    total[field] = max(total[field], entry[field])
+                else:
+                    total[field] += entry[field]
+
+        return {
+            'days': days,
+            'total': finish(total),
+            'by_day': [dict(finish(entry), day=day) for day, entry in sorted(by_day.items())],
+            'by_user': [dict(finish(entry), user=name) for name, entry in sorted(by_user.items())]
+        }
+
+    def iter_rows(self, kind: str = 'requests', user: Optional[str] = None,
+                  since: Optional[float] = None, until: Optional[float] = None,
+                  book_id: Optional[str] = None, page_size: int = 1000) -> Iterator[Tuple]:
+        """按 id 顺序逐行产出明细（kind 为 requests 或 sessions），返回前先产出列名
+
+        使用独立连接按 id 分页查询，每页是一个短读事务：导出再久也不会长期占住 WAL 快照，
+        内存占用只与 page_size 有关。since/until 为 Unix 时间戳；会话没有书籍，book_id 只适用于 requests。
+        """
+        if kind not in EXPORT_COLUMNS:
+            raise ValueError(f"未知的统计类型: {kind}")
+        if book_id and kind != 'requests':
+            raise ValueError("book_id 过滤只适用于 requests")
+        columns = EXPORT_COLUMNS[kind]
+        clauses, params = [], []
+        if user:
+            clauses.append('user = ?')
+            params.append(user)
+        if kind == 'requests':
+            if since is not None:
+                clauses.append('ts >= ?')
+                params.append(since)
+            if until is not None:
+                clauses.append('ts < ?')
+                params.append(until)
+            if book_id:
+                clauses.append('book_id = ?')
+                params.append(book_id)
+        else:
+            # 会话按结束时间过滤（ISO 字符串按字典序比较即按时间比较）
+            if since is not None:
+                clauses.append('end_time >= ?')
+                params.append(datetime.fromtimestamp(since).isoformat())
+            if until is not None:
+                clauses.append('end_time < ?')
+                params.append(datetime.fromtimestamp(until).isoformat())
+        sql = f"SELECT id, {', '.join(columns)} FROM {kind} WHERE id > ?"
+        if clauses:
+            sql += ' AND ' + ' AND '.join(clauses)
+        sql += ' ORDER BY id LIMIT ?'
+
+        yield columns
+        conn = self._connect()
+        try:
+            last_id = 0
+            while True:
+                rows = conn.execute(sql, [last_id, *params, page_size]).fetchall()
+                for row in rows:
+                    yield row[1:]
+                if len(rows) < page_size:
+                    return
+                last_id = rows[-1][0]
+        finally:
+            conn.close()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """写入队列状态"""
+        return {
+            'queue_depth': self._queue.qsize(),
+            'dropped': self.dropped,
+            'path': str(self.path)
+        }
@@ -2,120 +2,439 @@
 # -*- coding: utf-8 -*-
 """任务管理服务"""
 
-import os
-import time
+import asyncio
+import functools
+import atexit
 import threading
-from typing import Dict, Any, Optional
-from datetime import datetime
+from concurrent.futures import CancelledError, Future
+from typing import Dict, Any, List, Mapping, Optional, Tuple
 
-from .config_manager import ConfigManager
+from .config_manager import ConfigManager, ConfigSnapshot, ConfigView, user_entries
+from .checkpoint import CheckpointStore
+from .curl_parser import CurlParserCache
+from .http_client import HttpTransport
 from .log_manager import LogManager
+from .notification import NotificationDispatcher
+from .rate_limiter import RateLimiter
+from .scheduler import ScheduledJob, Scheduler
+from .stats_store import StatsStore
+from .reading_engine import ReadingEngine, ReadingSession, parse_range
+from .task_registry import TaskAdmissionError, TaskHandle, TaskRegistry
 
 
 class TaskManager:
     """任务管理器 - 集成原有的阅读机器人逻辑"""
     
-    def __init__(self, config_manager: ConfigManager, log_manager: LogManager):
+    def __init__(self, config_manager: ConfigManager, log_manager: LogManager,
+                 transport: Optional[HttpTransport] = None,
+                 curl_cache: Optional[CurlParserCache] = None,
+                 notifier: Optional[NotificationDispatcher] = None):
         self.config_manager = config_manager
         self.log_manager = log_manager
-        self.is_running = False
-        self.task_thread: Optional[threading.Thread] = None
-        self.task_data = {
-            'start_time': None,
-            'end_time': None,
-            'status': 'idle',
-            'progress': 0,
-            'total_steps': 0,
-            'current_step': 0
-        }
+        self.transport = transport
+        self.notifier = notifier
+        self.curl_cache = curl_cache or CurlParserCache()
+        self.rate_limiter = RateLimiter()
+        self.engine = ReadingEngine(
+            config_manager.get_config_value('app.engine_workers', 4)
+        )
+        self.registry = TaskRegistry(
+            config_manager.get_config_value('app.max_concurrent_tasks', 4),
+            event_bus=log_manager.event_bus
+        )
+        # 全局和每个用户的定时共用一个调度线程；配置每次发布后同步定时任务
+        self.scheduler = Scheduler(dispatch=self._run_scheduled, on_error=self._on_schedule_error)
+        self._schedules: Dict[str, Tuple[str, Optional[str], Optional[Tuple[str, ...]]]] = {}
+        self._schedule_lock = threading.Lock()
+        config_manager.add_listener(self._on_config_published)
+        self.sync_schedules(config_manager.snapshot().data)
+        # 阅读进度检查点：追加写入，重启后未结束的任务从最后的检查点继续
+        self.checkpoints = CheckpointStore(
+            config_manager.get_config_value('app.checkpoint_file', 'data/checkpoints.jsonl'),
+            interval=config_manager.get_config_value('app.checkpoint_interval', 30)
+        )
+        atexit.register(self.checkpoints.close)
+        # 阅读统计：请求和会话结果由后台线程批量写入 SQLite，并维护日汇总
+        self.stats = StatsStore(
+            config_manager.get_config_value('app.stats_file', 'data/stats.db'),
+            batch_size=config_manager.get_config_value('app.stats_batch_size', 200),
+            flush_interval=config_manager.get_config_value('app.stats_flush_interval', 2)
+        )
+        atexit.register(self.stats.close)
+    
+    @property
+    def is_running(self) -> bool:
+        """是否有运行中的任务"""
+        return bool(self.registry.active())
+    
+    def start_task(self, config_override: Optional[Dict[str, Any]] = None,
+                   users: Optional[List[str]] = None,
+                   resume: Optional[Mapping[str, Dict[str, Any]]] = None,
+                   counted: bool = True) -> TaskHandle:
+        """启动阅读任务（非阻塞），返回任务句柄；resume 为 {用户: 检查点}，对应会话从检查点继续
+
+        counted 为 False 时不受 app.max_concurrent_tasks 限制（守护进程的会话链按用户串行，数量由用户数决定）。
+        """
+        # 冻结的配置视图：覆盖项只作用于本次任务，不会写回全局配置
+        config = ConfigView(self.config_manager, config_override).current()
+        
+        sessions = self._build_sessions(config, config_override)
+        if users:
+            sessions = [session for session in sessions if session.user in users]
+            if not sessions:
+                raise TaskAdmissionError(f"未找到指定用户: {', '.join(users)}", 404)
+        
+        handle = self.registry.admit((session.user for session in sessions), counted=counted)
+        try:
+            # 每个用户的桶原地更新为本次任务的速率，其他用户的桶不受影响
+            for session in sessions:
+                self.rate_limiter.configure(
+                    session.settings.rate_limit, session.settings.global_rate_limit, user=session.user
+                )
+            handle.sessions = sessions
+            handle.config = config
+            handle.bind_loop(self.engine.loop)
+            for session in sessions:
+                session.listener = handle.mark_dirty
+                session.checkpointer = functools.partial(self._write_checkpoint, handle.task_id)
+                session.stats_recorder = functools.partial(self._record_request, handle.task_id)
+                if resume:
+                    session.resume_state = resume.get(session.user)
+            self.checkpoints.begin(handle.task_id, handle.users, config_override)
+        except BaseException:
+            # 已准入但未能提交：释放准入名额，否则这些用户在进程退出前都无法再启动任务
+            self.registry.release(handle, 'failed')
+            raise
+        
+        self.log_manager.info(f"📚 微信读书阅读任务启动: {handle.task_id}")
+        self._log_config_summary(config)
+        self.log_manager.info(f"👥 共 {len(sessions)} 个用户会话并发执行")
+        
+        handle.status = 'running'
+        handle.publish()
+        handle.future = self.engine.submit(self._execute_reading_task(handle))
+        handle.future.add_done_callback(lambda future: self._finish_task(handle, future))
+        return handle
     
     def run_task(self, config_override: Optional[Dict[str, Any]] = None):
-        """运行阅读任务"""
+        """运行阅读任务（阻塞直到所有用户会话结束）"""
         try:
-            self.is_running = True
-            self.task_data['start_time'] = datetime.now().isoformat()
-            self.task_data['status'] = 'running'
-            
-            # 合并配置
-            config = self.config_manager.get_config_dict()
-            if config_override:
-                self._merge_config(config, config_override)
-            
-            self.log_manager.info("📚 微信读书阅读任务启动")
-            self._log_config_summary(config)
-            
-            # 这里集成原有的阅读逻辑
-            # 由于篇幅限制，这里简化为模拟执行
-            self._execute_reading_task(config)
-            
-            self.task_data['status'] = 'completed'
-            self.log_manager.info("✅ 任务执行完成")
-            
+            handle = self.start_task(config_override)
+            handle.future.result()
+        except CancelledError:
+            pass
+        except TaskAdmissionError as e:
+            self.log_manager.warning(f"⚠️ 任务未启动: {e}")
         except Exception as e:
-            self.task_data['status'] = 'failed'
             self.log_manager.error(f"❌ 任务执行失败: {e}")
+    
+    def _build_sessions(self, config: Mapping[str, Any],
+                        config_override: Optional[Dict[str, Any]] = None) -> List[ReadingSession]:
+        """根据 curl_config 为每个用户创建阅读会话（每个会话持有自己的配置视图）"""
+        curl_config = config.get('curl_config', {}) or {}
+        users = user_entries(config)
+        
+        if not users:
+            return [ReadingSession(
+                'default', ConfigView(self.config_manager, config_override), self.log_manager,
+                file_path=curl_config.get('file_path'), transport=self.transport,
+                curl_cache=self.curl_cache, rate_limiter=self.rate_limiter
+            )]
         
+        return [
+            ReadingSession(
+                name, ConfigView(self.config_manager, config_override, user=name), self.log_manager,
+                file_path=user.get('file_path'), transport=self.transport,
+                curl_cache=self.curl_cache, rate_limiter=self.rate_limiter
+            )
+            for name, user in users
+        ]
+    
+    async def _execute_reading_task(self, handle: TaskHandle):
+        """在事件循环上并发执行任务内的所有用户会话"""
+        handle.main_task = asyncio.current_task()
+        await asyncio.gather(*(session.run() for session in handle.sessions))
+    
+    def _finish_task(self, handle: TaskHandle, future: Future):
+        """任务结束回调"""
+        if future.cancelled():
+            status = 'stopped'
+            self.log_manager.info(f"⏹️ 任务已停止: {handle.task_id}")
+        elif future.exception() is not None:
+            status = 'failed'
+            self.log_manager.error(f"❌ 任务执行失败: {handle.task_id}: {future.exception()}")
+        else:
+            status = 'completed'
+            self.log_manager.info(f"✅ 任务执行完成: {handle.task_id}")
+        try:
+            self.checkpoints.finish(handle.task_id)
+        except Exception as e:
+            self.log_manager.warning(f"⚠️ 结束检查点失败: {handle.task_id}: {e}")
         finally:
-            self.is_running = False
-            self.task_data['end_time'] = datetime.now().isoformat()
+            # 无论检查点是否成功都要释放准入名额并发送报告
+            for session in handle.sessions:
+                self.stats.record_session(handle.task_id, session.snapshot())
+            self.registry.release(handle, status)
+            self._send_report(handle)
     
-    def _execute_reading_task(self, config: Dict[str, Any]):
-        """执行阅读任务（这是简化版本，实际应集成原有逻辑）"""
+    def _record_request(self, task_id: str, session: ReadingSession, latency_ms: float, ok: bool):
+        """阅读请求写入统计队列（在事件循环线程调用，不做 I/O）"""
+        template = session.template
+        self.stats.record_request(
+            task_id, session.user,
+            template.book_id if template else None,
+            template.chapter_id if template else None,
+            latency_ms, ok
+        )
+    
+    def _write_checkpoint(self, task_id: str, session: ReadingSession, force: bool = False):
+        """会话进度记入检查点（在事件循环线程调用，按间隔节流，文件写入由检查点写线程完成）"""
+        self.checkpoints.record(task_id, session.checkpoint_state(), force)
+    
+    def resume_from_checkpoints(self) -> List[str]:
+        """把上次进程退出时未结束的任务从检查点恢复，返回新任务ID
+
+        由应用在其它组件（如守护进程）注册好任务回调之后调用，以便它们接管恢复的任务。
+        """
+        resumed = []
+        for task_id, task in self.checkpoints.pending().items():
+            # 已结束的会话不再重跑，还没写过检查点的会话从头开始
+            sessions = {
+                user: state for user, state in task['sessions'].items()
+                if state.get('status') not in ('completed', 'failed', 'stopped')
+            }
+            users = [
+                user for user in task['users']
+                if user in sessions or user not in task['sessions']
+            ]
+            if not users:
+                self.checkpoints.finish(task_id)
+                continue
+            try:
+                handle = self.start_task(task['override'], users=users, resume=sessions)
+            except TaskAdmissionError as e:
+                if e.status_code == 404:
+                    # 检查点中的用户已从配置中删除，永远无法恢复
+                    self.checkpoints.finish(task_id)
+                    self.log_manager.warning(f"⚠️ 任务 {task_id} 的用户已不存在，丢弃其检查点: {e}")
+                    continue
+                # 并发已满或用户冲突：保留原检查点，下次启动时再尝试恢复
+                self.log_manager.warning(f"⚠️ 任务 {task_id} 未能从检查点恢复: {e}")
+                continue
+            # 新任务已登记自己的检查点后才丢弃原任务的
+            self.checkpoints.finish(task_id)
+            self.log_manager.info(f"♻️ 任务 {task_id} 从检查点恢复为 {handle.task_id}")
+            resumed.append(handle.task_id)
+        return resumed
+    
+    def _send_report(self, handle: TaskHandle):
+        """任务结束后在后台发送阅读报告"""
+        notification_config = (handle.config or {}).get('notification', {}) or {}
+        if self.notifier is None or not notification_config.get('enabled'):
+            return
         
-        # 获取启动模式
-        startup_mode = config.get('app', {}).get('startup_mode', 'immediate')
-        startup_delay = config.get('app', {}).get('startup_delay', '1-10')
+        snapshot = handle.snapshot
+        include_statistics = notification_config.get('include_statistics', True)
         
-        # 解析延迟时间
-        delay = self._parse_range(startup_delay)
-        self.log_manager.info(f"等待 {delay} 秒...")
-        time.sleep(delay)
+        def _build_content() -> str:
+            """在发送线程中生成报告内容（统计需要等待写入队列落盘）"""
+            lines = [
+                f"任务: {snapshot['task_id']}",
+                f"状态: {snapshot['status']}",
+                f"用户数: {len(snapshot['sessions'])}"
+            ]
+            if not include_statistics:
+                return '\n'.join(lines)
+            for session in snapshot['sessions']:
+                lines.append(
+                    f"• {session['user']}: {session['status']}, "
+                    f"阅读 {session['elapsed'] / 60:.1f} 分钟, "
+                    f"请求 {session['request_count']} 次 (失败 {session['failure_count']})"
+                )
+            self.stats.flush()
+            today = self.stats.summary(days=1)['total']
+            if today['sessions']:
+                lines.append(
+                    f"今日累计: {today['sessions']} 次会话, "
+                    f"阅读 {today['reading_seconds'] / 60:.1f} 分钟, "
+                    f"请求 {today['requests']} 次"
+                    + (f", 成功率 {today['success_rate']}%, 平均耗时 {today['avg_latency_ms']}ms"
+                       if today['requests'] else '')
+                )
+            return '\n'.join(lines)
         
-        # 获取目标时长
-        target_duration = config.get('reading', {}).get('target_duration', '60-70')
-        target_seconds = self._parse_range(target_duration) * 60
+        def _log_results(results):
+            for result in results:
+                level = 'info' if result['success'] else 'warning'
+                self.log_manager.log(
+                    level,
+                    f"📨 通知[{result['channel']}] {result['message']} ({result['latency_ms']}ms)"
+                )
         
-        # 获取阅读间隔
-        reading_interval = config.get('reading', {}).get('reading_interval', '25-35')
+        self.notifier.send_report_async(
+            notification_config, '📚 微信读书阅读报告', _build_content, _log_results
+        )
+    
+    def stop_task(self, task_id: Optional[str] = None) -> List[str]:
+        """停止指定任务（未指定时停止所有运行中的任务），返回被停止的任务ID"""
+        if task_id:
+            handle = self.registry.get(task_id)
+            handles = [handle] if handle and handle.is_running else []
+        else:
+            handles = self.registry.active()
         
-        self.log_manager.info(f"📖 开始阅读，目标时长: {target_seconds/60:.0f} 分钟")
+        for handle in handles:
+            if handle.main_task is not None:
+                # 在事件循环上取消，任务会在所有会话真正退出后才结束
+                self.engine.call_soon(handle.main_task.cancel)
+            elif handle.future is not None:
+                handle.future.cancel()
+        return [handle.task_id for handle in handles]
+    
+    def _select(self, task_id: Optional[str], status: str) -> List[TaskHandle]:
+        """按任务ID（未指定时为全部）选出处于 status 状态的任务"""
+        if task_id:
+            handle = self.registry.get(task_id)
+            return [handle] if handle and handle.status == status else []
+        return [handle for handle in self.registry.active() if handle.status == status]
+    
+    def pause_task(self, task_id: Optional[str] = None) -> List[str]:
+        """暂停运行中的任务（未指定时暂停全部），返回被暂停的任务ID
         
-        # 模拟阅读过程
-        start_time = time.time()
-        request_count = 0
+        暂停在事件循环上执行：会话正在进行的等待立即被打断并挂起，不占用线程；
+        已发出的请求完成后才进入暂停。
+        """
+        handles = self._select(task_id, 'running')
+        for handle in handles:
+            self.engine.call_soon(self._set_paused, handle, True)
+        return [handle.task_id for handle in handles]
+    
+    def resume_task(self, task_id: Optional[str] = None) -> List[str]:
+        """恢复已暂停的任务（未指定时恢复全部），返回被恢复的任务ID"""
+        handles = self._select(task_id, 'paused')
+        for handle in handles:
+            self.engine.call_soon(self._set_paused, handle, False)
+        return [handle.task_id for handle in handles]
+    
+    def _set_paused(self, handle: TaskHandle, paused: bool):
+        """在事件循环线程上切换任务及其会话的暂停状态"""
+        if handle.status != ('running' if paused else 'paused'):
+            return
+        for session in handle.sessions:
+            if paused:
+                session.pause()
+            else:
+                session.resume()
+        handle.status = 'paused' if paused else 'running'
+        handle.publish()
+        self.log_manager.info(f"{'⏸️ 任务已暂停' if paused else '▶️ 任务已恢复'}: {handle.task_id}")
+    
+    def get_task_status(self, task_id: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """获取任务状态（读取已发布的快照，不与阅读循环争用）"""
+        if task_id:
+            handle = self.registry.get(task_id)
+            return dict(handle.snapshot) if handle else None
         
-        while time.time() - start_time < target_seconds and self.is_running:
-            if request_count % 10 == 0:
-                elapsed = time.time() - start_time
-                self.task_data['progress'] = int((elapsed / target_seconds) * 100)
-                self.log_manager.info(
-                    f"⏱️ 已阅读 {elapsed/60:.1f} 分钟, 进度: {self.task_data['progress']}%"
-                )
-            
-            # 执行阅读请求
-            interval = self._parse_range(reading_interval)
-            time.sleep(interval)
-            request_count += 1
-        
-        self.task_data['progress'] = 100
-        self.log_manager.info(
-            f"✅ 阅读完成，共发送 {request_count} 个请求"
-        )
+        snapshots = [handle.snapshot for handle in self.registry.list()]
+        running = [snapshot for snapshot in snapshots if snapshot['is_running']]
+        latest = (running or snapshots)[-1] if snapshots else None
+        return {
+            'is_running': bool(running),
+            'current_task': latest['task_id'] if latest else None,
+            'data': dict(latest) if latest else {'status': 'idle', 'progress': 0},
+            'tasks': [dict(snapshot) for snapshot in snapshots]
+        }
+    
+    def _on_config_published(self, snapshot: ConfigSnapshot):
+        self.sync_schedules(snapshot.data)
+    
+    def sync_schedules(self, config: Mapping[str, Any]):
+        """按配置同步定时任务，只增删有变化的任务
+        
+        schedule.enabled 为 true（或 startup_mode 为 scheduled）时生效：
+        设置了自己 schedule 的用户各有一个定时，其余用户共享全局定时。
+        """
+        schedule_config = config.get('schedule') or {}
+        app_config = config.get('app') or {}
+        enabled = bool(schedule_config.get('enabled')) or app_config.get('startup_mode') == 'scheduled'
+        
+        desired = {}
+        if enabled:
+            default_cron = schedule_config.get('cron_expression')
+            default_tz = schedule_config.get('timezone')
+            users = user_entries(config)
+            shared = []
+            for name, entry in users:
+                user_schedule = entry.get('schedule') or {}
+                if user_schedule.get('enabled') is False:
+                    continue
+                if user_schedule.get('cron_expression'):
+                    desired[f'user:{name}'] = (
+                        user_schedule['cron_expression'],
+                        user_schedule.get('timezone') or default_tz,
+                        (name,)
+                    )
+                else:
+                    shared.append(name)
+            if default_cron and (shared or not users):
+                desired['global'] = (default_cron, default_tz, tuple(shared) or None)
+        
+        with self._schedule_lock:
+            for job_id in set(self._schedules) - set(desired):
+                self.scheduler.remove(job_id)
+                del self._schedules[job_id]
+            for job_id, spec in desired.items():
+                if self._schedules.get(job_id) == spec:
+                    continue
+                expression, timezone, users = spec
+                try:
+                    self.scheduler.add_cron(job_id, expression, timezone=timezone, payload=users)
+                except ValueError as e:
+                    self.log_manager.error(f"❌ 定时任务 {job_id} 的 cron 表达式无效: {e}")
+                    self.scheduler.remove(job_id)
+                    self._schedules.pop(job_id, None)
+                    continue
+                self._schedules[job_id] = spec
+            if self._schedules:
+                self.scheduler.start()
     
-    def stop_task(self):
-        """停止任务"""
-        self.is_running = False
-        self.task_data['status'] = 'stopped'
-        self.log_manager.info("⏹️ 任务已停止")
+    def _run_scheduled(self, jobs: List[ScheduledJob]):
+        """同一时刻到期的定时合并成一个阅读任务，已在阅读中的用户跳过"""
+        if any(job.payload is None for job in jobs):
+            users = None
+        else:
+            users = [
+                user for job in jobs for user in job.payload
+                if self.registry.find_by_user(user) is None
+            ]
+            if not users:
+                self.log_manager.info("⏭️ 定时触发：所有用户都在阅读中，跳过本次")
+                return
+        
+        job_ids = ', '.join(job.job_id for job in jobs)
+        try:
+            handle = self.start_task(users=users)
+            self.log_manager.info(f"⏰ 定时触发 [{job_ids}]，任务 {handle.task_id}")
+        except TaskAdmissionError as e:
+            self.log_manager.warning(f"⏭️ 定时触发 [{job_ids}] 未启动任务: {e}")
     
-    def get_task_status(self) -> Dict[str, Any]:
-        """获取任务状态"""
+    def _on_schedule_error(self, job: ScheduledJob, error: Exception):
+        self.log_manager.error(f"❌ 定时任务 {job.job_id} 执行失败: {error}")
+    
+    def get_schedule(self, limit: int = 50, count: int = 3) -> Dict[str, Any]:
+        """按下一次触发时间排序的定时任务，每个任务附带之后 count 次触发时间"""
+        jobs = []
+        for job in self.scheduler.upcoming(limit):
+            entry = job.describe(count)
+            entry['users'] = list(entry.pop('payload') or [])
+            jobs.append(entry)
         return {
-            'is_running': self.is_running,
-            'data': self.task_data
+            'enabled': bool(self._schedules),
+            'total': len(self._schedules),
+            'jobs': jobs
         }
     
-    def _log_config_summary(self, config: Dict[str, Any]):
+    def _log_config_summary(self, config: Mapping[str, Any]):
         """记录配置摘要（美观格式）"""
         try:
             app_config = config.get('app', {})
@@ -144,23 +463,4 @@ class TaskManager:
     
     def _parse_range(self, range_str: str) -> float:
         """解析范围字符串，如 '60-70' 返回随机数"""
-        import random
-        
-        try:
-            if '-' in str(range_str):
-                parts = str(range_str).split('-')
-                start = float(parts[0].strip())
-                end = float(parts[1].strip())
-                return random.uniform(start, end)
-            else:
-                return float(range_str)
-        except:
-            return 60.0
-    
-    def _merge_config(self, base_config: Dict[str, Any], updates: Dict[str, Any]):
-        """递归合并配置"""
-        for key, value in updates.items():
-            if isinstance(value, dict) and key in base_config and isinstance(base_config[key], dict):
-                self._merge_config(base_config[key], value)
-            else:
-                base_config[key] = value
+        return parse_range(range_str)
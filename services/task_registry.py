@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""任务注册表
+
+按任务ID和用户索引所有阅读任务，负责并发准入控制，
+并以带版本号的只读快照对外提供任务状态：
+写入方整体替换快照引用，读取方直接拿到引用，无需加锁。
+"""
+
+import itertools
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from types import MappingProxyType
+from typing import Any, Callable, Dict, Iterable, List, Mapping, Optional
+
+from .event_bus import EventBus
+
+
+class TaskAdmissionError(Exception):
+    """任务准入失败（并发已满或用户已有运行中的任务）"""
+
+    def __init__(self, message: str, status_code: int = 429):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class TaskHandle:
+    """单个任务的句柄"""
+
+    def __init__(self, task_id: str, users: List[str],
+                 on_publish: Optional[Callable[[], None]] = None):
+        self.task_id = task_id
+        self.on_publish = on_publish
+        self.users = users
+        self.sessions: List[Any] = []
+        self.config: Optional[Dict[str, Any]] = None
+        self.future = None
+        self.main_task = None
+        # 是否占用并发任务名额（守护进程的会话链不占用）
+        self.counted = True
+        self.status = 'pending'
+        self.start_time = datetime.now().isoformat()
+        self.end_time: Optional[str] = None
+        self._version = itertools.count(1)
+        self._dirty = False
+        self._loop = None
+        self._snapshot: Mapping[str, Any] = MappingProxyType({})
+        self.publish()
+
+    @property
+    def is_running(self) -> bool:
+        return self.status in ('pending', 'running', 'paused')
+
+    @property
+    def snapshot(self) -> Mapping[str, Any]:
+        """最近一次发布的只读状态快照"""
+        return self._snapshot
+
+    def bind_loop(self, loop):
+        """绑定事件循环，之后的 mark_dirty 会在循环上合并发布"""
+        self._loop = loop
+
+    def mark_dirty(self):
+        """标记状态已变化（在事件循环线程调用，同一轮内多次变化只发布一次）"""
+        if self._dirty:
+            return
+        if self._loop is None:
+            self.publish()
+            return
+        self._dirty = True
+        self._loop.call_soon(self.publish)
+
+    def publish(self):
+        """重新生成并发布状态快照"""
+        self._dirty = False
+        sessions = [session.snapshot() for session in self.sessions]
+        progress = int(sum(s['progress'] for s in sessions) / len(sessions)) if sessions else 0
+        if self.status == 'completed':
+            progress = 100
+        self._snapshot = MappingProxyType({
+            'task_id': self.task_id,
+            'version': next(self._version),
+            'status': self.status,
+            'is_running': self.is_running,
+            'users': list(self.users),
+            'progress': progress,
+            'total_steps': len(sessions),
+            'current_step': sum(1 for s in sessions if s['status'] not in ('pending', 'running', 'paused')),
+            'start_time': self.start_time,
+            'end_time': self.end_time,
+            'sessions': sessions
+        })
+        if self.on_publish is not None:
+            self.on_publish()
+
+
+class TaskRegistry:
+    """任务注册表（按任务ID和用户索引，带并发准入控制）"""
+
+    def __init__(self, max_tasks: int = 4, history_size: int = 20,
+                 event_bus: Optional[EventBus] = None):
+        self.max_tasks = max(1, int(max_tasks))
+        self.event_bus = event_bus
+        self.history_size = history_size
+        self._lock = threading.Lock()
+        self._tasks: 'OrderedDict[str, TaskHandle]' = OrderedDict()
+        self._by_user: Dict[str, str] = {}
+        self._counter = itertools.count(1)
+        self._listeners: List[Callable[[TaskHandle], None]] = []
+
+    def add_listener(self, callback: Callable[[TaskHandle], None]):
+        """注册任务结束回调"""
+        self._listeners.append(callback)
+
+    def admit(self, users: Iterable[str], counted: bool = True) -> TaskHandle:
+        """准入检查并登记新任务；counted 为 False 的任务不受也不占用并发任务数上限，只检查用户冲突"""
+        users = list(users)
+        with self._lock:
+            active = sum(1 for handle in self._tasks.values() if handle.is_running and handle.counted)
+            if counted and active >= self.max_tasks:
+                raise TaskAdmissionError(f'并发任务数已达上限 ({self.max_tasks})', 429)
+
+            busy = [user for user in users if user in self._by_user]
+            if busy:
+                raise TaskAdmissionError(f"用户已有运行中的任务: {', '.join(busy)}", 409)
+
+            task_id = f"task_{datetime.now().strftime('%Y%m%d%H%M%S')}_{next(self._counter)}"
+            handle = TaskHandle(
+                task_id, users, self.event_bus.notify if self.event_bus else None
+            )
+            handle.counted = counted
+            self._tasks[task_id] = handle
+            for user in users:
+                self._by_user[user] = task_id
+            self._trim()
+            return handle
+
+    def release(self, handle: TaskHandle, status: str):
+        """任务结束，释放用户占用并发布最终快照"""
+        with self._lock:
+            handle.status = status
+            handle.end_time = datetime.now().isoformat()
+            for user in handle.users:
+                if self._by_user.get(user) == handle.task_id:
+                    del self._by_user[user]
+        handle.publish()
+
+        for callback in self._listeners:
+            try:
+                callback(handle)
+            except Exception:
+                pass
+
+    def get(self, task_id: str) -> Optional[TaskHandle]:
+        """按任务ID查找"""
+        return self._tasks.get(task_id)
+
+    def find_by_user(self, user: str) -> Optional[TaskHandle]:
+        """查找用户当前运行中的任务"""
+        task_id = self._by_user.get(user)
+        return self._tasks.get(task_id) if task_id else None
+
+    def list(self) -> List[TaskHandle]:
+        """所有任务（按创建顺序）"""
+        with self._lock:
+            return list(self._tasks.values())
+
+    def active(self) -> List[TaskHandle]:
+        """运行中的任务"""
+        return [handle for handle in self.list() if handle.is_running]
+
+    def _trim(self):
+        """只保留最近的已结束任务"""
+        finished = [tid for tid, handle in self._tasks.items() if not handle.is_running]
+        for task_id in finished[:max(0, len(finished) - self.history_size)]:
+            del self._tasks[task_id]
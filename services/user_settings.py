@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""用户有效配置
+
+把某一配置版本下某个用户的有效阅读参数（全局 reading + 用户 reading_overrides + 任务覆盖项）
+编译成带类型的只读对象，区间字符串预先解析为数值上下界。阅读循环只做属性访问，
+不再逐轮 dict.get 和拆分字符串。
+"""
+
+import random
+from typing import Any, Mapping, Optional
+
+
+class Range:
+    """数值区间（"30-48" 或单个数值）"""
+
+    __slots__ = ('low', 'high')
+
+    def __init__(self, low: float, high: float):
+        self.low = low
+        self.high = high
+
+    @classmethod
+    def parse(cls, value: Any, default: float = 60.0) -> 'Range':
+        """解析区间字符串，格式无效时退化为 default"""
+        try:
+            if '-' in str(value):
+                start, end = str(value).split('-')[:2]
+                return cls(float(start.strip()), float(end.strip()))
+            number = float(value)
+            return cls(number, number)
+        except (TypeError, ValueError):
+            return cls(default, default)
+
+    def sample(self) -> float:
+        """区间内的随机值"""
+        if self.high <= self.low:
+            return self.low
+        return random.uniform(self.low, self.high)
+
+    def __repr__(self) -> str:
+        return f"Range({self.low:g}, {self.high:g})"
+
+
+class UserSettings:
+    """某一配置版本下单个用户的有效阅读参数"""
+
+    __slots__ = (
+        'version', 'user', 'mode', 'target_duration', 'reading_interval',
+        'startup_delay', 'rate_limit', 'global_rate_limit', 'timeout'
+    )
+
+    def __init__(self, version: int, user: Optional[str], mode: str, target_duration: Range,
+                 reading_interval: Range, startup_delay: Range, rate_limit: float,
+                 global_rate_limit: float, timeout: float):
+        self.version = version
+        self.user = user
+        self.mode = mode
+        self.target_duration = target_duration
+        self.reading_interval = reading_interval
+        self.startup_delay = startup_delay
+        self.rate_limit = rate_limit
+        self.global_rate_limit = global_rate_limit
+        self.timeout = timeout
+
+    @classmethod
+    def compile(cls, version: int, user: Optional[str], config: Mapping[str, Any]) -> 'UserSettings':
+        """从已叠加好覆盖项的冻结配置编译"""
+        app_config = config.get('app') or {}
+        reading_config = config.get('reading') or {}
+        network_config = config.get('network') or {}
+        return cls(
+            version=version,
+            user=user,
+            mode=str(reading_config.get('mode', 'smart_random')),
+            target_duration=Range.parse(reading_config.get('target_duration', '60-70')),
+            reading_interval=Range.parse(reading_config.get('reading_interval', '25-35')),
+            startup_delay=Range.parse(app_config.get('startup_delay', '1-10')),
+            rate_limit=float(network_config.get('rate_limit', 10) or 0),
+            global_rate_limit=float(network_config.get('global_rate_limit', 0) or 0),
+            timeout=float(network_config.get('timeout', 30) or 30)
+        )
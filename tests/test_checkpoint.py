@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""检查点存储测试：回放与压缩"""
+
+import json
+
+from services.checkpoint import CheckpointStore
+
+
+def _lines(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return [json.loads(line) for line in f]
+
+
+def test_round_trip(tmp_path):
+    path = tmp_path / 'checkpoints.jsonl'
+    store = CheckpointStore(str(path), interval=0)
+    store.begin('t1', ['alice', 'bob'], {'reading': {'mode': 'smart'}})
+    store.record('t1', {'user': 'alice', 'elapsed': 10})
+    store.record('t1', {'user': 'alice', 'elapsed': 20})
+    store.begin('t2', ['carol'])
+    store.finish('t2')
+    # 未登记的任务不记录
+    assert not store.record('t3', {'user': 'dave', 'elapsed': 1})
+    store.close()
+
+    reopened = CheckpointStore(str(path))
+    pending = reopened.pending()
+    assert list(pending) == ['t1']
+    assert pending['t1']['users'] == ['alice', 'bob']
+    assert pending['t1']['override'] == {'reading': {'mode': 'smart'}}
+    assert pending['t1']['sessions']['alice']['elapsed'] == 20
+    reopened.close()
+
+
+def test_record_is_throttled_per_session(tmp_path):
+    store = CheckpointStore(str(tmp_path / 'checkpoints.jsonl'), interval=60)
+    store.begin('t1', ['alice', 'bob'])
+    assert store.record('t1', {'user': 'alice', 'elapsed': 1})
+    assert not store.record('t1', {'user': 'alice', 'elapsed': 2})
+    assert store.record('t1', {'user': 'bob', 'elapsed': 1})
+    assert store.record('t1', {'user': 'alice', 'elapsed': 3}, force=True)
+    assert store.pending()['t1']['sessions']['alice']['elapsed'] == 3
+    store.close()
+
+
+def test_compaction_keeps_only_live_records(tmp_path):
+    path = tmp_path / 'checkpoints.jsonl'
+    store = CheckpointStore(str(path), interval=0, compact_after=10)
+    store.begin('done', ['carol'])
+    store.finish('done')
+    store.begin('t1', ['alice'])
+    for elapsed in range(20):
+        store.record('t1', {'user': 'alice', 'elapsed': elapsed})
+    assert store.flush()
+    # 压缩后文件只剩未结束任务的开始记录和最新进度，加上压缩之后追加的记录
+    assert len(_lines(path)) < 12
+    store.close()
+
+    records = _lines(path)
+    assert records == [
+        {'task': 't1', 'users': ['alice'], 'override': None},
+        dict(records[1], user='alice', elapsed=19, task='t1')
+    ]
+    reopened = CheckpointStore(str(path))
+    assert reopened.pending()['t1']['sessions']['alice']['elapsed'] == 19
+    reopened.close()
+
+
+def test_truncated_last_line_is_skipped(tmp_path):
+    path = tmp_path / 'checkpoints.jsonl'
+    path.write_text(
+        '{"task":"t1","users":["alice"],"override":null}\n'
+        '{"task":"t1","user":"alice","elapsed":5}\n'
+        '{"task":"t1","user":"alice","ela',
+        encoding='utf-8'
+    )
+    store = CheckpointStore(str(path))
+    assert store.pending()['t1']['sessions']['alice']['elapsed'] == 5
+    store.close()
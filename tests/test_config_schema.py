@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""配置校验测试"""
+
+import pytest
+
+from services.config_manager import ConfigManager
+from services.config_schema import ConfigValidationError, ConfigValidator
+
+
+def _paths(errors):
+    return [error['path'] for error in errors]
+
+
+def test_default_config_is_valid(tmp_path):
+    manager = ConfigManager(str(tmp_path / 'config.yaml'), reload_interval=0, cache_dir='')
+    assert ConfigValidator().validate(manager._get_default_config()) == []
+
+
+def test_type_and_range_errors():
+    errors = ConfigValidator().validate({
+        'app': {'max_concurrent_tasks': 0, 'startup_mode': 'forever'},
+        'network': {'rate_limit': 'fast'},
+        'schedule': {'cron_expression': '0 9 31 2 *'},
+    })
+    assert sorted(_paths(errors)) == [
+        'app.max_concurrent_tasks', 'app.startup_mode', 'network.rate_limit', 'schedule.cron_expression'
+    ]
+
+
+def test_users_without_name_are_accepted():
+    config = {'curl_config': {'users': [
+        {'file_path': 'a.txt'},
+        {'name': 'bob', 'file_path': 'b.txt'},
+        {'file_path': 'c.txt'},
+    ]}}
+    assert ConfigValidator().validate(config) == []
+
+
+def test_duplicate_user_names():
+    validator = ConfigValidator()
+    errors = validator.validate({'curl_config': {'users': [
+        {'name': 'alice'}, {'name': 'bob'}, {'name': 'alice'}
+    ]}})
+    assert _paths(errors) == ['curl_config.users[2].name']
+
+    # 显式名称与未命名用户的自动名称（按位置为 userN）冲突
+    errors = validator.validate({'curl_config': {'users': [{'file_path': 'a.txt'}, {'name': 'user1'}]}})
+    assert _paths(errors) == ['curl_config.users[1].name']
+
+
+def test_user_errors_are_prefixed_and_cached_per_user():
+    validator = ConfigValidator()
+    config = {'curl_config': {'users': [{'name': 'alice'}, {'name': 42}]}}
+    first = validator.validate(config)
+    assert _paths(first) == ['curl_config.users[1].name']
+    # 同一用户换了位置，缓存的错误按新位置加前缀
+    config = {'curl_config': {'users': [{'name': 42}, {'name': 'alice'}]}}
+    assert _paths(validator.validate(config)) == ['curl_config.users[0].name']
+
+
+def test_check_raises_with_all_errors():
+    with pytest.raises(ConfigValidationError) as info:
+        ConfigValidator().check({'curl_config': {'users': 'alice'}})
+    assert _paths(info.value.errors) == ['curl_config.users']
+    with pytest.raises(ConfigValidationError):
+        ConfigValidator().check(['not', 'a', 'mapping'])
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""CURL 命令解析测试"""
+
+import pytest
+
+from services.curl_parser import CurlParseError, parse_curl_command
+
+CHROME_COMMAND = r"""curl 'https://weread.qq.com/web/book/read' \
+  -H 'accept: application/json, text/plain, */*' \
+  -H 'content-type: application/json;charset=UTF-8' \
+  -b 'wr_skey=abc; wr_vid=123' \
+  -H 'user-agent: Mozilla/5.0' \
+  --data-raw '{"appId":"wb","b":"book1","c":"chap1","ct":1700000000}'"""
+
+
+def test_chrome_bash_command():
+    template = parse_curl_command(CHROME_COMMAND)
+    assert template.method == 'POST'
+    assert template.url == 'https://weread.qq.com/web/book/read'
+    assert template.cookies == {'wr_skey': 'abc', 'wr_vid': '123'}
+    assert template.headers['content-type'] == 'application/json;charset=UTF-8'
+    assert template.book_id == 'book1'
+    assert template.chapter_id == 'chap1'
+
+
+def test_ansi_c_quoted_data_raw():
+    # Chrome 在请求体含单引号或非 ASCII 字符时使用 $'...'，非 ASCII 字符按 UTF-16 码元转义
+    command = (
+        "curl 'https://weread.qq.com/web/book/read' "
+        "-H 'cookie: wr_skey=abc' "
+        r"""--data-raw $'{"b":"book1","c":"chap1","s":"it\'s \u4e2d\u6587\\n","e":"\ud83d\ude00","x":"\x41"}'"""
+    )
+    template = parse_curl_command(command)
+    assert template.json_body == {'b': 'book1', 'c': 'chap1', 's': "it's 中文\n", 'e': '😀', 'x': 'A'}
+    assert template.cookies == {'wr_skey': 'abc'}
+
+
+def test_double_quotes_and_backslash_escapes():
+    template = parse_curl_command(
+        'curl "https://example.com/a?bookId=42&chapterUid=7" -H "X-Quote: say \\"hi\\"" -X put'
+    )
+    assert template.method == 'PUT'
+    assert template.headers['X-Quote'] == 'say "hi"'
+    assert template.book_id == '42'
+    assert template.chapter_id == '7'
+
+
+@pytest.mark.parametrize('command', [
+    "wget 'https://example.com'",
+    "curl -H 'x: y'",
+    "curl 'https://example.com",
+    "curl $'https://example.com",
+])
+def test_invalid_commands(command):
+    with pytest.raises(CurlParseError):
+        parse_curl_command(command)
@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""运行指标分片测试"""
+
+import gc
+import threading
+
+from services.metrics import Counter, Histogram
+
+
+def _run_threads(target, count):
+    for _ in range(count):
+        thread = threading.Thread(target=target)
+        thread.start()
+        thread.join()
+
+
+def test_shards_of_finished_threads_are_retired():
+    counter = Counter('test_requests_total', 'test', ('route',))
+    histogram = Histogram('test_request_seconds', 'test', ('route',))
+
+    def work():
+        counter.inc(('/api/health',))
+        histogram.observe(0.02, ('/api/health',))
+
+    _run_threads(work, 500)
+    gc.collect()
+
+    assert counter.shard_count <= 1
+    assert histogram.shard_count <= 1
+    assert counter.value(('/api/health',)) == 500
+    assert histogram.count(('/api/health',)) == 500
+
+
+def test_live_and_retired_shards_are_merged():
+    counter = Counter('test_events_total', 'test')
+    counter.inc()
+    _run_threads(lambda: counter.inc(amount=2), 10)
+    gc.collect()
+
+    assert counter.value() == 21
+    assert counter.shard_count == 1
@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""RateLimiter：重新配置不丢弃桶，全局令牌在用户等待之后才取，取消时退回令牌，等待直方图为累计语义"""
+
+import asyncio
+
+from services.rate_limiter import RateLimiter
+
+
+def test_configure_keeps_buckets_and_debt():
+    limiter = RateLimiter(rate_limit=60)
+    assert limiter.reserve('alice') == 0
+    assert limiter.reserve('alice') > 0.9
+
+    # 另一个用户的任务带着不同的速率启动，不应清空 alice 的桶
+    limiter.configure(6, user='bob')
+    assert limiter.reserve('alice') > 1.9
+    assert limiter.reserve('bob') == 0
+    assert limiter.reserve('bob') > 9
+
+    # 修改 alice 的速率：已有的透支保留，按新速率偿还
+    limiter.configure(120, user='alice')
+    assert limiter.reserve('alice') > 1.4
+
+
+def test_wait_histogram_is_cumulative():
+    limiter = RateLimiter(rate_limit=6000)
+
+    async def run():
+        for _ in range(3):
+            await limiter.acquire('alice')
+
+    asyncio.run(run())
+    histogram = limiter.get_stats()['wait_histogram']
+    assert histogram['le_0.0'] == 1
+    assert histogram['le_0.1'] == 3
+    assert histogram['le_inf'] == 3
+    assert list(histogram.values()) == sorted(histogram.values())
+
+
+def test_throttled_user_does_not_hold_global_token():
+    limiter = RateLimiter(rate_limit=60, global_rate_limit=60)
+
+    async def run():
+        await limiter.acquire('alice')
+        # alice 的第二次请求在等自己的桶，还不应占用全局令牌
+        waiter = asyncio.ensure_future(limiter.acquire('alice'))
+        await asyncio.sleep(0.01)
+        assert limiter.get_stats()['queue_depth_by_user'] == {'alice': 1}
+        waiter.cancel()
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            pass
+
+    asyncio.run(run())
+    assert limiter.get_stats()['queue_depth'] == 0
+    # 取消的预约已退回：alice 的桶只欠第一次请求之后的那个令牌
+    assert limiter.reserve('alice') < 1.0
+    assert limiter.reserve_global() < 1.0
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""cron 表达式测试：字段展开、日/星期并集语义、夏令时与永不触发的表达式"""
+
+from datetime import datetime, timezone
+
+import pytest
+
+from services.scheduler import CronExpression, get_timezone, next_fire_time, validate_cron
+
+
+def test_next_after_steps_and_ranges():
+    cron = CronExpression('*/15 9-10 * * *')
+    assert cron.next_after(datetime(2024, 1, 1, 8, 59)) == datetime(2024, 1, 1, 9, 0)
+    assert cron.next_after(datetime(2024, 1, 1, 9, 0)) == datetime(2024, 1, 1, 9, 15)
+    assert cron.next_after(datetime(2024, 1, 1, 10, 45)) == datetime(2024, 1, 2, 9, 0)
+    # 跨年
+    assert CronExpression('0 0 1 jan *').next_after(datetime(2024, 6, 1)) == datetime(2025, 1, 1)
+
+
+def test_day_of_month_and_weekday_are_ored():
+    # 每月 13 日或每周五（2024-09-01 是周日）
+    cron = CronExpression('0 12 13 * fri')
+    assert cron.next_after(datetime(2024, 9, 1)) == datetime(2024, 9, 6, 12, 0)
+    assert cron.next_after(datetime(2024, 9, 6, 12, 0)) == datetime(2024, 9, 13, 12, 0)
+    assert cron.next_after(datetime(2024, 9, 13, 12, 0)) == datetime(2024, 9, 20, 12, 0)
+
+
+def test_wildcard_day_field_intersects_with_weekday():
+    # 日字段为 * 时只看星期；0 和 7 都是周日
+    cron = CronExpression('0 8 * * 7')
+    assert cron.next_after(datetime(2024, 9, 2)) == datetime(2024, 9, 8, 8, 0)
+    # */2 也以 * 开头，与星期取交集：奇数日且为周一（9 月 2 日是周一但为偶数日）
+    assert CronExpression('0 8 */2 * 1').next_after(datetime(2024, 9, 1)) == datetime(2024, 9, 9, 8, 0)
+
+
+def test_leap_day():
+    assert CronExpression('0 0 29 2 *').next_after(datetime(2025, 1, 1)) == datetime(2028, 2, 29)
+
+
+@pytest.mark.parametrize('expression', ['0 9 31 2 *', '0 0 31 4,6,9,11 *', '0 0 30 2 *'])
+def test_never_firing_expressions_are_rejected(expression):
+    assert validate_cron(expression) is not None
+    with pytest.raises(ValueError):
+        CronExpression(expression)
+
+
+@pytest.mark.parametrize('expression', ['0 9 * *', '60 * * * *', '0 0 5-1 * *', '*/0 * * * *', 'x * * * *'])
+def test_invalid_fields(expression):
+    assert validate_cron(expression) is not None
+
+
+tz = get_timezone('America/New_York')
+requires_tz = pytest.mark.skipif(tz is None, reason='系统没有时区数据')
+
+
+@requires_tz
+def test_dst_gap_fires_once_after_the_gap():
+    # 2024-03-10 02:00 跳到 03:00，02:30 不存在，当天在 03:30（EDT）触发一次
+    cron = CronExpression('30 2 * * *')
+    first = next_fire_time(cron, tz, datetime(2024, 3, 9, 12, 0, tzinfo=tz).timestamp())
+    assert datetime.fromtimestamp(first, timezone.utc) == datetime(2024, 3, 10, 7, 30, tzinfo=timezone.utc)
+    second = next_fire_time(cron, tz, first)
+    assert datetime.fromtimestamp(second, tz).replace(tzinfo=None) == datetime(2024, 3, 11, 2, 30)
+
+
+@requires_tz
+def test_dst_fold_fires_once():
+    # 2024-11-03 01:30 出现两次，只触发第一次
+    cron = CronExpression('30 1 * * *')
+    first = next_fire_time(cron, tz, datetime(2024, 11, 2, 12, 0, tzinfo=tz).timestamp())
+    assert datetime.fromtimestamp(first, timezone.utc) == datetime(2024, 11, 3, 5, 30, tzinfo=timezone.utc)
+    second = next_fire_time(cron, tz, first)
+    assert second - first == 25 * 3600